@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import argparse
+from lsst.sims.movingObjects import Orbits
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a (DES or S3M format) text orbit file "
+                                     "to the binary columnar orbit format.")
+    parser.add_argument("--orbitFile", type=str, default=None,
+                        help="File containing the orbits.")
+    parser.add_argument("--outDir", type=str, default=None,
+                        help="Output directory for the binary orbits. "
+                        "Default is the orbit file name, without its extension.")
+    parser.add_argument("--skiprows", type=int, default=None,
+                        help="Number of rows to skip before the header of the orbit file.")
+    parser.add_argument("--nProcs", type=int, default=1,
+                        help="Number of processes to use to parse the orbit file.")
+    args = parser.parse_args()
+
+    if args.orbitFile is None:
+        print("Must specify orbit file to use.")
+        exit()
+
+    if not os.path.isfile(args.orbitFile):
+        print("Could not find orbit file %s" % (args.orbitFile))
+        exit()
+
+    if args.outDir is None:
+        args.outDir = os.path.splitext(args.orbitFile)[0]
+
+    # Read (and validate, and add SEDs to) the orbits, then write them in binary format.
+    orbits = Orbits()
+    orbits.readOrbits(args.orbitFile, skiprows=args.skiprows, nProcs=args.nProcs)
+    orbits.writeOrbitsBinary(args.outDir)
+    print("Wrote %d %s orbits to %s" % (len(orbits), orbits.format, args.outDir))
@@ -4,9 +4,16 @@ from __future__ import print_function
 import os
 import argparse
 import warnings
+import zipfile
 import numpy as np
+import pandas as pd
 from lsst.sims.movingObjects import Orbits
+from lsst.sims.movingObjects import OrbitFileReader
 from lsst.sims.movingObjects import ChebyFits
+from lsst.sims.movingObjects import ChebyValues
+from lsst.sims.movingObjects import extendCoefficients
+from lsst.sims.movingObjects import PyOrbEphemerides
+from lsst.sims.movingObjects import EphemerisCache
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Generate Chebyshev polynomial coefficients" +
@@ -43,6 +50,24 @@ if __name__ == '__main__':
                         help="Number of coefficients to use for the position polynomials. Default 14.")
     parser.add_argument("--outDir", type=str, default='.',
                         help="Output directory. Default current directory.")
+    parser.add_argument("--extendFrom", type=str, default=None,
+                        help="Existing coefficients file to extend forward in time by tSpan, "
+                        "starting from the end of each object's last segment. "
+                        "New coefficients are appended to this file (tStart and tEnd are ignored). "
+                        "Only text coefficients files can be extended, and nDecimal must match the file.")
+    parser.add_argument("--refitFrom", type=str, default=None,
+                        help="Existing (text) coefficients file, generated from a previous version of "
+                        "orbitFile. "
+                        "Only objects which are new or whose orbits have changed are refit; the remaining "
+                        "coefficients are copied from this file (tStart, tEnd and tSpan are taken from it).")
+    parser.add_argument("--refitHashes", type=str, default=None,
+                        help="Orbit hash file matching refitFrom. "
+                        "Default is refitFrom, with '__coeffs__' replaced by '__hashes__'.")
+    parser.add_argument("--ephCache", type=str, default=None,
+                        help="Directory for an on-disk cache of the ephemerides, which are then reused "
+                        "by reruns (for example, with a different skyTol or nCoeff).")
+    parser.add_argument("--ephCacheSize", type=float, default=10.,
+                        help="Maximum size of the ephemeris cache, in GB. Default 10.")
     args = parser.parse_args()
 
     # Parse orbit file input values.
@@ -54,25 +79,96 @@ if __name__ == '__main__':
         print("Could not find orbit file %s" % (args.orbitFile))
 
     # Check that basic information about tSpan or tEnd is available.
+    if args.refitFrom is not None:
+        chebyValues = ChebyValues()
+        chebyValues.readCoefficients(args.refitFrom)
+        args.tStart = chebyValues.coeffs['tStart'].min()
+        args.tEnd = chebyValues.coeffs['tEnd'].max()
+        args.tSpan = args.tEnd - args.tStart
+    if args.extendFrom is not None and args.tSpan is None:
+        print("Must specify tSpan when extending existing coefficients")
+        exit()
+    if args.extendFrom is not None and zipfile.is_zipfile(args.extendFrom):
+        # The new coefficients are appended as text rows, which would corrupt a compact file.
+        print("Cannot extend compact (binary) coefficients file %s; extend the text coefficients instead"
+              % (args.extendFrom))
+        exit()
     if args.tEnd is None and args.tSpan is None:
         print("Must specify at least one of tSpan or tEnd")
         exit()
 
-    # Read orbits.
-    orbits = Orbits()
-    orbits.readOrbits(args.orbitFile)
-
-    # Pull out only objStart to objEnd, if either of these is specified.
+    # Read orbits: only objStart to objEnd, if either of these is specified.
     if args.objStart is not None or args.objEnd is not None:
+        if os.path.isdir(args.orbitFile):
+            # Binary orbits are memory-mapped, so slicing them is cheap.
+            orbits = Orbits()
+            orbits.readOrbits(args.orbitFile)
+            nOrbits = len(orbits)
+        else:
+            # Only parse the requested rows (the byte-offset index is shared with other workers).
+            reader = OrbitFileReader(args.orbitFile, indexFile=args.orbitFile + '.index.npz')
+            nOrbits = len(reader)
         if args.objStart is None:
             args.objStart = 0
         if args.objEnd is None:
-            args.objEnd = len(orbits) - 1
-        orbits = orbits[args.objStart:args.objEnd + 1]
+            args.objEnd = nOrbits - 1
+        if os.path.isdir(args.orbitFile):
+            orbits = orbits[args.objStart:args.objEnd + 1]
+        else:
+            orbits = reader.readRange(args.objStart, args.objEnd + 1)
         fileSuffix = 'obj%d_%d' % (args.objStart, args.objEnd)
     else:
+        orbits = Orbits()
+        orbits.readOrbits(args.orbitFile)
         fileSuffix = ''
 
+    if not os.path.isdir(args.outDir):
+        os.makedirs(args.outDir)
+    fileRoot = '.'.join(args.orbitFile.split('.')[:-1])
+    fileRoot = os.path.join(args.outDir, fileRoot)
+
+    # Set up the ephemeris generator (shared by all fits).
+    if args.ephCache is not None:
+        cache = EphemerisCache(args.ephCache, maxBytes=int(args.ephCacheSize * 1024**3))
+    else:
+        cache = None
+    ephems = PyOrbEphemerides(cache=cache)
+
+    if args.extendFrom is not None:
+        # Add new segments to the end of the existing coefficients, for each object.
+        chebyValues = ChebyValues()
+        chebyValues.readCoefficients(args.extendFrom)
+        if chebyValues.nDecimal is not None and chebyValues.nDecimal != args.nDecimal:
+            print("nDecimal (%d) must match the nDecimal of %s (%d)"
+                  % (args.nDecimal, args.extendFrom, chebyValues.nDecimal))
+            exit()
+        t = chebyValues.lastSegments(orbits.orbits['objId'].values)['tEnd'].min()
+        timestring = '%.2f_%.2f' % (t, t + args.tSpan)
+        residFile = '__'.join([fileRoot, 'resids', timestring, fileSuffix]).rstrip('_')
+        failedFile = '__'.join([fileRoot, 'failed', timestring, fileSuffix]).rstrip('_')
+        chebs = extendCoefficients(chebyValues, orbits, args.tSpan, skyTolerance=args.skyTol,
+                                   nDecimal=args.nDecimal, nCoeff_position=args.nCoeff,
+                                   ngran=64, nCoeff_vmag=9, nCoeff_delta=5, nCoeff_elongation=6,
+                                   obscode=807, timeScale='TAI', ephemerides=ephems)
+        for cheb in chebs:
+            cheb.write(args.extendFrom, residFile, failedFile, append=True)
+        exit()
+
+    if args.refitFrom is not None:
+        # Find the objects which are new or have changed since the previous coefficients were generated.
+        if args.refitHashes is None:
+            args.refitHashes = args.refitFrom.replace('__coeffs__', '__hashes__')
+        prevHashes = pd.read_table(args.refitHashes, delim_whitespace=True, dtype=str)
+        prevHashes = dict(zip(prevHashes['objId'], prevHashes['orbitHash']))
+        objIds = np.array([str(x) for x in orbits.orbits['objId'].values])
+        hashes = orbits.hashOrbits()
+        refit = np.array([prevHashes.get(objId) != orbitHash for objId, orbitHash in zip(objIds, hashes)],
+                         dtype=bool)
+        keep = set(objIds[~refit])
+        print("Refitting %d of %d objects" % (refit.sum(), len(orbits)))
+    else:
+        refit = None
+
     if args.nObj is None:
         nObj = len(orbits)
     else:
@@ -101,11 +197,6 @@ if __name__ == '__main__':
         # Put this here to make code checker happy (and to guard against deletion of earlier check).
         raise ValueError("Must specify at least one of tSpan or tEnd")
 
-    if not os.path.isdir(args.outDir):
-        os.makedirs(args.outDir)
-
-    fileRoot = '.'.join(args.orbitFile.split('.')[:-1])
-    fileRoot = os.path.join(args.outDir, fileRoot)
     logFile = '__'.join([fileRoot, 'log', '%.2f' % (tStart), fileSuffix]).rstrip('_')
     log = open(logFile, 'w')
 
@@ -116,19 +207,40 @@ if __name__ == '__main__':
         coeffFile = '__'.join([fileRoot, 'coeffs', timestring, fileSuffix]).rstrip('_')
         residFile = '__'.join([fileRoot, 'resids', timestring, fileSuffix]).rstrip('_')
         failedFile = '__'.join([fileRoot, 'failed', timestring, fileSuffix]).rstrip('_')
+        hashFile = '__'.join([fileRoot, 'hashes', timestring, fileSuffix]).rstrip('_')
 
-        # Cycle through nObj at a time, to fit and write data files.
         append = False
-        for n in range(0, len(orbits), nObj):
-            subset = orbits.orbits[n:n + nObj]
+        if refit is not None:
+            # Copy the coefficients, residuals and orbit hashes of the unchanged objects from the
+            # previous files.
+            prevFiles = (args.refitFrom, args.refitFrom.replace('__coeffs__', '__resids__'), args.refitHashes)
+            for prevFile, newFile in zip(prevFiles, (coeffFile, residFile, hashFile)):
+                if not os.path.isfile(prevFile):
+                    continue
+                # Read the previous file entirely first, as it may be overwritten by newFile.
+                with open(prevFile, 'r') as fin:
+                    lines = fin.readlines()
+                with open(newFile, 'w') as fout:
+                    fout.write(lines[0])
+                    for line in lines[1:]:
+                        if line.split(None, 1)[0] in keep:
+                            fout.write(line)
+            append = True
+            fitOrbits = orbits.orbits[refit]
+        else:
+            fitOrbits = orbits.orbits
+
+        # Cycle through nObj at a time, to fit and write data files.
+        for n in range(0, len(fitOrbits), nObj):
+            subset = fitOrbits[n:n + nObj]
             subsetOrbits = Orbits()
-            subsetOrbits.setOrbits(subset)
+            subsetOrbits.setOrbits(subset, validate=False)
             # Fit chebyshev polynomials.
             print("Working on objects %d to %d in timespan %f to %f" % (n, n + nObj, t, t + tSpan), file=log)
             cheb = ChebyFits(subsetOrbits, t, tSpan, skyTolerance=args.skyTol,
                              nDecimal=args.nDecimal, nCoeff_position=args.nCoeff,
                              ngran=64, nCoeff_vmag=9, nCoeff_delta=5, nCoeff_elongation=6,
-                             obscode=807, timeScale='TAI')
+                             obscode=807, timeScale='TAI', ephemerides=ephems)
 
             try:
                 cheb.calcSegmentLength(length=args.length)
@@ -156,8 +268,9 @@ if __name__ == '__main__':
                                                 n, n + nObj, t, t + tSpan, ve.message),
                                              UserWarning, "generateCoefficients.py", 147, file=log)
 
-            # Write out coefficients.
+            # Write out coefficients, and the hashes of the orbits they were generated from.
             cheb.write(coeffFile, residFile, failedFile, append=append)
+            cheb.writeHashes(hashFile, append=append)
             append = True
     print("ALL DONE", file=log)
 
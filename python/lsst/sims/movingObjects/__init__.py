@@ -24,8 +24,14 @@
 
 from .version import *
 from .orbits import *
+from .compactOrbits import *
+from .objIdIndex import *
 from .ephemerides import *
+from .ephemerisCache import *
 from .chebyFits import *
 from .chebyValues import *
 from .chebyshevUtils import *
+from .observatory import *
+from .twoBody import *
+from .orbitalElements import *
 from .linearObs import *
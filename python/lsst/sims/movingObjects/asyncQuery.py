@@ -0,0 +1,269 @@
+"""Non-blocking (asyncio) wrappers around ephemeris generation and Chebyshev ephemeris evaluation.
+
+The calculations run in a bounded pool of worker threads, so they do not block the event loop, and
+concurrent requests for the same times (and options) are coalesced into a single evaluation, whose
+results are then split between the requests.
+This module is not imported by lsst.sims.movingObjects; import it directly, e.g.
+`from lsst.sims.movingObjects.asyncQuery import AsyncChebyValues`.
+"""
+from __future__ import print_function
+import abc
+import asyncio
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+__all__ = ['AsyncEphemerides', 'AsyncChebyValues']
+
+
+def _timesKey(times):
+    """Return the times as an array, together with a hashable key for the time grid."""
+    times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+    return times, (len(times), hashlib.sha1(times.tobytes()).hexdigest())
+
+
+class _CoalescingQuery(abc.ABC):
+    """Run (blocking) evaluations in a thread pool, coalescing concurrent requests with the same key.
+
+    Subclasses must implement _evaluate (the blocking calculation, for the union of the requested objects)
+    and _select (which picks out the objects for a single request from the evaluated results).
+
+    Parameters
+    ----------
+    maxWorkers : int
+        The maximum number of evaluations to run at once.
+    batchDelay : float
+        The time (seconds) to wait for more requests to join a batch, before evaluating it.
+        With the default of 0, requests made at the same point in the event loop
+        (e.g. with asyncio.gather) are coalesced.
+    """
+    def __init__(self, maxWorkers, batchDelay):
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.batchDelay = batchDelay
+        self._pending = {}
+
+    def close(self):
+        """Shut down the worker threads, after any running evaluations finish."""
+        self.executor.shutdown(wait=True)
+
+    async def _query(self, key, args, objIds):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if key not in self._pending:
+            self._pending[key] = []
+            asyncio.ensure_future(self._flush(key, args))
+        self._pending[key].append((objIds, future))
+        return await future
+
+    async def _flush(self, key, args):
+        # Let any other requests for the same key join this batch.
+        await asyncio.sleep(self.batchDelay)
+        requests = self._pending.pop(key)
+        requestIds = [r[0] for r in requests]
+        if any(ids is None for ids in requestIds):
+            batchIds = None
+        else:
+            batchIds = np.unique(np.concatenate([np.atleast_1d(ids) for ids in requestIds]))
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor,
+                                                functools.partial(self._evaluate, args, batchIds))
+        except Exception as e:
+            for ids, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for ids, future in requests:
+            if future.done():
+                # Cancelled.
+                continue
+            try:
+                future.set_result(self._select(result, ids))
+            except Exception as e:
+                future.set_exception(e)
+
+    @abc.abstractmethod
+    def _evaluate(self, args, objIds):
+        """Run the (blocking) calculation for a batch of requests.
+
+        Parameters
+        ----------
+        args : tuple
+            The arguments of the calculation (the same for all requests in the batch).
+        objIds : numpy.ndarray or None
+            The sorted union of the objIds of the requests, or None if any request asked for all objects.
+            Unknown objIds should only fail the requests which asked for them (in _select).
+
+        Returns
+        -------
+        object
+            The result, passed to _select for each request.
+        """
+
+    @abc.abstractmethod
+    def _select(self, result, objIds):
+        """Pick out the result of a single request from the result of its batch.
+
+        Parameters
+        ----------
+        result : object
+            The result of _evaluate for the batch.
+        objIds : numpy.ndarray or None
+            The objIds of this request (None for all objects).
+
+        Returns
+        -------
+        object
+            The result of the request.
+        """
+
+
+class AsyncEphemerides(_CoalescingQuery):
+    """Asyncio wrapper for ephemeris generation (PyOrbEphemerides or another BaseEphemerides backend).
+
+    Ephemerides are generated once per set of (times, timeScale, obscode, columns, dtype), for the union
+    of the objects requested at the same time (using a copy of the backend, see
+    BaseEphemerides.selectOrbits), and each request receives its own objects.
+    OpenOrb calls are serialized within a process, so more than one worker only helps with
+    backends which do not use OpenOrb (or with the ephemeris conversion).
+
+    Parameters
+    ----------
+    ephemerides : BaseEphemerides
+        The ephemeris generator, with the orbits already set (see setOrbits).
+    maxWorkers : int, optional
+        The maximum number of ephemeris calculations to run at once. Default 1.
+    batchDelay : float, optional
+        The time (seconds) to wait for more requests for the same times before generating
+        ephemerides. Default 0.
+    """
+    def __init__(self, ephemerides, maxWorkers=1, batchDelay=0.):
+        super(AsyncEphemerides, self).__init__(maxWorkers, batchDelay)
+        self.ephemerides = ephemerides
+
+    async def generateEphemerides(self, times, objIds=None, timeScale='UTC', obscode=807,
+                                  columns=None, dtype=np.float64):
+        """Calculate ephemerides for objIds at times `times`, without blocking the event loop.
+
+        Parameters
+        ----------
+        times : float or numpy.ndarray
+            Ephemeris times (MJD).
+        objIds : numpy.ndarray, optional
+            The object ids to return. Default None returns all orbits.
+        timeScale : str, optional
+            The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+        obscode : int or str, optional
+            The observatory code. Default 807.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns.
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64.
+
+        Returns
+        -------
+        numpy.recarray
+            The ephemerides, grouped by object ([object][time]), in the order of objIds
+            (or of the orbits, if objIds is None).
+        """
+        times, key = _timesKey(times)
+        colKey = None if columns is None else tuple(columns)
+        key = key + (timeScale, str(obscode), colKey, np.dtype(dtype).str)
+        return await self._query(key, (times, timeScale, obscode, columns, dtype), objIds)
+
+    def _evaluate(self, args, objIds):
+        times, timeScale, obscode, columns, dtype = args
+        if objIds is None:
+            ephemerides = self.ephemerides
+        else:
+            # Unknown objIds fail only the requests which asked for them (in _select).
+            objIds = objIds[self.ephemerides.orbitObj.objIdRows(objIds, strict=False) >= 0]
+            if len(objIds) == 0:
+                return objIds, None
+            ephemerides = self.ephemerides.selectOrbits(objIds)
+        ephs = ephemerides.generateEphemerides(times, timeScale=timeScale, obscode=obscode,
+                                               byObject=True, columns=columns, dtype=dtype)
+        return objIds, ephs
+
+    def _select(self, result, objIds):
+        batchIds, ephs = result
+        if objIds is None:
+            return ephs
+        if batchIds is None:
+            return ephs[self.ephemerides.orbitObj.objIdRows(objIds)]
+        # The evaluated objIds are the sorted, unique (known) requested objects.
+        objIds = np.atleast_1d(np.asarray(objIds))
+        idx = np.clip(np.searchsorted(batchIds, objIds), 0, max(len(batchIds) - 1, 0))
+        if len(batchIds) == 0:
+            found = np.zeros(len(objIds), dtype=bool)
+        else:
+            found = batchIds[idx] == objIds
+        if not found.all():
+            missing = objIds[~found]
+            raise ValueError('Did not find objIds %s in the orbits.'
+                             % (' '.join([str(x) for x in missing[:10]])))
+        return ephs[idx]
+
+
+class AsyncChebyValues(_CoalescingQuery):
+    """Asyncio wrapper for ChebyValues.getEphemerides.
+
+    Concurrent requests at the same times (and extrapolate option) are evaluated together,
+    for the union of the requested objects.
+
+    Parameters
+    ----------
+    chebyValues : ChebyValues
+        The ChebyValues object, with the coefficients already set or read.
+    maxWorkers : int, optional
+        The maximum number of evaluations to run at once. Default 4.
+    batchDelay : float, optional
+        The time (seconds) to wait for more requests for the same times before evaluating.
+        Default 0.
+    """
+    def __init__(self, chebyValues, maxWorkers=4, batchDelay=0.):
+        super(AsyncChebyValues, self).__init__(maxWorkers, batchDelay)
+        self.chebyValues = chebyValues
+
+    async def getEphemerides(self, times, objIds=None, extrapolate=False):
+        """Find the ephemeris information for 'objIds' at 'times', without blocking the event loop.
+
+        Parameters
+        ----------
+        times : float or numpy.ndarray
+            The times to calculate ephemeris positions.
+        objIds : numpy.ndarray, optional
+            The object ids for which to generate ephemerides. If None, then just uses all objects.
+        extrapolate : bool, optional
+            If True, extrapolate beyond ends of segments if time outside of segment range.
+            If False (default), return NaNs if time is beyond range of segments.
+
+        Returns
+        -------
+        dict
+            The ephemeris positions, as for ChebyValues.getEphemerides.
+        """
+        times, key = _timesKey(times)
+        if isinstance(objIds, str) or isinstance(objIds, int):
+            objIds = np.array([objIds])
+        return await self._query(key + (extrapolate,), (times, extrapolate), objIds)
+
+    def _evaluate(self, args, objIds):
+        times, extrapolate = args
+        if objIds is not None:
+            # Unknown objIds fail only the requests which asked for them (in _select).
+            objIds = objIds[self.chebyValues.objIdIndex.contains(objIds)]
+        return self.chebyValues.getEphemerides(times, objIds=objIds, extrapolate=extrapolate)
+
+    def _select(self, result, objIds):
+        if objIds is None:
+            return dict(result)
+        # The evaluated objIds are sorted (either all objects, or the unique requested objects).
+        objIds = np.asarray(objIds)
+        idx = np.clip(np.searchsorted(result['objId'], objIds), 0, max(len(result['objId']) - 1, 0))
+        if len(result['objId']) == 0 or not np.all(result['objId'][idx] == objIds):
+            raise ValueError('Did not find expected match between objIds provided and ephemeride objIds.')
+        ephs = {k: result[k][idx] for k in result if k != 'objId'}
+        ephs['objId'] = objIds
+        return ephs
@@ -2,11 +2,16 @@ from __future__ import print_function, division
 import os
 import warnings
 import numpy as np
-from .chebyshevUtils import chebfit, makeChebMatrix, makeChebMatrixOnlyX
+from .chebyshevUtils import chebfit, makeChebMatrix, makeChebMatrixOnlyX, timeToTicks, ticksToTime
 from .orbits import Orbits
+from .objIdIndex import ObjIdIndex
 from .ephemerides import PyOrbEphemerides
 
-__all__ = ['ChebyFits']
+__all__ = ['ChebyFits', 'extendCoefficients']
+
+# Default maximum errors of the decoded delta (AU), vmag (mag) and elongation (deg) values in compact
+# coefficient files (including the fitted residuals); see ChebyFits.writeCompact.
+COMPACT_TOLERANCES = {'delta': 1e-6, 'vmag': 1e-3, 'elongation': 1e-3}
 
 
 def three_sixty_to_neg(ra):
@@ -25,10 +30,12 @@ class ChebyFits(object):
     typically, the length of each segment is typically about 2 days for MBAs.
     The start and end of each segment must match exactly, and the entire segments must
     fit into the total timespan an integer number of times. This is accomplished by setting nDecimal to
-    the number of decimal places desired in the 'time' value. For faster moving objects, this number needs
-    be greater to allow for smaller subdivisions. It's tempting to allow flexibility to the point of not
-    enforcing this for non-database use; however, then the resulting ephemeris may have multiple values
-    depending on which polynomial segment was used to calculate the ephemeris.
+    the number of decimal places desired in the 'time' value; internally, segment boundaries are tracked
+    as integer 'ticks' of 10**(-nDecimal) days, so that they match exactly.
+    For faster moving objects, this number needs be greater to allow for smaller subdivisions.
+    It's tempting to allow flexibility to the point of not enforcing this for non-database use;
+    however, then the resulting ephemeris may have multiple values depending on which polynomial segment
+    was used to calculate the ephemeris.
     The length of each chebyshev polynomial is related to the number of ephemeris positions used to fit that
     polynomial by ngran:
     length = timestep * ngran
@@ -66,30 +73,39 @@ class ChebyFits(object):
         The number of ephemeris points within each Chebyshev polynomial segment. Default 64.
     ephFile : str, optional
         The path to the JPL ephemeris file to use. Default is '$OORB_DATA/de405.dat'.
+        Not used if ephemerides is provided.
     nDecimal : int, optional
         The number of decimal places to allow in the segment length (and thus the times of the endpoints)
         can be limited to nDecimal places. Default 10.
         For LSST SIMS moving object database, this should be 13 decimal places for NEOs and 0 for all others.
+    ephemerides : BaseEphemerides, optional
+        The ephemeris generator to use. Default None creates a PyOrbEphemerides instance, using ephFile.
+        The orbits of this ephemeris generator are replaced with orbitsObj.
     """
     def __init__(self, orbitsObj, tStart, tSpan, timeScale='TAI',
                  obscode=807, skyTolerance=2.5,
                  nCoeff_position=14, nCoeff_vmag=9, nCoeff_delta=5,
-                 nCoeff_elongation=6, ngran=64, ephFile=None, nDecimal=10):
-        # Set up PyOrbEphemerides.
+                 nCoeff_elongation=6, ngran=64, ephFile=None, nDecimal=10, ephemerides=None):
+        # Set up PyOrbEphemerides (unless another ephemeris generator was provided).
         if ephFile is None:
-            self.ephFile = os.path.join(os.getenv('OORB_DATA'), 'de405.dat')
+            self.ephFile = os.path.join(os.getenv('OORB_DATA', ''), 'de405.dat')
         else:
             self.ephFile = ephFile
-        self.pyephems = PyOrbEphemerides(self.ephFile)
+        if ephemerides is None:
+            ephemerides = PyOrbEphemerides(self.ephFile)
+        self.pyephems = ephemerides
         # And then set orbits.
         self._setOrbits(orbitsObj)
         # Save input parameters.
-        # We have to play some games with the start and end times, using Decimal,
+        # The start and end times are converted to integer ticks of 10**(-nDecimal) days,
         # in order to get the subdivision and times to match exactly, up to nDecimal places.
         self.nDecimal = int(nDecimal)
-        self.tStart = round(tStart, self.nDecimal)
-        self.tSpan = round(tSpan, self.nDecimal)
-        self.tEnd = round(self.tStart + self.tSpan, self.nDecimal)
+        self.tickStart = timeToTicks(tStart, self.nDecimal)
+        self.tickSpan = timeToTicks(tSpan, self.nDecimal)
+        self.tickEnd = self.tickStart + self.tickSpan
+        self.tStart = ticksToTime(self.tickStart, self.nDecimal)
+        self.tSpan = ticksToTime(self.tickSpan, self.nDecimal)
+        self.tEnd = ticksToTime(self.tickEnd, self.nDecimal)
         # print('input times', self.tStart, self.tSpan, self.tEnd, orbitsObj.orbits.objId.as_matrix())
         if timeScale.upper() == 'TAI':
             self.timeScale = 'TAI'
@@ -128,6 +144,8 @@ class ChebyFits(object):
             raise ValueError('Need to provide an Orbits object.')
         self.orbitsObj = orbitsObj
         self.pyephems.setOrbits(self.orbitsObj)
+        # The catalog-level objId dictionary (reused by ChebyValues.setCoefficients).
+        self.objIdIndex = ObjIdIndex(self.orbitsObj.orbits['objId'].values)
 
     def _precomputeMultipliers(self):
         """Calculate multipliers for Chebyshev fitting.
@@ -158,26 +176,46 @@ class ChebyFits(object):
         """
         return length / self.ngran
 
+    def _segmentBoundaries(self):
+        """Calculate the boundaries of all segments between tStart and tEnd, in ticks.
+
+        The segments are as close as possible to self.length; if self.length fits into the timespan
+        an integer number of times (as set by calcSegmentLength) the segments are all the same length,
+        otherwise their lengths differ by at most one tick.
+
+        Returns
+        -------
+        list of int
+            The segment boundaries, in ticks (nSegments + 1 values, from tickStart to tickEnd).
+        """
+        try:
+            self.length
+        except AttributeError:
+            raise AttributeError('Need to set self.length first, using calcSegmentLength.')
+        lengthTicks = max(timeToTicks(self.length, self.nDecimal), 1)
+        nSegments = max(int(round(self.tickSpan / lengthTicks)), 1)
+        # Use python integers, as i * tickSpan can exceed the range of int64.
+        return [self.tickStart + (i * self.tickSpan) // nSegments for i in range(nSegments + 1)]
+
     def makeAllTimes(self):
         """Using tStart and tEnd, generate a numpy array containing times spaced at
         timestep = self.length/self.ngran.
         The expected use for this time array would be to generate ephemerides at each timestep.
+        Every ngran'th time is (exactly) a segment boundary.
 
         Returns
         -------
         numpy.ndarray
             Numpy array of times.
         """
-        try:
-            self.length
-        except AttributeError:
-            raise AttributeError('Need to set self.timestep first, using calcSegmentLength.')
-        timestep = self._lengthToTimestep(self.length)
-        times = np.arange(self.tStart, self.tEnd + timestep / 2, timestep)
+        bounds = ticksToTime(np.array(self._segmentBoundaries(), dtype=np.int64), self.nDecimal)
+        steps = np.arange(0, self.ngran) / float(self.ngran)
+        times = bounds[:-1, np.newaxis] + (bounds[1:] - bounds[:-1])[:, np.newaxis] * steps
+        times = np.concatenate([times.ravel(), bounds[-1:]])
         return times
 
     def generateEphemerides(self, times, byObject=True, verbose=False):
-        """Generate ephemerides using OpenOrb for all orbits.
+        """Generate ephemerides for all orbits, using the ephemeris generator (by default, OpenOrb).
 
         Parameters
         ----------
@@ -192,6 +230,10 @@ class ChebyFits(object):
         """Modify length, to fit in an 'integer multiple' within the tStart/tEnd,
         and to have the desired number of decimal values.
 
+        The search is done in integer ticks, looking for the nearest (shorter) length which divides
+        the timespan exactly. If there is no such length within a factor of two of the input length,
+        the timespan is divided as evenly as possible (see _segmentBoundaries).
+
         Parameters
         ----------
         length : float
@@ -202,27 +244,20 @@ class ChebyFits(object):
         float
             The rounded length value.
         """
-        length = round(length, self.nDecimal)
-        length_in = length
-        # Make length an integer value within the time interval, to last decimal place accuracy.
-        counter = 0
-        prev_int_factor = 0
-        numTolerance = 10. ** (-1 * self.nDecimal)
-        while ((self.tSpan % length) > numTolerance) and (length > 0) and (counter < 20):
-            int_factor = int(self.tSpan / length) + 1  # round up / ceiling
-            if int_factor == prev_int_factor:
-                int_factor = prev_int_factor + 1
-            prev_int_factor = int_factor
-            length = round(self.tSpan / int_factor, self.nDecimal)
-            counter += 1
-        if (self.tSpan % length) > numTolerance or (length <= 0):
+        lengthTicks = timeToTicks(length, self.nDecimal)
+        if lengthTicks <= 0 or self.tickSpan <= 0:
             # Add this entire segment into the failed list.
             for objId in self.orbitsObj.orbits['objId'].as_matrix():
                 self.failed.append((objId, self.tStart, self.tEnd))
             raise ValueError('Could not find a suitable length for the timespan (start %f, span %f), '
-                             'starting with length %s, ending with length value %f'
-                             % (self.tStart, self.tSpan, str(length_in), length))
-        return length
+                             'starting with length %s (%d decimal places)'
+                             % (self.tStart, self.tSpan, str(length), self.nDecimal))
+        # Number of segments, rounding up.
+        nSegments = -(-self.tickSpan // lengthTicks)
+        for n in range(nSegments, min(2 * nSegments, nSegments + 10000, self.tickSpan) + 1):
+            if self.tickSpan % n == 0:
+                return ticksToTime(self.tickSpan // n, self.nDecimal)
+        return ticksToTime(self.tickSpan // nSegments, self.nDecimal)
 
     def _testResiduals(self, length, cutoff=99):
         """Calculate the position residual, for a test case.
@@ -244,7 +279,7 @@ class ChebyFits(object):
         ratio = pos_resid / self.skyTolerance
         return pos_resid, ratio
 
-    def calcSegmentLength(self, length=None):
+    def calcSegmentLength(self, length=None, initialLength=None):
         """Set the typical initial ephemeris timestep and segment length for all objects between tStart/tEnd.
 
         Sets self.length.
@@ -256,6 +291,9 @@ class ChebyFits(object):
         ----------
         length : float, optional
             If specified, this value for the length is used, instead of calculating it here.
+        initialLength : float, optional
+            If specified, this value is used as the starting guess for the length (instead of a guess
+            based on skyTolerance), and is then reduced until the residuals are within skyTolerance.
         """
         # If length is specified, use it and do nothing else.
         if length is not None:
@@ -277,7 +315,10 @@ class ChebyFits(object):
         # Make an arbitrary cap on segment length at 60 days, (25000 mas) ~.5 arcminute accuracy.
         maxLength = 60
         maxIterations = 50
-        if self.skyTolerance < 5:
+        if initialLength is not None:
+            # Typically the length used for the previous segments of these objects.
+            length = initialLength
+        elif self.skyTolerance < 5:
             # This is the cap of the low-linearity regime, looping below will refine this value.
             length = 2.0
         elif self.skyTolerance >= 5000:
@@ -378,18 +419,12 @@ class ChebyFits(object):
         # For some objects, we will end up recalculating the ephemeride values, but most should be fine.
         times = self.makeAllTimes()
         ephs = self.generateEphemerides(times)
-        eps = self._lengthToTimestep(self.length)/4.0
+        nSegments = (len(times) - 1) // self.ngran
         # Loop through each object to generate coefficients.
         for orbitObj, e in zip(self.orbitsObj, ephs):
-            tSegmentStart = self.tStart
-            # Cycle through all segments until we reach the end of the period we're fitting.
-            while tSegmentStart < (self.tEnd - eps):
-                # Identify the subset of times and ephemerides which are relevant for this segment
-                # (at the default segment size).
-                tSegmentEnd = round(tSegmentStart + self.length, self.nDecimal)
-                subset = np.where((times >= tSegmentStart) & (times < tSegmentEnd + eps))
-                self.calcOneSegment(orbitObj, e[subset])
-                tSegmentStart = tSegmentEnd
+            # Cycle through all segments; the segment boundaries are every ngran'th time.
+            for i in range(nSegments):
+                self.calcOneSegment(orbitObj, e[i * self.ngran: (i + 1) * self.ngran + 1])
 
     def calcOneSegment(self, orbitObj, ephs):
         """Calculate the coefficients for a single Chebyshev segment, for a single object.
@@ -421,7 +456,7 @@ class ChebyFits(object):
             if fitFailed:
                 warnings.warn('Fit failed for orbitObj %d for times between %f and %f'
                               % (objId, tSegmentStart, tSegmentEnd))
-                self.failed.append((orbitObj.orbits['objId'], tSegmentStart, tSegmentEnd))
+                self.failed.append((objId, tSegmentStart, tSegmentEnd))
             else:
                 # Consolidate items into the tracked coefficient values.
                 self.coeffs['objId'].append(objId)
@@ -438,7 +473,7 @@ class ChebyFits(object):
                 self.resids['tEnd'].append(tSegmentEnd)
                 self.resids['pos'].append(max_pos_resid)
                 self.resids['delta'].append(max_resids['delta'])
-                self.resids['vmag'].append(max_resids['delta'])
+                self.resids['vmag'].append(max_resids['vmag'])
                 self.resids['elongation'].append(max_resids['elongation'])
 
     def _subdivideSegment(self, orbitObj, ephs):
@@ -451,7 +486,10 @@ class ChebyFits(object):
         ephs : numpy.ndarray
             The ephemerides we're fitting at the moment (for the single object / single segment).
         """
-        newCheby = ChebyFits(orbitObj, ephs['time'][0], (ephs['time'][-1] - ephs['time'][0]),
+        # Calculate the span in ticks, so that the subdivided segments end exactly where this one did.
+        tickSpan = (timeToTicks(ephs['time'][-1], self.nDecimal) -
+                    timeToTicks(ephs['time'][0], self.nDecimal))
+        newCheby = ChebyFits(orbitObj, ephs['time'][0], ticksToTime(tickSpan, self.nDecimal),
                              timeScale=self.timeScale, obscode=self.obscode,
                              skyTolerance=self.skyTolerance,
                              nCoeff_position=self.nCoeff['position'],
@@ -459,18 +497,21 @@ class ChebyFits(object):
                              nCoeff_delta=self.nCoeff['delta'],
                              nCoeff_elongation=self.nCoeff['elongation'],
                              ngran=self.ngran, ephFile=self.ephFile,
-                             nDecimal=self.nDecimal)
+                             nDecimal=self.nDecimal, ephemerides=self.pyephems)
         try:
             newCheby.calcSegmentLength()
         except ValueError as ve:
             # Could not find a good segment length.
             warningmessage = 'Objid %s, segment %f to %f ' % (orbitObj.orbits.objId.iloc[0],
                                                               ephs['time'][0], ephs['time'][-1])
-            warningmessage += ' - error: %s' % (ve.message)
+            warningmessage += ' - error: %s' % (ve)
             warnings.warn(warningmessage)
             self.failed += newCheby.failed
+            self.pyephems.setOrbits(self.orbitsObj)
             return
         newCheby.calcSegments()
+        # The ephemeris generator is shared with newCheby, so restore our own orbits.
+        self.pyephems.setOrbits(self.orbitsObj)
         # Add subdivided segment values into tracked values here.
         for k in self.coeffs:
             self.coeffs[k] += newCheby.coeffs[k]
@@ -493,7 +534,7 @@ class ChebyFits(object):
             Flag to append (or overwrite) the output files.
         """
         if append:
-            openMode = 'aw'
+            openMode = 'a'
         else:
             openMode = 'w'
         # Write a header to the coefficients file, if writing to a new file:
@@ -544,3 +585,199 @@ class ChebyFits(object):
             with open(failedFile, openMode) as f:
                 for i, failed in enumerate(self.failed):
                     print(' '.join([str(x) for x in failed]), file=f)
+
+    def writeHashes(self, hashFile, append=False):
+        """Write the content hash of each orbit (see Orbits.hashOrbits) to disk.
+
+        These identify the orbits used to generate the coefficients, so that only
+        orbits which have changed need to be refit when the orbit catalog is updated.
+        Objects with any failed fits (see self.failed) are not written, so they are refit next time.
+
+        Parameters
+        ----------
+        hashFile : str
+            The filename for the orbit hash values.
+        append : bool, optional
+            Flag to append (or overwrite) the output file.
+        """
+        if append:
+            openMode = 'a'
+        else:
+            openMode = 'w'
+        writeHeader = (not append) or (not os.path.isfile(hashFile))
+        with open(hashFile, openMode) as f:
+            if writeHeader:
+                print('objId orbitHash', file=f)
+            failedIds = set(str(failed[0]) for failed in self.failed)
+            for objId, orbitHash in zip(self.orbitsObj.orbits['objId'].values, self.orbitsObj.hashOrbits()):
+                if str(objId) not in failedIds:
+                    print('%s %s' % (objId, orbitHash), file=f)
+
+    def _quantizeCoeffs(self, key, precision, tolerance):
+        """Encode the coefficients for one of the secondary quantities (delta/vmag/elongation).
+
+        With precision 'int16', the first (mean) coefficient of each segment is kept as float32 and the
+        remaining coefficients are stored as int16 values scaled by a per-segment float32 factor.
+        The error introduced by this encoding is at most the sum of the errors of the coefficients
+        (as |T_n| <= 1). An encoding is only used if this fits within the error budget left by the fit
+        (tolerance - fitted residual) in every segment: int16 if requested, otherwise float32,
+        otherwise float64.
+
+        Parameters
+        ----------
+        key : str
+            One of 'delta', 'vmag' or 'elongation'.
+        precision : {'float32', 'int16'}
+            The requested storage precision.
+        tolerance : float
+            The maximum error of the decoded values, including the fitted residual.
+
+        Returns
+        -------
+        dict
+            Dictionary of arrays to store for this quantity.
+        """
+        coeffs = np.array(self.coeffs[key], dtype=float).reshape(-1, self.nCoeff[key])
+        budget = tolerance - np.array(self.resids[key], dtype=float)
+        if precision == 'int16':
+            scale = np.abs(coeffs[:, 1:]).max(axis=1) / 32767.0
+            scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+            quantized = np.round(coeffs[:, 1:] / scale[:, np.newaxis])
+            quantized = np.clip(quantized, -32767, 32767).astype(np.int16)
+            decoded = quantized * scale.astype(float)[:, np.newaxis]
+            maxError = np.abs(coeffs[:, 1:] - decoded).sum(axis=1)
+            maxError += np.abs(coeffs[:, 0] - coeffs[:, 0].astype(np.float32))
+            if np.all(maxError <= budget):
+                return {key + '_0': coeffs[:, 0].astype(np.float32),
+                        key + '_scale': scale,
+                        key: quantized}
+        maxError = np.abs(coeffs - coeffs.astype(np.float32)).sum(axis=1)
+        if np.all(maxError <= budget):
+            return {key: coeffs.astype(np.float32)}
+        return {key: coeffs}
+
+    def _compactPositionCoeffs(self, key):
+        """Encode the RA or Dec coefficients, as the mean value plus offsets from the mean.
+
+        The first coefficient of each segment (the mean RA/Dec over the segment) is kept as float64,
+        and the remaining coefficients (the offsets from the mean, which are much smaller) are stored as
+        float32, if the error this introduces (at most the sum of the rounding errors of the coefficients,
+        as |T_n| <= 1) fits within the error budget left by the fit (skyTolerance - fitted position
+        residual) in every segment. Otherwise all coefficients are stored as float64.
+
+        Parameters
+        ----------
+        key : str
+            Either 'ra' or 'dec'.
+
+        Returns
+        -------
+        dict
+            Dictionary of arrays to store for this quantity.
+        """
+        coeffs = np.array(self.coeffs[key], dtype=float).reshape(-1, self.nCoeff['position'])
+        offsets = coeffs[:, 1:].astype(np.float32)
+        # Rounding error in degrees, converted to mas to compare with the position budget.
+        maxError = np.abs(coeffs[:, 1:] - offsets).sum(axis=1) * 3600.0 * 1000.0
+        if np.all(maxError <= self.skyTolerance - np.array(self.resids['pos'], dtype=float)):
+            return {key + '_0': coeffs[:, 0], key: offsets}
+        return {key: coeffs}
+
+    def writeCompact(self, coeffFile, precision='float32', compress=True, tolerances=None):
+        """Write coefficients to disk in a compact binary (numpy .npz) format.
+
+        For RA and Dec, the first coefficient of each segment (the mean RA/Dec of the segment) is stored
+        as float64 and the remaining coefficients (offsets from that mean) as float32, when the decoded
+        positions stay within skyTolerance (see _compactPositionCoeffs).
+        Delta, vmag and elongation are stored as float32 or as scaled int16 values, when the decoded
+        values stay within their tolerances (see _quantizeCoeffs).
+        The result can be read with ChebyValues.readCoefficients.
+
+        Parameters
+        ----------
+        coeffFile : str
+            The filename for the coefficient values.
+        precision : {'float32', 'int16'}, optional
+            The storage precision for delta/vmag/elongation coefficients. Default 'float32'.
+        compress : bool, optional
+            If True (default), each array is compressed (zlib) within the output file.
+        tolerances : dict, optional
+            The maximum errors of the decoded 'delta' (AU), 'vmag' (mag) and 'elongation' (deg) values,
+            including the fitted residuals. Default None uses COMPACT_TOLERANCES; missing keys are
+            also taken from COMPACT_TOLERANCES.
+        """
+        if precision not in ('float32', 'int16'):
+            raise ValueError('Do not understand precision %s; use float32 or int16.' % (precision))
+        arrays = {}
+        arrays['formatVersion'] = np.array(1)
+        arrays['nDecimal'] = np.array(self.nDecimal)
+        arrays['objId'] = np.array(self.coeffs['objId'])
+        arrays['tStart'] = np.array(self.coeffs['tStart'], dtype=float)
+        arrays['tEnd'] = np.array(self.coeffs['tEnd'], dtype=float)
+        for key in ('ra', 'dec'):
+            arrays.update(self._compactPositionCoeffs(key))
+        tols = dict(COMPACT_TOLERANCES)
+        if tolerances is not None:
+            tols.update(tolerances)
+        for key in ('delta', 'vmag', 'elongation'):
+            arrays.update(self._quantizeCoeffs(key, precision, tols[key]))
+        # Write through a file handle, so numpy does not add a '.npz' suffix to the filename.
+        with open(coeffFile, 'wb') as f:
+            if compress:
+                np.savez_compressed(f, **arrays)
+            else:
+                np.savez(f, **arrays)
+
+
+def extendCoefficients(chebyValues, orbitsObj, tSpan, **kwargs):
+    """Fit new segments for 'orbitsObj', continuing forward from the end of the existing coefficients.
+
+    For each object, the new segments start at the tEnd of the last existing segment in chebyValues,
+    and the length of that last segment is used as the initial guess for the new segment length.
+    Objects are grouped by their last tEnd and segment length, and fit together (one ChebyFits per group).
+    The new coefficients are added to chebyValues (see ChebyValues.appendCoefficients).
+
+    Parameters
+    ----------
+    chebyValues : ChebyValues
+        The existing coefficients. All objects in orbitsObj must be present.
+    orbitsObj : Orbits
+        The orbits for which to fit chebyshev polynomial coefficients.
+    tSpan : float
+        The time span (starting at the end of the existing coefficients) over which to fit coefficients.
+    **kwargs
+        Additional keyword arguments passed to ChebyFits (e.g. timeScale, skyTolerance, nDecimal).
+        nDecimal defaults to (and must match) the nDecimal of chebyValues, so that the new segment
+        boundaries fall on the same time grid as the existing segments.
+
+    Returns
+    -------
+    list of ChebyFits
+        The ChebyFits objects used to fit each group of objects (e.g. to write the new coefficients
+        or failed fits to disk).
+    """
+    if chebyValues.nDecimal is not None:
+        nDecimal = kwargs.setdefault('nDecimal', chebyValues.nDecimal)
+        if nDecimal != chebyValues.nDecimal:
+            raise ValueError('nDecimal (%d) does not match the nDecimal of the existing coefficients (%d).'
+                             % (nDecimal, chebyValues.nDecimal))
+    objIds = orbitsObj.orbits['objId'].values
+    last = chebyValues.lastSegments(objIds)
+    groups, groupIdx = np.unique(np.column_stack([last['tEnd'], last['length']]), axis=0,
+                                 return_inverse=True)
+    chebs = []
+    for i, (tEnd, length) in enumerate(groups):
+        subsetOrbits = Orbits()
+        subsetOrbits.setOrbits(orbitsObj.orbits[groupIdx == i], validate=False)
+        cheb = ChebyFits(subsetOrbits, tEnd, tSpan, **kwargs)
+        chebs.append(cheb)
+        try:
+            cheb.calcSegmentLength(initialLength=length)
+        except ValueError as ve:
+            warnings.warn('Objid %s to %s, segment %f to %f - error: %s'
+                          % (objIds[groupIdx == i][0], objIds[groupIdx == i][-1], cheb.tStart,
+                             cheb.tEnd, ve))
+            continue
+        cheb.calcSegments()
+        chebyValues.appendCoefficients(cheb)
+    return chebs
@@ -1,7 +1,10 @@
 import os
+import copy
+import zipfile
 import numpy as np
 import pandas as pd
-from .chebyshevUtils import chebeval
+from .chebyshevUtils import chebeval, timeToTicks
+from .objIdIndex import ObjIdIndex
 
 __all__ = ['ChebyValues']
 
@@ -9,11 +12,17 @@ __all__ = ['ChebyValues']
 class ChebyValues(object):
     """Calculates positions, velocities, deltas, vmags and elongations,
     given a series of coefficients generated by ChebyFits.
+
+    Internally, objects are identified by their dense index in self.objIdIndex (self.coeffs['objIdx']
+    holds the index of the object of each segment); the objIds are only used for input and output.
     """
     def __init__(self):
         self.coeffs = {}
         self.coeffKeys = ['objId', 'tStart', 'tEnd', 'ra', 'dec', 'delta', 'vmag', 'elongation']
         self.ephemerisKeys = ['ra', 'dradt', 'dec', 'ddecdt', 'delta', 'vmag', 'elongation']
+        self.nDecimal = None
+        self.segments = None
+        self.objIdIndex = ObjIdIndex()
 
     def setCoefficients(self, chebyFits):
         """Set coefficients using a ChebyFits object.
@@ -34,10 +43,16 @@ class ChebyValues(object):
             raise ValueError("Expected to find key(s) %s in coefficients." %  ' '.join(list[missing_keys]))
         self.coeffs['meanRA'] = self.coeffs['ra'].swapaxes(0, 1)[0]
         self.coeffs['meanDec'] = self.coeffs['dec'].swapaxes(0, 1)[0]
+        self.nDecimal = chebyFits.nDecimal
+        self._encodeObjIds(getattr(chebyFits, 'objIdIndex', None))
+        self._indexSegments()
 
     def readCoefficients(self, chebyFitsFile):
         """Read coefficients from output file written by ChebyFits.
 
+        Reads either the text output of ChebyFits.write or the compact binary output
+        of ChebyFits.writeCompact (recognized automatically).
+
         Parameters
         ----------
         chebyFitsFile : str
@@ -45,6 +60,11 @@ class ChebyValues(object):
         """
         if not os.path.isfile(chebyFitsFile):
             raise IOError('Could not find chebyFitsFile at %s' % (chebyFitsFile))
+        if zipfile.is_zipfile(chebyFitsFile):
+            self._readCompactCoefficients(chebyFitsFile)
+            self._encodeObjIds()
+            self._indexSegments()
+            return
         # Read the coefficients file.
         coeffs = pd.read_table(chebyFitsFile, delim_whitespace=True)
         # The header line provides information on the number of coefficients for each parameter.
@@ -68,56 +88,315 @@ class ChebyValues(object):
         # Swap the coefficient axes so that they are [segment, coeff].
         for k in coeff_cols:
             self.coeffs[k] = self.coeffs[k].swapaxes(0, 1)
+        self.nDecimal = self._readNDecimal(chebyFitsFile)
+        self._encodeObjIds()
+        self._indexSegments()
+
+    def _readNDecimal(self, chebyFitsFile):
+        """Find the number of decimal places used for the segment times in a coefficients file.
+
+        ChebyFits.write prints tStart/tEnd with exactly nDecimal decimal places,
+        so this can be recovered from the first line of coefficients.
+
+        Parameters
+        ----------
+        chebyFitsFile : str
+            The filename of the coefficients file.
+
+        Returns
+        -------
+        int
+            The number of decimal places.
+        """
+        with open(chebyFitsFile, 'r') as f:
+            header = f.readline().split()
+            values = f.readline().split()
+        if len(values) == 0:
+            return 0
+        tStart = values[header.index('tStart')]
+        if '.' not in tStart:
+            return 0
+        return len(tStart.split('.')[1])
+
+    def _readCompactCoefficients(self, chebyFitsFile):
+        """Read and decode coefficients from the compact binary file written by ChebyFits.writeCompact.
+
+        Parameters
+        ----------
+        chebyFitsFile : str
+            The filename of the compact coefficients file.
+        """
+        with np.load(chebyFitsFile, allow_pickle=False) as data:
+            self.coeffs['objId'] = data['objId']
+            self.coeffs['tStart'] = data['tStart']
+            self.coeffs['tEnd'] = data['tEnd']
+            for k in ('ra', 'dec'):
+                if k + '_0' in data.files:
+                    # Add back the mean value coefficient to the (float32) offsets.
+                    self.coeffs[k] = np.hstack([data[k + '_0'][:, np.newaxis], data[k].astype(float)])
+                else:
+                    self.coeffs[k] = data[k]
+            for k in ('delta', 'vmag', 'elongation'):
+                if data[k].dtype == np.int16:
+                    # Undo the int16 scaling, and add back the mean value coefficient.
+                    quantized = data[k].astype(float) * data[k + '_scale'].astype(float)[:, np.newaxis]
+                    self.coeffs[k] = np.hstack([data[k + '_0'].astype(float)[:, np.newaxis], quantized])
+                else:
+                    self.coeffs[k] = data[k].astype(float)
+            self.nDecimal = int(data['nDecimal'])
+        self.coeffs['meanRA'] = self.coeffs['ra'][:, 0]
+        self.coeffs['meanDec'] = self.coeffs['dec'][:, 0]
+
+    def lastSegments(self, objIds=None):
+        """Find the last segment of each object.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray, optional
+            The object ids for which to find the last segment. If None, uses all objects.
+
+        Returns
+        -------
+        dict
+            Dictionary of numpy arrays 'objId', 'tEnd' (the end of the last segment) and
+            'length' (the length of the last segment), in the order of objIds
+            (sorted by objId if objIds is None).
+        """
+        if objIds is None:
+            objIdx = self.objIdIndex.sortedIndexes()
+        else:
+            objIdx = self._objIndex(objIds)
+        rows = self.segments['order'][self.segments['first'][objIdx] + self.segments['count'][objIdx] - 1]
+        last = {}
+        last['objId'] = self.segments['objId'][objIdx]
+        last['tEnd'] = self.coeffs['tEnd'][rows]
+        last['length'] = self.coeffs['tEnd'][rows] - self.coeffs['tStart'][rows]
+        return last
+
+    def appendCoefficients(self, chebyFits):
+        """Add the coefficients from a ChebyFits object to the existing coefficients.
+
+        This allows an existing set of coefficients to be extended forward in time (see
+        extendCoefficients). Segments which duplicate or overlap existing segments (or each other)
+        for the same object are rejected with a ValueError, and no coefficients are added.
+
+        Parameters
+        ----------
+        chebyFits : chebyFits
+            ChebyFits object, with attribute 'coeffs' - a dictionary of lists of coefficients.
+        """
+        if len(self.coeffs) == 0:
+            self.setCoefficients(chebyFits)
+            return
+        newCoeffs = {}
+        for k in self.coeffKeys:
+            newCoeffs[k] = np.array(chebyFits.coeffs[k])
+        if len(newCoeffs['objId']) == 0:
+            return
+        for k in ('ra', 'dec', 'delta', 'vmag', 'elongation'):
+            if newCoeffs[k].shape[1] != self.coeffs[k].shape[1]:
+                raise ValueError('Number of coefficients for %s (%d) does not match existing '
+                                 'coefficients (%d).' % (k, newCoeffs[k].shape[1], self.coeffs[k].shape[1]))
+        # Compare the segment times on the finer of the two time grids.
+        nDecimal = max(self.nDecimal, chebyFits.nDecimal)
+        # Add any new objects to a copy of the objId dictionary, so nothing changes if we fail.
+        objIdIndex = copy.copy(self.objIdIndex)
+        objIdx = np.concatenate([self.coeffs['objIdx'], objIdIndex.add(newCoeffs['objId'])])
+        tickStart = timeToTicks(np.concatenate([self.coeffs['tStart'], newCoeffs['tStart']]), nDecimal)
+        tickEnd = timeToTicks(np.concatenate([self.coeffs['tEnd'], newCoeffs['tEnd']]), nDecimal)
+        order = np.lexsort((tickStart, objIdx))
+        sameObj = objIdx[order][1:] == objIdx[order][:-1]
+        overlap = sameObj & (tickStart[order][1:] < tickEnd[order][:-1])
+        if np.any(overlap) or np.any(tickEnd <= tickStart):
+            badIdx = np.unique(np.concatenate([objIdx[order][1:][overlap], objIdx[tickEnd <= tickStart]]))
+            badIds = objIdIndex.decode(badIdx)
+            raise ValueError('New segments duplicate or overlap existing segments for objIds %s'
+                             % (' '.join([str(x) for x in badIds])))
+        for k in self.coeffKeys:
+            self.coeffs[k] = np.concatenate([self.coeffs[k], newCoeffs[k]])
+        self.coeffs['objIdx'] = objIdx
+        self.objIdIndex = objIdIndex
+        self.coeffs['meanRA'] = self.coeffs['ra'].swapaxes(0, 1)[0]
+        self.coeffs['meanDec'] = self.coeffs['dec'].swapaxes(0, 1)[0]
+        self.nDecimal = nDecimal
+        self._indexSegments()
+
+    def _encodeObjIds(self, objIdIndex=None):
+        """Set the objId dictionary (self.objIdIndex) and the dense object index of each segment
+        (self.coeffs['objIdx']).
+
+        Parameters
+        ----------
+        objIdIndex : ObjIdIndex, optional
+            An existing dictionary containing (at least) all of the objIds in self.coeffs, such as
+            the catalog-level dictionary of a ChebyFits object. Default None builds a new dictionary.
+        """
+        if objIdIndex is None:
+            self.objIdIndex = ObjIdIndex()
+            self.coeffs['objIdx'] = self.objIdIndex.add(self.coeffs['objId'])
+            return
+        objIdx = objIdIndex.encode(self.coeffs['objId'])
+        used = np.unique(objIdx)
+        if len(used) == len(objIdIndex):
+            self.objIdIndex = objIdIndex
+            self.coeffs['objIdx'] = objIdx
+            return
+        # Only keep the objects which have coefficients (e.g. not those where all fits failed).
+        self.objIdIndex = ObjIdIndex(objIdIndex.decode(used))
+        remap = np.zeros(len(objIdIndex), dtype=np.int32)
+        remap[used] = self.objIdIndex.encode(objIdIndex.decode(used))
+        self.coeffs['objIdx'] = remap[objIdx]
 
-    def _evalSegment(self, segmentIdx, times, subsetSegments=None, mask=True):
-        """Evaluate the ra/dec/delta/vmag/elongation values for a given segment at a series of times.
+    def _objIndex(self, objIds):
+        """Find the (dense) indexes of objIds in self.objIdIndex (and so in self.segments).
 
         Parameters
         ----------
-        segmentIdx : int
-            The index in (each of) self.coeffs for the segment.
-            e.g. the first segment, for each object.
-        times : np.ndarray
-            The times at which to evaluate the segment.
-        subsetSegments : numpy.ndarray, optional
-            Optionally specify a subset of the total segment indexes.
-            This lets you pick out particular objIds.
-        mask : bool, optional
-            If True, returns NaNs for values outside the range of times in the segment.
-            If False, extrapolates segment for times outside the segment time range.
+        objIds : numpy.ndarray
+            The object ids.
+
+        Returns
+        -------
+        numpy.ndarray
+            The indexes of the objects.
+        """
+        objIdx = self.objIdIndex.encode(objIds, strict=False)
+        if np.any(objIdx < 0):
+            raise ValueError('Did not find expected match between objIds provided and ephemeride objIds.')
+        return objIdx
+
+    def _indexSegments(self):
+        """Build an index of the segments belonging to each object, to allow fast segment lookup.
+
+        The segment start/end times are converted to integer ticks of 10**(-nDecimal) days.
+        For objects where all segments have the same length and follow each other without gaps,
+        the segment containing a given time can then be found directly with integer arithmetic;
+        otherwise a (single, vectorized) binary search over the segment keys is used.
+
+        Sets self.segments, a dictionary containing (per object, in the order of the dense object indexes
+        of self.objIdIndex): 'objId', 'first' (the position of the first segment in 'order', which sorts
+        all segments by object index then tStart), 'count',
+        'tick0' (start of the first segment), and 'length' (the segment length in ticks, or 0 if the
+        segments are not uniform). It also contains 'startTicks' (the sorted unique segment start ticks)
+        and 'keys' (for each segment in 'order', object index * (len(startTicks) + 1) + the rank of its
+        start tick + 1), so that the segments of all objects can be searched at once.
+        """
+        if self.nDecimal is None:
+            raise ValueError('Need to know nDecimal to index the segments.')
+        tickStart = timeToTicks(self.coeffs['tStart'], self.nDecimal)
+        tickEnd = timeToTicks(self.coeffs['tEnd'], self.nDecimal)
+        objIds = self.objIdIndex.objIds
+        objIndex = self.coeffs['objIdx']
+        order = np.lexsort((tickStart, objIndex))
+        sortedIndex = objIndex[order]
+        first = np.searchsorted(sortedIndex, np.arange(len(objIds)))
+        count = np.bincount(objIndex, minlength=len(objIds))
+        lengths = (tickEnd - tickStart)[order]
+        # Gaps between subsequent segments of the same object (the first segment has no gap).
+        gaps = np.zeros(len(order), dtype=np.int64)
+        gaps[1:] = tickStart[order][1:] - tickEnd[order][:-1]
+        gaps[first] = 0
+        uniform = ((np.minimum.reduceat(lengths, first) == np.maximum.reduceat(lengths, first)) &
+                   ~np.logical_or.reduceat(gaps != 0, first))
+        # Offset the (ranked, to avoid overflow) start ticks of each object by its object index.
+        startTicks, rank = np.unique(tickStart, return_inverse=True)
+        keys = sortedIndex * np.int64(len(startTicks) + 1) + rank.ravel()[order] + 1
+        self.segments = {'objId': objIds,
+                         'order': order,
+                         'startTicks': startTicks,
+                         'keys': keys,
+                         'first': first,
+                         'count': count,
+                         'tick0': tickStart[order][first],
+                         'length': np.where(uniform, lengths[first], 0)}
+
+    def _findSegments(self, objIdx, time, extrapolate=False):
+        """Find the segments which contain 'time', for each object in objIdx.
+
+        Parameters
+        ----------
+        objIdx : numpy.ndarray
+            The indexes of the objects (into self.segments['objId']).
+        time : float
+            The time (MJD) at which to find the segments.
+        extrapolate : bool, optional
+            If True, use the first or last segment for times outside the range of an object's segments.
+            If False (default), no segment is returned for these objects.
+
+        Returns
+        -------
+        numpy.ndarray
+            The index (into self.coeffs) of the segment for each object, or -1 if there is no segment.
+        """
+        segs = self.segments
+        first = segs['first'][objIdx]
+        count = segs['count'][objIdx]
+        length = segs['length'][objIdx]
+        tStart = self.coeffs['tStart']
+        tEnd = self.coeffs['tEnd']
+        tick = timeToTicks(time, self.nDecimal, roundDown=True)
+        k = np.zeros(len(objIdx), dtype=np.int64)
+        uniform = length > 0
+        k[uniform] = (tick - segs['tick0'][objIdx][uniform]) // length[uniform]
+        if not uniform.all():
+            # The last segment of each object starting at or before 'tick' (or -1 if there is none).
+            rank = np.searchsorted(segs['startTicks'], tick, side='right')
+            keys = objIdx[~uniform] * np.int64(len(segs['startTicks']) + 1) + rank
+            k[~uniform] = np.searchsorted(segs['keys'], keys, side='right') - 1 - first[~uniform]
+        # Allow for the floating point conversion of 'time' to ticks being off by one.
+        k = np.clip(k, 0, count - 1)
+        rows = segs['order'][first + k]
+        before = (time < tStart[rows]) & (k > 0)
+        k[before] -= 1
+        rows = segs['order'][first + k]
+        after = (time >= tEnd[rows]) & (k < count - 1)
+        k[after] += 1
+        rows = segs['order'][first + k]
+        # The end of the last segment is included in that segment.
+        if not extrapolate:
+            outside = ((time < tStart[rows]) | (time > tEnd[rows]) |
+                       ((time == tEnd[rows]) & (k < count - 1)))
+            rows = np.where(outside, -1, rows)
+        return rows
+
+    def _evalSegments(self, rows, time):
+        """Evaluate the ra/dec/delta/vmag/elongation values for a set of segments at a given time.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            The indexes in (each of) self.coeffs for the segments.
+        time : float
+            The time at which to evaluate the segments.
 
         Returns
         -------
         dict
-           Dictionary of RA, Dec, delta, vmag, and elongation values for the segment indicated,
+           Dictionary of RA, Dec, delta, vmag, and elongation values for the segments indicated,
            at the time indicated.
         """
-        if subsetSegments is None:
-            subsetSegments = np.ones(len(self.coeffs['objId']), dtype=bool)
-        tStart = self.coeffs['tStart'][subsetSegments][segmentIdx]
-        tEnd = self.coeffs['tEnd'][subsetSegments][segmentIdx]
-        tScaled = times - tStart
-        tInterval = np.array([tStart, tEnd]) - tStart
+        tStart = self.coeffs['tStart'][rows]
+        tEnd = self.coeffs['tEnd'][rows]
+        # Scale the time onto the [-1, 1] interval of each segment.
+        x = (2.0 * time - tStart - tEnd) / (tEnd - tStart)
+        dxdt = 2.0 / (tEnd - tStart)
         # Evaluate RA/Dec/Delta/Vmag/elongation.
         ephemeris = {}
-        ephemeris['ra'], ephemeris['dradt'] = chebeval(tScaled,
-                                                       self.coeffs['ra'][subsetSegments][segmentIdx],
-                                                       interval=tInterval, doVelocity=True, mask=mask)
-        ephemeris['dec'], ephemeris['ddecdt'] = chebeval(tScaled,
-                                                         self.coeffs['dec'][subsetSegments][segmentIdx],
-                                                         interval=tInterval, doVelocity=True, mask=mask)
-        ephemeris['dradt'] = ephemeris['dradt'] * np.cos(np.radians(ephemeris['dec']))
+        ephemeris['ra'], ephemeris['dradt'] = chebeval(x, self.coeffs['ra'][rows].swapaxes(0, 1),
+                                                       doVelocity=True, mask=False)
+        ephemeris['dec'], ephemeris['ddecdt'] = chebeval(x, self.coeffs['dec'][rows].swapaxes(0, 1),
+                                                         doVelocity=True, mask=False)
+        ephemeris['dradt'] = ephemeris['dradt'] * dxdt * np.cos(np.radians(ephemeris['dec']))
+        ephemeris['ddecdt'] = ephemeris['ddecdt'] * dxdt
         for k in ('delta', 'vmag', 'elongation'):
-            ephemeris[k], _ = chebeval(tScaled, self.coeffs[k][subsetSegments][segmentIdx],
-                                       interval=tInterval, doVelocity=False, mask=mask)
+            ephemeris[k], _ = chebeval(x, self.coeffs[k][rows].swapaxes(0, 1), doVelocity=False, mask=False)
         return ephemeris
 
     def getEphemerides(self, times, objIds=None, extrapolate=False):
         """Find the ephemeris information for 'objIds' at 'time'.
 
-        Implicit in how this is currently written is that the segments are all expected to cover the
-        same start/end time range across all objects.
-        They do not have to have the same segment length for all objects.
+        The segments do not have to have the same segment length, or cover the same time range,
+        for all objects.
 
         Parameters
         ----------
@@ -127,58 +406,37 @@ class ChebyValues(object):
             The object ids for which to generate ephemerides. If None, then just uses all objects.
         extrapolate : bool
             If True, extrapolate beyond ends of segments if time outside of segment range.
-            If False, return ValueError if time is beyond range of segments.
+            If False, return NaNs if time is beyond range of segments.
 
         Returns
         -------
-        numpy.ndarray
-            The ephemeris positions for all objects.
-            Note that these may not be sorted in the same order as objIds.
+        dict
+            The ephemeris positions for all objects, as 2-d arrays ordered [object][time].
+            Objects are in the order of objIds, or sorted by objId if objIds is None.
         """
         if isinstance(times, float) or isinstance(times, int):
             times = np.array([times], float)
         ntimes = len(times)
         ephemerides = {}
-        # Find subset of segments which match objId, if specified.
+        # Find the indexes of the objects, if specified.
         if objIds is None:
-            objMatch = np.ones(len(self.coeffs['objId']), dtype=bool)
-            ephemerides['objId'] = np.unique(self.coeffs['objId'])
+            objIdx = self.objIdIndex.sortedIndexes()
+            ephemerides['objId'] = self.objIdIndex.decode(objIdx)
         else:
             if isinstance(objIds, str) or isinstance(objIds, int):
                 objIds = np.array([objIds])
-            objMatch = np.in1d(self.coeffs['objId'], objIds)
-            ephemerides['objId'] = objIds
+            objIdx = self._objIndex(objIds)
+            ephemerides['objId'] = np.asarray(objIds)
         # Now find ephemeris values.
-        ephemerides['time'] = np.zeros((len(ephemerides['objId']), ntimes), float) + times
+        ephemerides['time'] = np.zeros((len(objIdx), ntimes), float) + times
         for k in self.ephemerisKeys:
-            ephemerides[k] = np.zeros((len(ephemerides['objId']), ntimes), float)
+            ephemerides[k] = np.zeros((len(objIdx), ntimes), float) + np.nan
         for it, t in enumerate(times):
-            # Find subset of segments which contain the appropriate time.
-            # Look for simplest subset first.
-            segments = np.where((self.coeffs['tStart'][objMatch] <= t) &
-                                (self.coeffs['tEnd'][objMatch] > t))[0]
-            if len(segments) == 0:
-                segStart = self.coeffs['tStart'][objMatch].min()
-                segEnd = self.coeffs['tEnd'][objMatch].max()
-                if (segStart > t or segEnd < t):
-                    if not extrapolate:
-                        for k in self.ephemerisKeys:
-                            ephemerides[k][:,it] = np.nan
-                    else:
-                        # Find the segments to use to extrapolate the times.
-                        if segStart > t:
-                            segments = np.where(self.coeffs['tStart'][objMatch] == segStart)[0]
-                        if segEnd < t:
-                            segments = np.where(self.coeffs['tEnd'][objMatch] == segEnd)[0]
-                elif segEnd == t:
-                    # Not extrapolating, but outside the simple match case above.
-                    segments = np.where(self.coeffs['tEnd'][objMatch] == segEnd)[0]
-            for i, segmentIdx in enumerate(segments):
-                ephemeris = self._evalSegment(segmentIdx, t, objMatch, mask=False)
-                for k in self.ephemerisKeys:
-                    ephemerides[k][i][it] = ephemeris[k]
-                ephemerides['objId'][i] = self.coeffs['objId'][objMatch][segmentIdx]
-        if objIds is not None:
-            if set(ephemerides['objId']) != set(objIds):
-                raise ValueError('Did not find expected match between objIds provided and ephemeride objIds.')
+            rows = self._findSegments(objIdx, t, extrapolate=extrapolate)
+            found = np.where(rows >= 0)[0]
+            if len(found) == 0:
+                continue
+            ephemeris = self._evalSegments(rows[found], t)
+            for k in self.ephemerisKeys:
+                ephemerides[k][found, it] = ephemeris[k]
         return ephemerides
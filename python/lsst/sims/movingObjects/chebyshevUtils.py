@@ -5,7 +5,8 @@ Implementation of Newhall, X. X. 1989, Celestial Mechanics, 45, p. 305-310
 
 import numpy as np
 
-__all__ = ['chebeval', 'chebfit', 'makeChebMatrix', 'makeChebMatrixOnlyX']
+__all__ = ['chebeval', 'chebfit', 'makeChebMatrix', 'makeChebMatrixOnlyX',
+           'timeToTicks', 'ticksToTime']
 
 # Evaluation routine.
 
@@ -340,3 +341,64 @@ def chebfit(t, x, dxdt=None, xMultiplier=None, dxMultiplier=None, nPoly=7):
     maxresid = np.max(np.abs(residuals))
 
     return a_n, residuals, rms, maxresid
+
+
+# Segment time grid routines.
+
+def timeToTicks(times, nDecimal, roundDown=False):
+    """Convert times (MJD) to integer 'ticks' of 10**(-nDecimal) days.
+
+    Chebyshev segment boundaries are placed on this grid, so that the end of one segment
+    and the start of the next segment are exactly equal.
+    The integer and fractional parts of the times are converted separately, so that
+    the precision of the fractional part is retained up to nDecimal=14 (for MJD < 92233).
+
+    Parameters
+    ----------
+    times : float or numpy.ndarray
+        The times to convert.
+    nDecimal : int
+        The number of decimal places in the time grid.
+    roundDown : bool, optional
+        If True, return the tick at or before each time rather than the nearest tick. Default False.
+
+    Returns
+    -------
+    int or numpy.ndarray
+        The times in integer ticks (an int for scalar input, otherwise an int64 array).
+    """
+    scale = 10 ** int(nDecimal)
+    t = np.asarray(times, dtype=np.float64)
+    intPart = np.floor(t)
+    fracTicks = (t - intPart) * scale
+    if roundDown:
+        fracTicks = np.floor(fracTicks)
+    else:
+        fracTicks = np.round(fracTicks)
+    ticks = intPart.astype(np.int64) * scale + fracTicks.astype(np.int64)
+    if ticks.ndim == 0:
+        return int(ticks)
+    return ticks
+
+
+def ticksToTime(ticks, nDecimal):
+    """Convert integer 'ticks' of 10**(-nDecimal) days back to times (MJD).
+
+    Parameters
+    ----------
+    ticks : int or numpy.ndarray
+        The times in integer ticks.
+    nDecimal : int
+        The number of decimal places in the time grid.
+
+    Returns
+    -------
+    float or numpy.ndarray
+        The times (MJD).
+    """
+    scale = 10 ** int(nDecimal)
+    if np.ndim(ticks) == 0:
+        ticks = int(ticks)
+        return float(ticks // scale) + float(ticks % scale) / scale
+    ticks = np.asarray(ticks, dtype=np.int64)
+    return (ticks // scale).astype(np.float64) + (ticks % scale).astype(np.float64) / scale
@@ -0,0 +1,163 @@
+"""Memory-compact, array-backed storage for large catalogs of (validated) orbits.
+
+A pandas dataframe of orbits stores string columns (objId, sed_filename) as one Python object per row,
+and H and g as float64 columns which often just hold the default values. CompactOrbits instead holds
+the orbital elements in a single float64 array, the SEDs as small integer codes into the list of
+SED names, H and g as (by default) float32, any column with a single value as a zero-stride array,
+and the objIds dictionary-encoded (integer codes into the sorted unique objIds, with string ids
+stored as UTF-8 bytes). This reduces the memory per orbit by several times for large catalogs.
+"""
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+from .orbits import Orbits, _codeDtype
+from .orbitalElements import ELEMENT_COLUMNS
+
+__all__ = ['CompactOrbits']
+
+
+def _compactColumn(values, dtype):
+    """Return values as dtype, as a (read-only) zero-stride array if all values are the same."""
+    values = np.asarray(values, dtype=dtype)
+    if len(values) > 1 and (values == values[0]).all():
+        return np.broadcast_to(values[:1], values.shape)
+    return values
+
+
+def _arrayBytes(values):
+    """The memory used by an array (a zero-stride array only uses one element)."""
+    if values.ndim == 1 and values.strides[0] == 0:
+        return values.itemsize
+    return values.nbytes
+
+
+class CompactOrbits(object):
+    """Array-backed, memory-compact storage for a catalog of (validated) orbits.
+
+    Use CompactOrbits to hold large catalogs in memory (e.g. in every worker process), and toOrbits
+    or toDataFrame to convert (chunks of) the catalog back into the usual Orbits representation.
+
+    Parameters
+    ----------
+    orbits : Orbits or pandas.DataFrame
+        The orbits. A dataframe is validated first (see Orbits.setOrbits).
+    photDtype : numpy.dtype, optional
+        The data type for H and g. Default float32 (use float64 for lossless round trips).
+    """
+    def __init__(self, orbits, photDtype=np.float32):
+        if not isinstance(orbits, Orbits):
+            orbitsObj = Orbits()
+            orbitsObj.setOrbits(orbits)
+            orbits = orbitsObj
+        self.format = orbits.format
+        self.photDtype = np.dtype(photDtype)
+        self.elementNames = ELEMENT_COLUMNS[self.format]
+        df = orbits.orbits
+        self.columnOrder = df.columns.values.tolist()
+        self.elements = np.ascontiguousarray(df[self.elementNames].values, dtype=np.float64)
+        self.epoch = _compactColumn(df['epoch'].values, np.float64)
+        self.H = _compactColumn(df['H'].values, self.photDtype)
+        self.g = _compactColumn(df['g'].values, self.photDtype)
+        # Categorical SEDs.
+        sedNames, sedCode = np.unique(df['sed_filename'].values.astype(str), return_inverse=True)
+        self.sedNames = sedNames
+        self.sedCode = sedCode.astype(_codeDtype(len(sedNames)))
+        # Dictionary-encoded objIds.
+        objIds = df['objId'].values
+        self.objIdIsStr = objIds.dtype.kind in ('O', 'U', 'S')
+        if self.objIdIsStr:
+            objIds = np.char.encode(objIds.astype(str), 'utf-8')
+        objIdDictionary, objIdCode = np.unique(objIds, return_inverse=True)
+        self.objIdDictionary = objIdDictionary
+        self.objIdCode = objIdCode.astype(_codeDtype(len(objIdDictionary)))
+        # Any other columns are kept as they are.
+        compacted = set(self.elementNames + ['objId', 'epoch', 'H', 'g', 'sed_filename'])
+        self.extraCols = {col: df[col].values for col in self.columnOrder if col not in compacted}
+
+    def __len__(self):
+        return len(self.elements)
+
+    @property
+    def objIds(self):
+        """The (external) objIds of the orbits."""
+        objIds = self.objIdDictionary[self.objIdCode]
+        if self.objIdIsStr:
+            objIds = np.char.decode(objIds, 'utf-8').astype(object)
+        return objIds
+
+    @property
+    def sedFilenames(self):
+        """The SED filename of each orbit."""
+        return self.sedNames[self.sedCode]
+
+    def memoryUsage(self):
+        """Return the memory (bytes) used by the arrays holding the orbits.
+
+        Returns
+        -------
+        int
+            The number of bytes (not including the memory used by objects in object-type extra columns).
+        """
+        arrays = [self.elements, self.epoch, self.H, self.g, self.sedNames, self.sedCode,
+                  self.objIdDictionary, self.objIdCode] + list(self.extraCols.values())
+        return sum(_arrayBytes(a) for a in arrays)
+
+    def toDataFrame(self, start=0, end=None, categorical=False):
+        """Convert (a range of) the orbits back to a dataframe, with the original column order.
+
+        Parameters
+        ----------
+        start : int, optional
+            The first orbit. Default 0.
+        end : int, optional
+            The orbit after the last orbit. Default None (the end of the catalog).
+        categorical : bool, optional
+            If True, sed_filename is returned as a pandas.Categorical and H and g keep photDtype.
+            If False (default), sed_filename holds strings and H and g are float64, as from readOrbits.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The orbits.
+        """
+        s = slice(start, end)
+        data = {}
+        for i, col in enumerate(self.elementNames):
+            data[col] = self.elements[s, i]
+        data['epoch'] = np.array(self.epoch[s])
+        objIds = self.objIdDictionary[self.objIdCode[s]]
+        if self.objIdIsStr:
+            objIds = np.char.decode(objIds, 'utf-8').astype(object)
+        data['objId'] = objIds
+        if categorical:
+            data['H'] = np.array(self.H[s])
+            data['g'] = np.array(self.g[s])
+            data['sed_filename'] = pd.Categorical.from_codes(self.sedCode[s], self.sedNames)
+        else:
+            data['H'] = self.H[s].astype(np.float64)
+            data['g'] = self.g[s].astype(np.float64)
+            data['sed_filename'] = self.sedNames[self.sedCode[s]].astype(object)
+        for col in self.extraCols:
+            data[col] = self.extraCols[col][s]
+        return pd.DataFrame(data, columns=self.columnOrder)
+
+    def toOrbits(self, start=0, end=None):
+        """Convert (a range of) the orbits back to an Orbits object.
+
+        The orbits were validated when the CompactOrbits was created, so are not validated again.
+
+        Parameters
+        ----------
+        start : int, optional
+            The first orbit. Default 0.
+        end : int, optional
+            The orbit after the last orbit. Default None (the end of the catalog).
+
+        Returns
+        -------
+        Orbits
+            The orbits.
+        """
+        orbits = Orbits()
+        orbits.setOrbits(self.toDataFrame(start, end), validate=False)
+        return orbits
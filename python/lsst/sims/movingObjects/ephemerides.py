@@ -1,39 +1,103 @@
 from __future__ import print_function
 import os
-from itertools import repeat
+import abc
+import collections
+import copy
+import hashlib
+import multiprocessing
+import threading
 import warnings
 import numpy as np
 import pandas as pd
-import pyoorb as oo
+try:
+    import pyoorb as oo
+except ImportError:
+    oo = None
 from .orbits import Orbits
+from .orbitalElements import ELEMENT_COLUMNS, cartToCom, comToCart
+from .observatory import readObsCodes, cachedSiteVectors, geocentricToTopocentric, toTT
+from .twoBody import twoBodyEphemerides
 
 import time
 
-__all__ = ['PyOrbEphemerides']
+__all__ = ['BaseEphemerides', 'PyOrbEphemerides', 'SyntheticEphemerides']
+
+# The ephemeris columns returned to users, and their index in the oorb ephemeris array
+# (velocity is calculated from dradt and ddecdt).
+EPHEMERIS_COLUMNS = ['delta', 'ra', 'dec', 'magV', 'time', 'dradt', 'ddecdt', 'phase', 'solarelon',
+                     'velocity']
+# Orbital element columns which are angles (degrees in Orbits, radians in the OpenOrb format).
+ANGLE_COLUMNS = ('inc', 'Omega', 'argPeri', 'meanAnomaly')
+OORB_EPH_INDEX = {'delta': 0, 'ra': 1, 'dec': 2, 'magV': 3, 'time': 4, 'dradt': 6, 'ddecdt': 7,
+                  'phase': 8, 'solarelon': 9}
 
 
 def dtime(time_prev):
     return (time.time() - time_prev, time.time())
 
 
-class PyOrbEphemerides(object):
-    """Generate ephemerides and propagate orbits using the python interface to Oorb.
-    Inherits from Orbits and uses parent class to set orbital parameters.
+# The process-wide OpenOrb session: OpenOrb holds a single (global) JPL ephemeris file, which is
+# expensive to load, so it is only (re)initialized when a different file is required.
+_oorbSession = {'ephfile': None}
+_oorbLock = threading.RLock()
+
+
+def _oorbSessionInit(ephfile):
+    """Make sure OpenOrb is initialized with ephfile, calling oorb_init only if it is not already.
+
+    Parameters
+    ----------
+    ephfile : str
+        The JPL ephemeris file.
+    """
+    with _oorbLock:
+        if _oorbSession['ephfile'] == ephfile:
+            return
+        err = oo.pyoorb.oorb_init(ephemeris_fname=ephfile)
+        if err != 0:
+            _oorbSession['ephfile'] = None
+            warnings.warn('Oorb initialization with %s returned error %s' % (ephfile, err))
+        else:
+            _oorbSession['ephfile'] = ephfile
+
+
+def _initOorbWorker(ephfile):
+    """Initialize oorb once, in each worker process of the PyOrbEphemerides process pool.
+
+    A forked worker inherits a copy of the parent's lock (which may have been held by another thread
+    at the time of the fork) and session record (which need not describe the worker's OpenOrb state),
+    so both are reset before OpenOrb is initialized.
+    """
+    global _oorbLock
+    _oorbLock = threading.RLock()
+    _oorbSession['ephfile'] = None
+    _oorbSessionInit(ephfile)
+
+
+def _oorbEphemerisWorker(args):
+    """Generate oorb ephemerides for a subset of the orbits, in a worker process."""
+    oorbElem, obscode, ephTimes = args
+    return oo.pyoorb.oorb_ephemeris(in_orbits=oorbElem, in_obscode=obscode, in_date_ephems=ephTimes)
+
+
+class BaseEphemerides(abc.ABC):
+    """Abstract base class for ephemeris generators (backends), used by ChebyFits and LinearObs.
+
+    Backends set orbits with setOrbits (which also converts them to the OpenOrb element format in
+    self.oorbElem), generate ephemerides with generateEphemerides and propagate orbits to a new
+    epoch with propagateOrbits. The ephemerides are returned in the numpy recarray format produced
+    by _convertOorbEphs, whatever the backend.
+    Backends must implement generateEphemerides and propagateOrbits.
     """
     def __init__(self, ephfile=None):
         # Set translation from timescale to OpenOrb numerical representation.
         # Note all orbits are assumed to be in TT timescale.
         # Also, all dates are expected to be in MJD.
         self.timeScales = {'UTC': 1, 'UT1': 2, 'TT': 3, 'TAI': 4}
-        self.elemType = {'COM': 2, 'KEP': 3}
-
-        # Set up oorb. Call this once.
-        if ephfile is None:
-            ephfile = os.path.join(os.getenv('OORB_DATA'), 'de405.dat')
-        oo.pyoorb.oorb_init(ephemeris_fname=ephfile)
-
+        self.elemType = {'CART': 1, 'COM': 2, 'KEP': 3}
         self.orbitObj = None
         self.oorbElem = None
+        self.obsCodes = None
 
     def setOrbits(self, orbitObj):
         """Set the orbits, to be used to generate ephemerides.
@@ -52,6 +116,25 @@ class PyOrbEphemerides(object):
         self.orbitObj = orbitObj
         self._convertToOorbElem()
 
+    def selectOrbits(self, objIds):
+        """Return a copy of this ephemeris generator, for the orbits with objIds.
+
+        The copy shares the configuration of this generator (e.g. the ephemeris file).
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds of the orbits (see Orbits.select).
+
+        Returns
+        -------
+        BaseEphemerides
+            New ephemerides object (of the same type), with the selected orbits, in the order of objIds.
+        """
+        subset = copy.copy(self)
+        subset.setOrbits(self.orbitObj.select(objIds))
+        return subset
+
     def _convertToOorbElem(self):
         """Convert orbital elements into the numpy fortran-format array OpenOrb requires
         as input for ephemeris generation.
@@ -59,7 +142,7 @@ class PyOrbEphemerides(object):
         The OpenOrb element format is a single array with elemenets:
         0 : orbitId (cannot be a string)
         1-6 : orbital elements, using radians for angles
-        7 : element 'type' code (2 = COM, 3 = KEP)
+        7 : element 'type' code (1 = CART, 2 = COM, 3 = KEP)
         8 : epoch
         9 : timescale for epoch (1 = UTC, 2 = UT1, 3 = TT, 4 = TAI : always assumes TT)
         10 : magHv
@@ -69,27 +152,20 @@ class PyOrbEphemerides(object):
         """
         # Add the appropriate element and epoch types:
         orbids = np.arange(0, len(self.orbitObj), 1)
+        if self.orbitObj.format not in self.elemType:
+            raise ValueError('Unknown orbit format %s: should be one of %s.'
+                             % (self.orbitObj.format, list(self.elemType)))
         elem_type = np.zeros(len(self.orbitObj)) + self.elemType[self.orbitObj.format]
         epoch_scale = np.zeros(len(self.orbitObj)) + self.timeScales['TT']
-        # Convert to format for pyoorb, INCLUDING converting inclination, node, argperi to RADIANS
-        if self.orbitObj.format == 'KEP':
-            oorbElem = np.column_stack((orbids, self.orbitObj.orbits['a'], self.orbitObj.orbits['e'],
-                                        np.radians(self.orbitObj.orbits['inc']),
-                                        np.radians(self.orbitObj.orbits['Omega']),
-                                        np.radians(self.orbitObj.orbits['argPeri']),
-                                        np.radians(self.orbitObj.orbits['meanAnomaly']),
-                                        elem_type, self.orbitObj.orbits['epoch'], epoch_scale,
-                                        self.orbitObj.orbits['H'], self.orbitObj.orbits['g']))
-        elif self.orbitObj.format == 'COM':
-            oorbElem = np.column_stack((orbids, self.orbitObj.orbits['q'], self.orbitObj.orbits['e'],
-                                        np.radians(self.orbitObj.orbits['inc']),
-                                        np.radians(self.orbitObj.orbits['Omega']),
-                                        np.radians(self.orbitObj.orbits['argPeri']),
-                                        self.orbitObj.orbits['tPeri'], elem_type,
-                                        self.orbitObj.orbits['epoch'], epoch_scale,
-                                        self.orbitObj.orbits['H'], self.orbitObj.orbits['g']))
-        else:
-            raise ValueError('Unknown orbit format %s: should be COM or KEP.' % self.orbitObj.format)
+        # Convert to format for pyoorb, INCLUDING converting inclination, node, argperi
+        # (and mean anomaly) to RADIANS.
+        elements = []
+        for col in ELEMENT_COLUMNS[self.orbitObj.format]:
+            values = self.orbitObj.orbits[col]
+            elements.append(np.radians(values) if col in ANGLE_COLUMNS else values)
+        oorbElem = np.column_stack([orbids] + elements + [elem_type, self.orbitObj.orbits['epoch'],
+                                                          epoch_scale, self.orbitObj.orbits['H'],
+                                                          self.orbitObj.orbits['g']])
         self.oorbElem = oorbElem
 
     def _convertFromOorbElem(self, oorbElem):
@@ -105,22 +181,16 @@ class PyOrbEphemerides(object):
         Orbits
             A new Orbits instance, containing the propagated orbits.
         """
-        if self.orbitObj.format == 'KEP':
-            newOrbits = pd.DataFrame(self.oorbElem, columns=['objId', 'a', 'e', 'inc', 'Omega', 'argPeri',
-                                                             'meanAnomaly', 'elem_type', 'epoch',
-                                                             'epoch_type',
-                                                             'H', 'g'])
-            newOrbits['meanAnomaly'] = np.degrees(newOrbits['meanAnomaly'])
-        elif self.orbitObj.format == 'COM':
-            newOrbits = pd.DataFrame(self.oorbElem, columns=['objId', 'q', 'e', 'inc', 'Omega', 'argPeri',
-                                                             'tPeri', 'elem_type', 'epoch', 'epoch_type',
-                                                             'H', 'g'])
-        else:
-            raise ValueError('Unknown orbit format %s: should be COM or KEP.' % self.orbitObj.format)
+        if self.orbitObj.format not in self.elemType:
+            raise ValueError('Unknown orbit format %s: should be one of %s.'
+                             % (self.orbitObj.format, list(self.elemType)))
+        elemCols = ELEMENT_COLUMNS[self.orbitObj.format]
+        newOrbits = pd.DataFrame(oorbElem, columns=['objId'] + elemCols + ['elem_type', 'epoch',
+                                                                           'epoch_type', 'H', 'g'])
         # Convert from radians to degrees.
-        newOrbits['inc'] = np.degrees(newOrbits['inc'])
-        newOrbits['Omega'] = np.degrees(newOrbits['Omega'])
-        newOrbits['argPeri'] = np.degrees(newOrbits['argPeri'])
+        for col in elemCols:
+            if col in ANGLE_COLUMNS:
+                newOrbits[col] = np.degrees(newOrbits[col])
         # Drop columns we don't need and don't include in our standard columns.
         del newOrbits['elem_type']
         del newOrbits['epoch_type']
@@ -129,7 +199,7 @@ class PyOrbEphemerides(object):
         newOrbits['sed_filename'] = self.orbitObj.orbits['sed_filename'].as_matrix()
         # Assign to new Orbit instance.
         newOrb = Orbits()
-        newOrb.setOrbits(newOrbits)
+        newOrb.setOrbits(newOrbits, validate=False)
         return newOrb
 
     def _convertTimes(self, times, timeScale='UTC'):
@@ -147,36 +217,15 @@ class PyOrbEphemerides(object):
         numpy.ndarray
             The oorb-formatted 'ephTimes' array.
         """
-        if isinstance(times, float):
-            times = np.array([times])
+        times = np.atleast_1d(np.asarray(times, dtype='double'))
         if len(times) == 0:
             raise ValueError('Got zero times to convert for OpenOrb')
-        ephTimes = np.array(list(zip(times, repeat(self.timeScales[timeScale], len(times)))),
-                            dtype='double', order='F')
+        ephTimes = np.empty((len(times), 2), dtype='double', order='F')
+        ephTimes[:, 0] = times
+        ephTimes[:, 1] = self.timeScales[timeScale]
         return ephTimes
 
-    def _generateOorbEphs(self, ephTimes, obscode=807):
-        """Generate ephemerides using OOrb.
-
-        Parameters
-        ----------
-        ephtimes : numpy.ndarray
-            Ephemeris times in oorb format (see self.convertTimes)
-        obscode : int, optional
-            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
-
-        Returns
-        -------
-        numpy.ndarray
-            The oorb-formatted ephemeris array.
-        """
-        oorbEphems, err = oo.pyoorb.oorb_ephemeris(in_orbits=self.oorbElem, in_obscode=obscode,
-                                                   in_date_ephems=ephTimes)
-        if err != 0:
-            warnings.warn('Oorb returned error %s' % (err))
-        return oorbEphems
-
-    def _convertOorbEphs(self, oorbEphs, byObject=True):
+    def _convertOorbEphs(self, oorbEphs, byObject=True, columns=None, dtype=np.float64):
         """Converts oorb ephemeris array to pandas dataframe, with labelled columns.
 
         The oorb ephemeris array is a 3-d array organized as: (object / times / eph@time)
@@ -208,26 +257,392 @@ class PyOrbEphemerides(object):
         byObject : boolean, optional
             If True (default), resulting converted ephemerides are grouped by object.
             If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all of
+            ['delta', 'ra', 'dec', 'magV', 'time', 'dradt', 'ddecdt', 'phase', 'solarelon', 'velocity'].
+            If 'velocity' is not included, dtype is float64 and oorbEphs is C ordered, the result is
+            a view of oorbEphs (no values are copied); otherwise the requested columns are copied.
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64; float32 halves the memory use.
 
         Returns
         -------
         numpy.ndarray
             The re-arranged ephemeris values, in a 3-d array.
         """
-        ephs = np.swapaxes(oorbEphs, 2, 0)
-        velocity = np.sqrt(ephs[6]**2 + ephs[7]**2)
+        if columns is None:
+            columns = EPHEMERIS_COLUMNS
+        for col in columns:
+            if col not in EPHEMERIS_COLUMNS:
+                raise ValueError('Unknown ephemeris column %s: should be one of %s'
+                                 % (col, EPHEMERIS_COLUMNS))
+        dtype = np.dtype(dtype)
+        oorbEphs = np.asarray(oorbEphs)
+        if (dtype == np.float64 and 'velocity' not in columns and oorbEphs.dtype == np.float64
+                and oorbEphs.flags.c_contiguous):
+            # Reinterpret the last axis of the oorb array as a structured record, with the fields
+            # at their offsets within each (contiguous) row of ephemeris values.
+            # Fortran ordered arrays (as returned by pyoorb) are copied below instead: their records
+            # would overlap in memory, so any copy of the view would be enormous.
+            recDtype = np.dtype({'names': list(columns), 'formats': [np.float64] * len(columns),
+                                 'offsets': [OORB_EPH_INDEX[col] * oorbEphs.itemsize for col in columns],
+                                 'itemsize': oorbEphs.shape[2] * oorbEphs.itemsize})
+            ephs = np.ndarray(oorbEphs.shape[:2], dtype=recDtype, buffer=oorbEphs,
+                              strides=oorbEphs.strides[:2])
+            if not byObject:
+                ephs = ephs.swapaxes(0, 1)
+            return ephs.view(np.recarray)
+        # Otherwise fill a single contiguous structured array.
         if byObject:
-            ephs = np.swapaxes(ephs, 2, 1)
-            velocity = np.swapaxes(velocity, 1, 0)
-        # Create a numpy recarray.
-        ephs = np.rec.fromarrays([ephs[0], ephs[1], ephs[2], ephs[3], ephs[4],
-                                  ephs[6], ephs[7], ephs[8], ephs[9], velocity],
-                                 names=['delta', 'ra', 'dec', 'magV', 'time', 'dradt',
-                                        'ddecdt', 'phase', 'solarelon', 'velocity'])
-        return ephs
+            shape = oorbEphs.shape[:2]
+            source = oorbEphs
+        else:
+            shape = (oorbEphs.shape[1], oorbEphs.shape[0])
+            source = oorbEphs.swapaxes(0, 1)
+        ephs = np.empty(shape, dtype=[(col, dtype) for col in columns])
+        for col in columns:
+            if col == 'velocity':
+                ephs[col] = np.hypot(source[:, :, OORB_EPH_INDEX['dradt']],
+                                     source[:, :, OORB_EPH_INDEX['ddecdt']])
+            else:
+                ephs[col] = source[:, :, OORB_EPH_INDEX[col]]
+        return ephs.view(np.recarray)
+
+    @abc.abstractmethod
+    def generateEphemerides(self, times, timeScale='UTC', obscode=807, byObject=True,
+                            verbose=False, columns=None, dtype=np.float64):
+        """Calculate ephemerides for all orbits at times `times`.
+
+        See PyOrbEphemerides.generateEphemerides for the format of the returned ephemerides.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Ephemeris times (MJD).
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        byObject : boolean, optional
+            If True (default), resulting converted ephemerides are grouped by object.
+            If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
+        verbose: boolean, optional
+            If True, prints time required to calculate ephemerides. Default is False.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ephemeris values, organized as chosen by the user.
+        """
+
+    def generateEphemeridesBlocks(self, times, blockSize=1000, timeScale='UTC', obscode=807,
+                                  byObject=True, columns=None, dtype=np.float64):
+        """Generate ephemerides for all orbits at times `times`, yielding blocks of blockSize times.
+
+        This keeps the memory use flat for long time series, and lets the ephemerides be used as soon as
+        each block is ready. Each block is in the same format as the output of generateEphemerides.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Ephemeris times (MJD), generally in increasing order.
+        blockSize : int, optional
+            The number of times in each block. Default 1000.
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        byObject : boolean, optional
+            If True (default), resulting converted ephemerides are grouped by object.
+            If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
+
+        Yields
+        ------
+        numpy.ndarray
+            The ephemeris values for each block of times.
+        """
+        times = np.atleast_1d(times)
+        for start in range(0, len(times), blockSize):
+            yield self.generateEphemerides(times[start:start + blockSize], timeScale=timeScale,
+                                           obscode=obscode, byObject=byObject, columns=columns,
+                                           dtype=dtype)
+
+    @abc.abstractmethod
+    def propagateOrbits(self, newEpoch):
+        """Propagate orbits from self.orbitObj.epoch to new epoch (MJD TT).
+
+        Parameters
+        ----------
+        newEpoch : float
+            MJD TT time for new epoch.
+
+        Returns
+        -------
+        BaseEphemerides
+            New ephemerides object (of the same type), containing the propagated orbits.
+        """
+
+
+class PyOrbEphemerides(BaseEphemerides):
+    """Generate ephemerides and propagate orbits using the python interface to Oorb.
+    Inherits from Orbits and uses parent class to set orbital parameters.
+
+    Parameters
+    ----------
+    ephfile : str, optional
+        The path to the JPL ephemeris file to use. Default is '$OORB_DATA/de405.dat'.
+    nProcs : int, optional
+        The number of processes to use for ephemeris generation. Default 1 (no extra processes).
+        If more than 1, the orbits are split between a pool of worker processes (each of which
+        initializes oorb once), and the results are combined; these are identical to the serial results.
+        Call close() to shut down the pool when finished.
+    cache : EphemerisCache, optional
+        If provided, the ephemerides of each orbit are looked up in (and added to) this on-disk cache,
+        keyed by the orbit, times, observatory code, timescale, ephemeris file and ephMode, and only the
+        ephemerides of the orbits which are not in the cache are generated. Default None (no cache).
+    checkpointInterval : float, optional
+        If provided, the orbits are propagated (and the propagated orbits kept) at epochs which are
+        multiples of checkpointInterval days, and n-body ephemerides are generated starting from the
+        checkpoint nearest the requested times, rather than always integrating from the orbit epoch.
+        The results agree with integrating from the orbit epoch to within the integration accuracy.
+        The checkpoints are kept for the last few sets of orbits (identified by their content), so are
+        not lost when the orbits are switched back and forth (e.g. when ChebyFits subdivides a segment).
+        Default None (no checkpoints).
+    """
+    # The number of sets of orbits for which checkpoints are kept.
+    maxCheckpointSets = 4
+
+    def __init__(self, ephfile=None, nProcs=1, cache=None, checkpointInterval=None):
+        if oo is None:
+            raise ImportError('PyOrbEphemerides requires pyoorb; use SyntheticEphemerides for a '
+                              'stand-in which does not.')
+        super(PyOrbEphemerides, self).__init__()
+        # Set up oorb. Call this once.
+        if ephfile is None:
+            ephfile = os.path.join(os.getenv('OORB_DATA'), 'de405.dat')
+        self.ephfile = ephfile
+        # Only loads the ephemeris file if the process-wide oorb session is not already using it.
+        _oorbSessionInit(ephfile)
+        self.nProcs = int(nProcs)
+        self.pool = None
+        self.cache = cache
+        self.checkpointInterval = checkpointInterval
+        self.checkpoints = {}
+        self._checkpointSets = collections.OrderedDict()
+
+    def setOrbits(self, orbitObj):
+        """Set the orbits, to be used to generate ephemerides.
+
+        Immediately calls self._convertOorbElem to (also) save in Oorb format,
+        and selects the propagated orbit checkpoints for these orbits (if any were kept).
+
+        Parameters
+        ----------
+        orbitObj : Orbits
+           The orbits to use to generate ephemerides.
+        """
+        super(PyOrbEphemerides, self).setOrbits(orbitObj)
+        if self.checkpointInterval is None:
+            self.checkpoints = {}
+            return
+        key = hashlib.sha1(np.ascontiguousarray(self.oorbElem).tobytes()).hexdigest()
+        if key not in self._checkpointSets:
+            self._checkpointSets[key] = {}
+            while len(self._checkpointSets) > self.maxCheckpointSets:
+                self._checkpointSets.popitem(last=False)
+        self._checkpointSets.move_to_end(key)
+        self.checkpoints = self._checkpointSets[key]
+
+    def selectOrbits(self, objIds):
+        """Return a copy of this ephemeris generator, for the orbits with objIds.
+
+        The copy shares the ephemeris file, process pool and cache of this generator,
+        but keeps its own checkpoints.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds of the orbits (see Orbits.select).
+
+        Returns
+        -------
+        PyOrbEphemerides
+            New ephemerides object, with the selected orbits, in the order of objIds.
+        """
+        subset = copy.copy(self)
+        subset._checkpointSets = collections.OrderedDict()
+        subset.setOrbits(self.orbitObj.select(objIds))
+        return subset
+
+    def _getPool(self):
+        """Start the pool of worker processes, if not already running."""
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(processes=self.nProcs, initializer=_initOorbWorker,
+                                             initargs=(self.ephfile,))
+        return self.pool
+
+    def close(self):
+        """Shut down the pool of worker processes (if running)."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _generateOorbEphs(self, ephTimes, obscode=807, oorbElem=None):
+        """Generate ephemerides using OOrb.
+
+        Parameters
+        ----------
+        ephtimes : numpy.ndarray
+            Ephemeris times in oorb format (see self.convertTimes)
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        oorbElem : numpy.ndarray, optional
+            The orbital elements (in OpenOrb format) to start from. Default None uses self.oorbElem
+            (or the closest checkpoint, see self._checkpointOorbElem).
+
+        Returns
+        -------
+        numpy.ndarray
+            The oorb-formatted ephemeris array.
+        """
+        if oorbElem is None:
+            oorbElem = self._checkpointOorbElem(ephTimes)
+        if self.nProcs > 1 and len(oorbElem) > 1:
+            # Split the orbits between the worker processes, then stitch the results back together.
+            chunks = np.array_split(oorbElem, min(self.nProcs, len(oorbElem)))
+            results = self._getPool().map(_oorbEphemerisWorker,
+                                          [(chunk, obscode, ephTimes) for chunk in chunks])
+            oorbEphems = np.concatenate([r[0] for r in results], axis=0)
+            err = [r[1] for r in results if r[1] != 0]
+            err = err[0] if len(err) > 0 else 0
+        else:
+            with _oorbLock:
+                # Another instance may have switched the session to a different ephemeris file.
+                _oorbSessionInit(self.ephfile)
+                oorbEphems, err = oo.pyoorb.oorb_ephemeris(in_orbits=oorbElem, in_obscode=obscode,
+                                                           in_date_ephems=ephTimes)
+        if err != 0:
+            warnings.warn('Oorb returned error %s' % (err))
+        return oorbEphems
+
+    def _checkpointOorbElem(self, ephTimes):
+        """Return the orbits (in oorb format) to start n-body ephemeris generation from.
+
+        If self.checkpointInterval is set, these are the orbits propagated to the checkpoint epoch
+        closest to the middle of ephTimes (propagating from the closest existing checkpoint, and
+        saving the result in self.checkpoints), unless the orbit epochs are already closer.
+
+        Parameters
+        ----------
+        ephtimes : numpy.ndarray
+            Ephemeris times in oorb format (see self.convertTimes)
+
+        Returns
+        -------
+        numpy.ndarray
+            The orbital elements in OpenOrb format.
+        """
+        if self.checkpointInterval is None:
+            return self.oorbElem
+        tMid = (ephTimes[:, 0].min() + ephTimes[:, 0].max()) / 2.
+        checkpoint = np.round(tMid / self.checkpointInterval) * self.checkpointInterval
+        if np.abs(checkpoint - tMid) >= np.abs(self.oorbElem[:, 8] - tMid).max():
+            return self.oorbElem
+        if checkpoint not in self.checkpoints:
+            # Start from the closest existing checkpoint, if it is closer than the orbit epochs.
+            startElem = self.oorbElem
+            if len(self.checkpoints) > 0:
+                closest = min(self.checkpoints, key=lambda c: abs(c - checkpoint))
+                if abs(closest - checkpoint) < np.abs(self.oorbElem[:, 8] - checkpoint).max():
+                    startElem = self.checkpoints[closest]
+            self.checkpoints[checkpoint] = self._propagateOorbElem(startElem, checkpoint)
+        return self.checkpoints[checkpoint]
+
+    def _propagateOorbElem(self, oorbElem, newEpoch):
+        """Propagate orbits (in oorb format) to a new epoch, using OpenOrb n-body integration.
+
+        Parameters
+        ----------
+        oorbElem : numpy.ndarray
+            The orbital elements in OpenOrb format.
+        newEpoch : float
+            MJD TT time for new epoch.
+
+        Returns
+        -------
+        numpy.ndarray
+            The propagated orbital elements in OpenOrb format.
+        """
+        epoch = np.array([newEpoch, self.timeScales['TT']], dtype='double', order='F')
+        with _oorbLock:
+            _oorbSessionInit(self.ephfile)
+            newOorbElem, err = oo.pyoorb.oorb_propagation_nb(in_orbits=oorbElem, in_epoch=epoch)
+        if err != 0:
+            warnings.warn('Orbit propagation returned error %d' % err)
+        return newOorbElem
+
+    def _generateTwoBodyEphs(self, ephTimes, obscode=807, oorbElem=None):
+        """Generate ephemerides using the (approximate) two-body propagation in twoBody.py.
+
+        Parameters
+        ----------
+        ephtimes : numpy.ndarray
+            Ephemeris times in oorb format (see self.convertTimes)
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        oorbElem : numpy.ndarray, optional
+            The orbital elements (in OpenOrb format). Default None uses self.oorbElem.
+
+        Returns
+        -------
+        numpy.ndarray
+            The oorb-formatted ephemeris array.
+        """
+        if oorbElem is None:
+            oorbElem = self.oorbElem
+        if self.obsCodes is None and str(obscode) != '500':
+            self.obsCodes = readObsCodes()
+        return twoBodyEphemerides(oorbElem, ephTimes, obscode=obscode, obsCodes=self.obsCodes)
+
+    def _generateModeEphs(self, ephTimes, obscode=807, ephMode='nbody', rows=None):
+        """Generate oorb-formatted ephemerides with ephMode, for all orbits or the orbits in rows.
+
+        Parameters
+        ----------
+        ephtimes : numpy.ndarray
+            Ephemeris times in oorb format (see self.convertTimes)
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        ephMode : str, optional
+            'nbody' (default) or '2body' (see generateEphemerides).
+        rows : numpy.ndarray, optional
+            Index (or boolean mask) of the orbits (rows of self.oorbElem). Default None (all orbits).
+
+        Returns
+        -------
+        numpy.ndarray
+            The oorb-formatted ephemeris array.
+        """
+        if ephMode == 'nbody':
+            oorbElem = None if rows is None else self._checkpointOorbElem(ephTimes)[rows]
+            return self._generateOorbEphs(ephTimes, obscode=obscode, oorbElem=oorbElem)
+        elif ephMode == '2body':
+            oorbElem = None if rows is None else self.oorbElem[rows]
+            return self._generateTwoBodyEphs(ephTimes, obscode=obscode, oorbElem=oorbElem)
+        else:
+            raise ValueError('Unknown ephMode %s: should be nbody or 2body.' % ephMode)
 
     def generateEphemerides(self, times, timeScale='UTC', obscode=807, byObject=True,
-                            verbose=False):
+                            verbose=False, ephMode='nbody', columns=None, dtype=np.float64):
         """Calculate ephemerides for all orbits at times `times`.
 
         This is a public method, wrapping self._convertTimes, self._generateOorbEphs
@@ -253,8 +668,16 @@ class PyOrbEphemerides(object):
         byObject : boolean, optional
             If True (default), resulting converted ephemerides are grouped by object.
             If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
         verbose: boolean, optional
             If True, prints time required to calculate ephemerides. Default is False.
+        ephMode: str, optional
+            'nbody' (default) uses OpenOrb's n-body integration.
+            '2body' uses a much faster two-body approximation, which is good to arcseconds near the
+            orbit epoch but degrades with time from the epoch (see twoBody.py for details).
 
         Returns
         -------
@@ -263,35 +686,273 @@ class PyOrbEphemerides(object):
         """
         t = time.time()
         ephTimes = self._convertTimes(times, timeScale=timeScale)
-        oorbEphs = self._generateOorbEphs(ephTimes, obscode=obscode)
-        ephs = self._convertOorbEphs(oorbEphs, byObject=byObject)
+        if self.cache is None:
+            oorbEphs = self._generateModeEphs(ephTimes, obscode=obscode, ephMode=ephMode)
+        else:
+            # Only generate the ephemerides of the orbits which are not already cached.
+            cacheKeys = self.cache.makeKeys(self.oorbElem, ephTimes, obscode, self.ephfile, ephMode)
+            oorbEphs, found = self.cache.getOrbits(cacheKeys)
+            if not found.all():
+                missing = np.where(~found)[0]
+                newEphs = self._generateModeEphs(ephTimes, obscode=obscode, ephMode=ephMode, rows=missing)
+                if oorbEphs is None:
+                    oorbEphs = newEphs
+                else:
+                    oorbEphs[missing] = newEphs
+                self.cache.putOrbits(cacheKeys[missing], newEphs)
+        ephs = self._convertOorbEphs(oorbEphs, byObject=byObject, columns=columns, dtype=dtype)
         dt, t = dtime(t)
         if verbose:
             print("# Calculating ephemerides for %d objects over %d times required %f seconds"
                   % (len(self.orbitObj), len(times), dt))
         return ephs
 
+    def generateEphemeridesBlocks(self, times, blockSize=1000, timeScale='UTC', obscode=807,
+                                  byObject=True, ephMode='nbody', columns=None, dtype=np.float64):
+        """Generate ephemerides for all orbits at times `times`, yielding blocks of blockSize times.
+
+        This keeps the memory use flat for long time series, and lets the ephemerides be used as soon as
+        each block is ready. Each block is in the same format as the output of generateEphemerides.
+        For n-body ephemerides, the orbits are propagated from the start of one block to the start of the
+        next, so that each block continues from the previous block's integration rather than from the
+        orbit epoch. (These ephemerides are not stored in or read from self.cache.)
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Ephemeris times (MJD), generally in increasing order.
+        blockSize : int, optional
+            The number of times in each block. Default 1000.
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+        obscode : int, optional
+            The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+        byObject : boolean, optional
+            If True (default), resulting converted ephemerides are grouped by object.
+            If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
+        ephMode: str, optional
+            'nbody' (default) or '2body' (see generateEphemerides).
+
+        Yields
+        ------
+        numpy.ndarray
+            The ephemeris values for each block of times.
+        """
+        if ephMode not in ('nbody', '2body'):
+            raise ValueError('Unknown ephMode %s: should be nbody or 2body.' % ephMode)
+        times = np.atleast_1d(times)
+        oorbElem = None
+        for start in range(0, len(times), blockSize):
+            ephTimes = self._convertTimes(times[start:start + blockSize], timeScale=timeScale)
+            if ephMode == '2body':
+                oorbEphs = self._generateTwoBodyEphs(ephTimes, obscode=obscode)
+            else:
+                if oorbElem is None:
+                    oorbElem = self._checkpointOorbElem(ephTimes)
+                oorbEphs = self._generateOorbEphs(ephTimes, obscode=obscode, oorbElem=oorbElem)
+                if start + blockSize < len(times):
+                    # Carry the orbits forward to the start of the next block.
+                    nextEpoch = float(toTT(times[start + blockSize], timeScale=timeScale))
+                    oorbElem = self._propagateOorbElem(oorbElem, nextEpoch)
+            yield self._convertOorbEphs(oorbEphs, byObject=byObject, columns=columns, dtype=dtype)
+
+    def _topocentricOorbEphs(self, geoEphs, ephTimes, obscode, timeScale='UTC'):
+        """Move geocentric oorb-format ephemerides to the location of an observatory.
+
+        The sky position, sky motion, distance and magnitude are updated; the phase angle and
+        solar elongation change by less than the parallax angle and are left unchanged.
+
+        Parameters
+        ----------
+        geoEphs : numpy.ndarray
+            The oorb-formatted ephemerides, generated for the geocenter (obscode 500).
+        ephTimes : numpy.ndarray
+            Ephemeris times in oorb format (see self.convertTimes)
+        obscode : int or str
+            The observatory code.
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+
+        Returns
+        -------
+        numpy.ndarray
+            The oorb-formatted ephemeris array for the observatory.
+        """
+        if self.obsCodes is None:
+            self.obsCodes = readObsCodes()
+        sitePos, siteVel = cachedSiteVectors(obscode, ephTimes[:, 0], timeScale=timeScale,
+                                             obsCodes=self.obsCodes)
+        oorbEphs = np.array(geoEphs, copy=True)
+        delta, ra, dec, dradt, ddecdt = geocentricToTopocentric(geoEphs[:, :, 0], geoEphs[:, :, 1],
+                                                                geoEphs[:, :, 2], geoEphs[:, :, 6],
+                                                                geoEphs[:, :, 7], sitePos, siteVel)
+        oorbEphs[:, :, 0] = delta
+        oorbEphs[:, :, 1] = ra
+        oorbEphs[:, :, 2] = dec
+        oorbEphs[:, :, 3] += 5.0 * np.log10(delta / geoEphs[:, :, 0])
+        oorbEphs[:, :, 6] = dradt
+        oorbEphs[:, :, 7] = ddecdt
+        return oorbEphs
+
+    def generateEphemeridesMultiSite(self, times, obscodes, timeScale='UTC', byObject=True,
+                                     verbose=False, columns=None, dtype=np.float64):
+        """Calculate ephemerides for all orbits at times `times`, for several observatories.
+
+        The orbits are propagated to each time only once, generating geocentric ephemerides,
+        which are then moved to the location of each observatory (see self._topocentricOorbEphs).
+        The difference in sky position from running generateEphemerides separately for each observatory
+        is a very small fraction of the parallax (of order 1 mas for main belt asteroids).
+
+        The ephemeris values are the same as for generateEphemerides, but each column has an additional
+        first axis for the observatory
+        - if byObject = True : [ephemeris values][obscode][object][@time]
+        - if byObject = False : [ephemeris values][obscode][time][@object]
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Ephemeris times (MJD).
+        obscodes : list of int or str
+            The observatory codes. These must have a fixed location on the Earth.
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+        byObject : boolean, optional
+            If True (default), resulting converted ephemerides are grouped by object.
+            If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
+        verbose: boolean, optional
+            If True, prints time required to calculate ephemerides. Default is False.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ephemeris values, with the observatory in the same order as obscodes.
+        """
+        t = time.time()
+        ephTimes = self._convertTimes(times, timeScale=timeScale)
+        geoEphs = self._generateOorbEphs(ephTimes, obscode=500)
+        ephs = []
+        for obscode in obscodes:
+            oorbEphs = self._topocentricOorbEphs(geoEphs, ephTimes, obscode, timeScale=timeScale)
+            ephs.append(self._convertOorbEphs(oorbEphs, byObject=byObject, columns=columns, dtype=dtype))
+        ephs = np.stack(ephs).view(np.recarray)
+        dt, t = dtime(t)
+        if verbose:
+            print("# Calculating ephemerides for %d objects over %d times at %d sites required %f seconds"
+                  % (len(self.orbitObj), len(ephTimes), len(obscodes), dt))
+        return ephs
+
     def propagateOrbits(self, newEpoch):
-        """DOES NOT YET WORK DUE TO ERRORS IN PYOORB!!!!
-        Propagate orbits from self.orbits.epoch to new epoch (MJD TT).
+        """Propagate orbits from self.orbitObj.epoch to new epoch (MJD TT).
 
         Parameters
         ----------
-        new_epoch : float
+        newEpoch : float
             MJD TT time for new epoch.
-        sso : pandas.Dataframe or pandas.Series or numpy.ndarray, optional
-            A single or set of rows from self.orbits. Default = None (uses all of self.orbits).
 
         Returns
         -------
         PyOrbEphemerides
-            New PyOrbEphemerides object, containing updated orbital elements for orbits specified by 'sso'.
+            New PyOrbEphemerides object, containing the propagated orbits
+            (using the same ephemeris file, number of processes, cache and checkpoint interval).
         """
-        newEpoch = self._convertTimes([newEpoch], timeScale='TT')
-        newOorbElems, err = oo.pyoorb.oorb_propagation_nb(in_orbits=self.oorbElems, in_epoch=newEpoch)
-        if err != 0:
-            warnings.warn('Orbit propagation returned error %d' % err)
+        startElem = self._checkpointOorbElem(np.array([[newEpoch, self.timeScales['TT']]]))
+        newOorbElem = self._propagateOorbElem(startElem, newEpoch)
         # Convert new orbital elements to normal form, and return new Orbits instance.
-        newOrbits = PyOrbEphemerides()
-        newOrbits.setOrbits(self._convertFromOorbElem(newOorbElems))
+        newOrbits = PyOrbEphemerides(ephfile=self.ephfile, nProcs=self.nProcs, cache=self.cache,
+                                     checkpointInterval=self.checkpointInterval)
+        newOrbits.setOrbits(self._convertFromOorbElem(newOorbElem))
+        return newOrbits
+
+
+class SyntheticEphemerides(BaseEphemerides):
+    """Generate fast, deterministic stand-in ephemerides, without OpenOrb or the JPL ephemeris files.
+
+    The ephemerides are geocentric two-body ephemerides (see twoBody.py), so they have realistic
+    sky motions (for fitting Chebyshev polynomials or matching observations) but are only accurate
+    to arcseconds/arcminutes. The obscode is ignored, so no observatory files are needed either.
+    Useful for benchmarking and testing ChebyFits and LinearObs where pyoorb is not available.
+
+    Parameters
+    ----------
+    ephfile : str, optional
+        Ignored; accepted so that this class can stand in for PyOrbEphemerides.
+    """
+    def __init__(self, ephfile=None):
+        super(SyntheticEphemerides, self).__init__()
+
+    def generateEphemerides(self, times, timeScale='UTC', obscode=807, byObject=True,
+                            verbose=False, columns=None, dtype=np.float64):
+        """Calculate (geocentric two-body) ephemerides for all orbits at times `times`.
+
+        See PyOrbEphemerides.generateEphemerides for the format of the returned ephemerides.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Ephemeris times (MJD).
+        timeScale : str, optional
+            The timescale (UTC, UT1, TT, TAI) of the ephemeris times. Default = UTC.
+        obscode : int, optional
+            Ignored (the ephemerides are always geocentric).
+        byObject : boolean, optional
+            If True (default), resulting converted ephemerides are grouped by object.
+            If False, resulting converted ephemerides are grouped by time.
+        columns : list of str, optional
+            The ephemeris columns to return. Default None returns all columns (see _convertOorbEphs).
+        dtype : numpy.dtype, optional
+            The data type of the returned columns. Default float64 (float32 halves the memory use).
+        verbose: boolean, optional
+            If True, prints time required to calculate ephemerides. Default is False.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ephemeris values, organized as chosen by the user.
+        """
+        t = time.time()
+        ephTimes = self._convertTimes(times, timeScale=timeScale)
+        oorbEphs = twoBodyEphemerides(self.oorbElem, ephTimes, obscode=500)
+        ephs = self._convertOorbEphs(oorbEphs, byObject=byObject, columns=columns, dtype=dtype)
+        dt, t = dtime(t)
+        if verbose:
+            print("# Calculating synthetic ephemerides for %d objects over %d times required %f seconds"
+                  % (len(self.orbitObj), len(ephTimes), dt))
+        return ephs
+
+    def propagateOrbits(self, newEpoch):
+        """Propagate orbits from self.orbitObj.epoch to new epoch (MJD TT), using two-body motion.
+
+        Parameters
+        ----------
+        newEpoch : float
+            MJD TT time for new epoch.
+
+        Returns
+        -------
+        SyntheticEphemerides
+            New SyntheticEphemerides object, containing the propagated orbits.
+        """
+        newOorbElem = np.array(self.oorbElem, copy=True)
+        kep = newOorbElem[:, 7] == self.elemType['KEP']
+        # Only the mean anomaly (for KEP elements) and the epoch change.
+        meanMotion = np.sqrt(0.01720209895**2 / np.abs(newOorbElem[kep, 1])**3)
+        newOorbElem[kep, 6] += meanMotion * (newEpoch - newOorbElem[kep, 8])
+        newOorbElem[kep, 6] = np.remainder(newOorbElem[kep, 6], 2 * np.pi)
+        cart = newOorbElem[:, 7] == self.elemType['CART']
+        if cart.any():
+            # Cartesian states move along the orbit (via cometary elements, which are constant).
+            com = cartToCom(*[newOorbElem[cart, i] for i in range(1, 7)] + [newOorbElem[cart, 8]])
+            state = comToCart(*list(com) + [newEpoch])
+            newOorbElem[cart, 1:7] = np.column_stack(state)
+        newOorbElem[:, 8] = newEpoch
+        newOrbits = SyntheticEphemerides()
+        newOrbits.setOrbits(self._convertFromOorbElem(newOorbElem))
         return newOrbits
@@ -0,0 +1,358 @@
+from __future__ import print_function
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+__all__ = ['EphemerisCache']
+
+
+class EphemerisCache(object):
+    """Persistent on-disk cache of (oorb-format) ephemeris arrays, with least-recently-used eviction.
+
+    Each set of ephemerides is stored as a .npy file in cacheDir, named by a key built from the
+    orbits, times, observatory code, timescale and ephemeris file/mode (see makeKey).
+    The ephemerides of each orbit can also be looked up separately (see makeKeys, getOrbits and putOrbits),
+    so that changing one orbit (or splitting the orbits into different chunks) only requires the
+    ephemerides of the changed orbits to be generated again. These are stored in blocks: one .npy file
+    for each set of orbits added together for a time grid (in a subdirectory for the time grid), plus a
+    file of the keys of the orbits in the block, which is used to index the orbits in the blocks.
+    The ephemeris file is identified by its absolute path, size and modification time, so replacing
+    the file invalidates the cached ephemerides.
+    Cached arrays are returned memory-mapped (read-only) where possible, so only the parts which are used
+    are read. Files are written to a temporary file and then renamed into place, so the cache can be
+    shared between processes; the modification time of each file records its last use, and the least
+    recently used files (or blocks) are removed when the total size of the cache exceeds maxBytes.
+
+    Parameters
+    ----------
+    cacheDir : str
+        The directory for the cached files. Created if it does not exist.
+    maxBytes : int, optional
+        The maximum total size of the cached files. Default 10 GB.
+    """
+    def __init__(self, cacheDir, maxBytes=10 * 1024**3):
+        self.cacheDir = cacheDir
+        self.maxBytes = int(maxBytes)
+        self._makeDir(self.cacheDir)
+        # The total size of the cache, updated as files are added (None until first needed).
+        self._size = None
+        # For each time grid, the block and row of each orbit key, and the blocks which have been indexed.
+        self._index = {}
+
+    def _makeDir(self, dirname):
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(dirname):
+                    raise
+
+    def _ephfileId(self, ephfile):
+        # Identify the ephemeris file by its absolute path, size and modification time.
+        ephfile = os.path.abspath(ephfile)
+        try:
+            st = os.stat(ephfile)
+        except OSError:
+            return ephfile
+        return '%s|%d|%d' % (ephfile, st.st_size, st.st_mtime_ns)
+
+    def _commonHash(self, ephTimes, obscode, ephfile, ephMode):
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(ephTimes, dtype=np.float64).tobytes())
+        h.update(('%s|%s|%s' % (obscode, self._ephfileId(ephfile), ephMode)).encode('utf-8'))
+        return h
+
+    def makeKey(self, oorbElem, ephTimes, obscode, ephfile, ephMode='nbody'):
+        """Build the cache key for a set of ephemerides.
+
+        Parameters
+        ----------
+        oorbElem : numpy.ndarray
+            The orbital elements in OpenOrb format (see PyOrbEphemerides._convertToOorbElem).
+        ephTimes : numpy.ndarray
+            The ephemeris times (and timescales) in OpenOrb format (see PyOrbEphemerides._convertTimes).
+        obscode : int or str
+            The observatory code.
+        ephfile : str
+            The JPL ephemeris file used by OpenOrb.
+        ephMode : str, optional
+            The ephemeris generation mode. Default 'nbody'.
+
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        h = self._commonHash(ephTimes, obscode, ephfile, ephMode)
+        h.update(np.ascontiguousarray(oorbElem, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def makeKeys(self, oorbElem, ephTimes, obscode, ephfile, ephMode='nbody'):
+        """Build the cache key for the ephemerides of each orbit.
+
+        The keys do not depend on the orbit id (column 0 of oorbElem, the row number), so the same
+        orbit has the same key wherever it is in oorbElem. Each key is made of a hash of the times,
+        observatory code and ephemeris file/mode (the time grid), and a hash of the orbit.
+
+        Parameters
+        ----------
+        oorbElem : numpy.ndarray
+            The orbital elements in OpenOrb format (see PyOrbEphemerides._convertToOorbElem).
+        ephTimes : numpy.ndarray
+            The ephemeris times (and timescales) in OpenOrb format (see PyOrbEphemerides._convertTimes).
+        obscode : int or str
+            The observatory code.
+        ephfile : str
+            The JPL ephemeris file used by OpenOrb.
+        ephMode : str, optional
+            The ephemeris generation mode. Default 'nbody'.
+
+        Returns
+        -------
+        numpy.ndarray
+            The cache key for each orbit.
+        """
+        grid = self._commonHash(ephTimes, obscode, ephfile, ephMode).hexdigest()
+        keys = []
+        for row in np.ascontiguousarray(np.atleast_2d(oorbElem)[:, 1:], dtype=np.float64):
+            keys.append('%s_%s' % (grid, hashlib.sha1(row.tobytes()).hexdigest()))
+        return np.array(keys)
+
+    def _filename(self, key):
+        return os.path.join(self.cacheDir, key + '.npy')
+
+    def _gridDir(self, grid):
+        return os.path.join(self.cacheDir, grid)
+
+    def _gridIndex(self, grid, refresh=False):
+        # Return the index (orbit key -> (block, row)) of the blocks of a time grid, adding any blocks
+        # which have been written (by any process) since the index was last refreshed.
+        index = self._index.setdefault(grid, {'blocks': set(), 'rows': {}})
+        if not refresh:
+            return index
+        try:
+            filenames = os.listdir(self._gridDir(grid))
+        except OSError:
+            filenames = []
+        blocks = set(f[:-len('.keys.npy')] for f in filenames if f.endswith('.keys.npy'))
+        if not index['blocks'] <= blocks:
+            # Some blocks have been removed (evicted); rebuild the index.
+            index = self._index[grid] = {'blocks': set(), 'rows': {}}
+        for block in sorted(blocks - index['blocks']):
+            try:
+                orbitKeys = np.load(os.path.join(self._gridDir(grid), block + '.keys.npy'))
+            except (IOError, OSError, ValueError):
+                continue
+            for row, orbitKey in enumerate(orbitKeys.astype(str)):
+                index['rows'][orbitKey] = (block, row)
+            index['blocks'].add(block)
+        return index
+
+    def _forget(self, grid, block):
+        index = self._index.get(grid)
+        if index is not None and block in index['blocks']:
+            self._index[grid] = {'blocks': set(), 'rows': {}}
+
+    def get(self, key):
+        """Return the cached ephemerides for key, or None if these are not in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The cache key (see makeKey).
+
+        Returns
+        -------
+        numpy.ndarray or None
+            The (read-only, memory-mapped) cached ephemerides.
+        """
+        filename = self._filename(key)
+        try:
+            ephs = np.load(filename, mmap_mode='r')
+            # Mark as recently used.
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            # Not cached (or removed by another process, or incompletely written).
+            return None
+        return ephs
+
+    def getOrbits(self, keys):
+        """Return the cached ephemerides for each orbit, where these are in the cache.
+
+        Parameters
+        ----------
+        keys : numpy.ndarray
+            The cache key for each orbit (see makeKeys).
+
+        Returns
+        -------
+        numpy.ndarray or None, numpy.ndarray
+            The ephemerides for all orbits (with shape (orbit, time, column); the rows of orbits which were
+            not found are unset), or None if no orbits were found; and a boolean array which is True
+            for the orbits which were found. If all of the orbits are found, in order, in a single block,
+            this is the (read-only, memory-mapped) block itself.
+        """
+        found = np.zeros(len(keys), dtype=bool)
+        byGrid = {}
+        for i, key in enumerate(keys):
+            grid, orbitKey = key.split('_', 1)
+            byGrid.setdefault(grid, []).append((i, orbitKey))
+        locations = {}
+        for grid, orbitKeys in byGrid.items():
+            rows = self._gridIndex(grid)['rows']
+            if any(orbitKey not in rows for i, orbitKey in orbitKeys):
+                # Look for blocks added since the index was last refreshed.
+                rows = self._gridIndex(grid, refresh=True)['rows']
+            for i, orbitKey in orbitKeys:
+                if orbitKey in rows:
+                    block, row = rows[orbitKey]
+                    location = locations.setdefault((grid, block), ([], []))
+                    location[0].append(i)
+                    location[1].append(row)
+        oorbEphs = None
+        for (grid, block), (idx, rows) in locations.items():
+            filename = os.path.join(self._gridDir(grid), block + '.npy')
+            try:
+                ephs = np.load(filename, mmap_mode='r')
+                # Mark as recently used.
+                os.utime(filename, None)
+            except (IOError, OSError, ValueError):
+                # Removed by another process (or incompletely written).
+                self._forget(grid, block)
+                continue
+            if len(locations) == 1 and len(idx) == len(keys) and len(ephs) == len(keys) and \
+                    np.array_equal(rows, np.arange(len(keys))):
+                return ephs, np.ones(len(keys), dtype=bool)
+            if oorbEphs is None:
+                oorbEphs = np.empty((len(keys),) + ephs.shape[1:], dtype=ephs.dtype)
+            oorbEphs[idx] = ephs[rows]
+            found[idx] = True
+        return oorbEphs, found
+
+    def put(self, key, oorbEphs):
+        """Add ephemerides to the cache, then remove the least recently used files if necessary.
+
+        Parameters
+        ----------
+        key : str
+            The cache key (see makeKey).
+        oorbEphs : numpy.ndarray
+            The ephemerides to cache.
+        """
+        self._addSize(self._write(self._filename(key), oorbEphs))
+
+    def putOrbits(self, keys, oorbEphs):
+        """Add the ephemerides of a set of orbits to the cache (as a block for each time grid),
+        then remove the least recently used files if necessary.
+
+        Parameters
+        ----------
+        keys : numpy.ndarray
+            The cache key for each orbit (see makeKeys).
+        oorbEphs : numpy.ndarray
+            The ephemerides to cache, with shape (orbit, time, column).
+        """
+        keys = np.asarray(keys)
+        grids = np.array([key.split('_', 1)[0] for key in keys])
+        nbytes = 0
+        for grid in np.unique(grids):
+            rows = np.where(grids == grid)[0]
+            orbitKeys = np.array([key.split('_', 1)[1] for key in keys[rows]], dtype=bytes)
+            block = hashlib.sha1(orbitKeys.tobytes()).hexdigest()
+            gridDir = self._gridDir(grid)
+            self._makeDir(gridDir)
+            # Write the keys after the block, as these make the block visible to getOrbits.
+            nbytes += self._write(os.path.join(gridDir, block + '.npy'), oorbEphs[rows])
+            nbytes += self._write(os.path.join(gridDir, block + '.keys.npy'), orbitKeys)
+        self._addSize(nbytes)
+
+    def _write(self, filename, values):
+        # Write to a temporary file, then rename into place (so readers never see a partial file).
+        # Returns the number of bytes written.
+        fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(values))
+                nbytes = f.tell()
+            os.replace(tmpFile, filename)
+        except Exception:
+            if os.path.isfile(tmpFile):
+                os.remove(tmpFile)
+            raise
+        return nbytes
+
+    def _addSize(self, nbytes):
+        # Keep track of the size of the cache (only scanning the cache directory the first time, and
+        # when files need to be removed), and remove the least recently used files if necessary.
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self._entries())
+        else:
+            self._size += nbytes
+        if self._size > self.maxBytes:
+            self.evict()
+
+    def _entries(self):
+        # List the cached sets of ephemerides and blocks, as (last use, size, files).
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, name)
+            if name.endswith('.npy'):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, [path]))
+            elif os.path.isdir(path):
+                for blockName in os.listdir(path):
+                    if not blockName.endswith('.npy') or blockName.endswith('.keys.npy'):
+                        continue
+                    blockFile = os.path.join(path, blockName)
+                    keysFile = blockFile[:-len('.npy')] + '.keys.npy'
+                    try:
+                        st = os.stat(blockFile)
+                        size = st.st_size + os.path.getsize(keysFile)
+                    except OSError:
+                        continue
+                    # Remove the keys first, so the block is no longer used while it is removed.
+                    entries.append((st.st_mtime, size, [keysFile, blockFile]))
+        return entries
+
+    def evict(self, maxBytes=None):
+        """Remove the least recently used files (or blocks), until the cache is no larger than maxBytes.
+
+        Parameters
+        ----------
+        maxBytes : int, optional
+            The maximum size of the cache. Default None uses self.maxBytes.
+        """
+        if maxBytes is None:
+            maxBytes = self.maxBytes
+        entries = self._entries()
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, filenames in sorted(entries, key=lambda entry: entry[:2]):
+            if total <= maxBytes:
+                break
+            for filename in filenames:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    # Already removed by another process.
+                    pass
+            total -= size
+        self._size = total
+        # The blocks in the index may have been removed.
+        self._index = {}
+
+    def clear(self):
+        """Remove all cached files."""
+        self.evict(maxBytes=0)
+        for name in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, name)
+            if os.path.isdir(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    # Not empty (e.g. in use by another process).
+                    pass
@@ -27,12 +27,16 @@ class LinearObs(Orbits):
     Class to generate observations of a set of moving objects.
     Linear interpolation between gridpoint of ephemerides.
     Inherits from Orbits to read orbits.
+    The ephemerides are generated with PyOrbEphemerides, unless another ephemeris generator
+    (a BaseEphemerides instance) is provided with 'ephemerides'.
     """
     def __init__(self, orbitFile, delim=None, skiprows=None, ephfile=None,
-                 timescale='TAI', obscode=807):
+                 timescale='TAI', obscode=807, ephemerides=None):
         super(LinearObs, self).__init__()
         self.readOrbits(orbitfile=orbitFile, delim=None, skiprows=None)
-        self.ephems = PyOrbEphemerides(ephfile=ephfile)
+        if ephemerides is None:
+            ephemerides = PyOrbEphemerides(ephfile=ephfile)
+        self.ephems = ephemerides
         self.timescale = timescale
         self.timescaleNum = self.ephems.timeScales[timescale]
         self.obscode = obscode
@@ -69,8 +73,8 @@ class LinearObs(Orbits):
         This sets up the grid of ephemerides to linearly interpolate between.
         """
         self.ephems.setOrbits(sso)
-        oorbEphs = self.ephems._generateOorbEphs(self.ephTimes, obscode=self.obscode)
-        ephs = self.ephems._convertOorbEphs(oorbEphs, byObject=True)
+        ephs = self.ephems.generateEphemerides(self.ephTimes[:, 0], timeScale=self.timescale,
+                                               obscode=self.obscode, byObject=True)
         return ephs
 
     # Linear interpolation
@@ -0,0 +1,128 @@
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+__all__ = ['ObjIdIndex']
+
+
+class ObjIdIndex(object):
+    """A dictionary mapping (external) objIds to dense integer indexes.
+
+    objIds can be of any (sortable) type, and are often strings. Internally (e.g. for coefficient
+    storage, sorting and lookup in ChebyFits and ChebyValues) each objId is replaced by its dense
+    index: the order in which the objId was added to the dictionary. The external objIds are only
+    restored (with decode) when results are returned.
+    Lookups use a hash table (a pandas.Index), so take constant time per objId.
+
+    Parameters
+    ----------
+    objIds : numpy.ndarray, optional
+        The initial objIds (duplicates are only added once). Default None (an empty dictionary).
+    """
+    def __init__(self, objIds=None):
+        self.objIds = np.array([])
+        self._hash = pd.Index(self.objIds)
+        self._sorter = None
+        if objIds is not None:
+            self.add(objIds)
+
+    def __len__(self):
+        return len(self.objIds)
+
+    def _lookup(self, objIds):
+        # Find the dense indexes of objIds (-1 if not present), and whether they were found.
+        idx = self._hash.get_indexer(np.atleast_1d(np.asarray(objIds))).astype(np.int32)
+        return idx, idx >= 0
+
+    def add(self, objIds):
+        """Add objIds to the dictionary (if not already present), and return their dense indexes.
+
+        The indexes of objIds already in the dictionary do not change.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds.
+
+        Returns
+        -------
+        numpy.ndarray
+            The (int32) dense indexes of objIds.
+        """
+        uniqueIds, inverse = np.unique(np.atleast_1d(np.asarray(objIds)), return_inverse=True)
+        newIds = uniqueIds[~self.contains(uniqueIds)]
+        if len(newIds) > 0:
+            if len(self.objIds) == 0:
+                self.objIds = newIds
+            else:
+                self.objIds = np.concatenate([self.objIds, newIds])
+            if len(self.objIds) > np.iinfo(np.int32).max:
+                raise ValueError('Too many objIds (%d) for int32 indexes.' % len(self.objIds))
+            self._hash = pd.Index(self.objIds)
+            self._sorter = None
+        return self.encode(uniqueIds)[inverse.ravel()]
+
+    def contains(self, objIds):
+        """Check which objIds are in the dictionary.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean array, True where the objId is in the dictionary.
+        """
+        return self._lookup(objIds)[1]
+
+    def encode(self, objIds, strict=True):
+        """Find the dense indexes of objIds.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds.
+        strict : bool, optional
+            If True (default), raise a ValueError if any of the objIds are not in the dictionary.
+            If False, the index of these objIds is -1.
+
+        Returns
+        -------
+        numpy.ndarray
+            The (int32) dense indexes of objIds.
+        """
+        idx, found = self._lookup(objIds)
+        if strict and not found.all():
+            missing = np.atleast_1d(np.asarray(objIds))[~found]
+            raise ValueError('Did not find objIds %s in the objId dictionary.'
+                             % (' '.join([str(x) for x in missing[:10]])))
+        return idx
+
+    def decode(self, idx):
+        """Return the (external) objIds for dense indexes idx.
+
+        Parameters
+        ----------
+        idx : numpy.ndarray
+            The dense indexes.
+
+        Returns
+        -------
+        numpy.ndarray
+            The objIds.
+        """
+        return self.objIds[idx]
+
+    def sortedIndexes(self):
+        """Return the dense indexes of all objIds, in the (sorted) order of the objIds.
+
+        Returns
+        -------
+        numpy.ndarray
+            The (int32) dense indexes.
+        """
+        if self._sorter is None:
+            self._sorter = np.argsort(self.objIds, kind='mergesort').astype(np.int32)
+        return self._sorter
@@ -0,0 +1,351 @@
+"""Observatory site locations, used to move geocentric ephemerides to a topocentric position.
+"""
+from __future__ import print_function
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+__all__ = ['readObsCodes', 'toUT1', 'toTT', 'gmst', 'precessionMatrix', 'siteVectors',
+           'cachedSiteVectors', 'geocentricToTopocentric', 'cartesianToSky']
+
+# Equatorial radius of the Earth, in AU.
+EARTH_RADIUS_AU = 6378.137 / 149597870.700
+# Leap seconds: the MJD (UTC) at which each value of TAI-UTC (seconds) came into effect.
+LEAP_SECOND_MJD = np.array([41317, 41499, 41683, 42048, 42413, 42778, 43144, 43509, 43874, 44239, 44786,
+                            45151, 45516, 46247, 47161, 47892, 48257, 48804, 49169, 49534, 50083, 50630,
+                            51179, 53736, 54832, 56109, 57204, 57754])
+LEAP_SECONDS = np.arange(10., 10. + len(LEAP_SECOND_MJD))
+
+
+class _ArrayCache(object):
+    """A small, thread-safe, least-recently-used cache of (read-only) arrays, keyed on a time grid.
+
+    Parameters
+    ----------
+    maxSize : int, optional
+        The maximum number of entries. Default 32.
+    """
+    def __init__(self, maxSize=32):
+        self.maxSize = maxSize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def makeKey(times, *args):
+        """Build a key from a time grid and any other (hashable) arguments."""
+        times = np.ascontiguousarray(times, dtype=np.float64)
+        return (len(times), hashlib.sha1(times.tobytes()).hexdigest()) + tuple(args)
+
+    def get(self, key, compute):
+        """Return the cached value for key, calling compute() to create it if not present."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        for v in value:
+            v.setflags(write=False)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_siteCache = _ArrayCache()
+
+
+def toUT1(mjd, timeScale='UTC'):
+    """Convert times to (approximately) UT1.
+
+    UT1-UTC (always less than 0.9s) is ignored, as are leap seconds before 1972.
+
+    Parameters
+    ----------
+    mjd : float or numpy.ndarray
+        The times (MJD).
+    timeScale : str, optional
+        The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+
+    Returns
+    -------
+    float or numpy.ndarray
+        The times (MJD), in UT1.
+    """
+    mjd = np.asarray(mjd, dtype=np.float64)
+    if timeScale in ('UTC', 'UT1'):
+        return mjd
+    if timeScale == 'TT':
+        mjd = mjd - 32.184 / 86400.
+    elif timeScale != 'TAI':
+        raise ValueError('Unknown timescale %s: should be one of UTC, UT1, TT or TAI.' % timeScale)
+    return mjd - _leapSeconds(mjd) / 86400.
+
+
+def toTT(mjd, timeScale='UTC'):
+    """Convert times to TT.
+
+    UT1-UTC (always less than 0.9s) is ignored, as are leap seconds before 1972.
+
+    Parameters
+    ----------
+    mjd : float or numpy.ndarray
+        The times (MJD).
+    timeScale : str, optional
+        The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+
+    Returns
+    -------
+    float or numpy.ndarray
+        The times (MJD), in TT.
+    """
+    mjd = np.asarray(mjd, dtype=np.float64)
+    if timeScale == 'TT':
+        return mjd
+    if timeScale in ('UTC', 'UT1'):
+        mjd = mjd + _leapSeconds(mjd) / 86400.
+    elif timeScale != 'TAI':
+        raise ValueError('Unknown timescale %s: should be one of UTC, UT1, TT or TAI.' % timeScale)
+    return mjd + 32.184 / 86400.
+
+
+def _leapSeconds(mjd):
+    """Return TAI-UTC (seconds) at times mjd."""
+    idx = np.searchsorted(LEAP_SECOND_MJD, mjd, side='right') - 1
+    return np.where(idx >= 0, LEAP_SECONDS[np.maximum(idx, 0)], 0.)
+
+
+def readObsCodes(obsCodeFile=None):
+    """Read the MPC observatory code file used by OpenOrb.
+
+    Parameters
+    ----------
+    obsCodeFile : str, optional
+        The observatory code file. Default is '$OORB_DATA/OBSCODE.dat'.
+
+    Returns
+    -------
+    dict
+        Dictionary of (longitude (deg), rho * cos(phi'), rho * sin(phi')), keyed by observatory code.
+        Observatories without a fixed location on the Earth (e.g. spacecraft) are not included,
+        while the geocenter ('500') is.
+    """
+    if obsCodeFile is None:
+        obsCodeFile = os.path.join(os.getenv('OORB_DATA'), 'OBSCODE.dat')
+    obsCodes = {}
+    with open(obsCodeFile, 'r') as f:
+        for line in f:
+            code = line[0:3].strip()
+            try:
+                obsCodes[code] = (float(line[4:13]), float(line[13:21]), float(line[21:30]))
+            except ValueError:
+                # Header lines or sites without parallax constants.
+                continue
+    return obsCodes
+
+
+def gmst(mjd, timeScale='UTC'):
+    """Calculate the Greenwich mean sidereal time.
+
+    Parameters
+    ----------
+    mjd : float or numpy.ndarray
+        The times (MJD).
+    timeScale : str, optional
+        The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+
+    Returns
+    -------
+    float or numpy.ndarray
+        Greenwich mean sidereal time, in radians.
+    """
+    d = toUT1(mjd, timeScale=timeScale) - 51544.5
+    gmstDeg = 280.46061837 + 360.98564736629 * d
+    return np.radians(gmstDeg % 360.)
+
+
+def precessionMatrix(mjd):
+    """Calculate the (IAU 1976) precession matrix from J2000 to the mean equator of date.
+
+    Parameters
+    ----------
+    mjd : numpy.ndarray
+        The times (MJD TT; the difference from other timescales is not significant here).
+
+    Returns
+    -------
+    numpy.ndarray
+        The rotation matrices, with shape (len(mjd), 3, 3), such that r_date = P r_J2000.
+    """
+    t = (np.asarray(mjd, dtype=np.float64) - 51544.5) / 36525.
+    arcsec = np.pi / 180. / 3600.
+    zeta = (2306.2181 * t + 0.30188 * t**2 + 0.017998 * t**3) * arcsec
+    z = (2306.2181 * t + 1.09468 * t**2 + 0.018203 * t**3) * arcsec
+    theta = (2004.3109 * t - 0.42665 * t**2 - 0.041833 * t**3) * arcsec
+    cosZeta, sinZeta = np.cos(zeta), np.sin(zeta)
+    cosZ, sinZ = np.cos(z), np.sin(z)
+    cosTheta, sinTheta = np.cos(theta), np.sin(theta)
+    p = np.empty((len(t), 3, 3), dtype=np.float64)
+    p[:, 0, 0] = cosZeta * cosZ * cosTheta - sinZeta * sinZ
+    p[:, 0, 1] = -sinZeta * cosZ * cosTheta - cosZeta * sinZ
+    p[:, 0, 2] = -cosZ * sinTheta
+    p[:, 1, 0] = cosZeta * sinZ * cosTheta + sinZeta * cosZ
+    p[:, 1, 1] = -sinZeta * sinZ * cosTheta + cosZeta * cosZ
+    p[:, 1, 2] = -sinZ * sinTheta
+    p[:, 2, 0] = cosZeta * sinTheta
+    p[:, 2, 1] = -sinZeta * sinTheta
+    p[:, 2, 2] = cosTheta
+    return p
+
+
+def siteVectors(obsCode, times, timeScale='UTC', obsCodes=None):
+    """Calculate the geocentric equatorial position and velocity of an observatory.
+
+    The site location is rotated by the mean sidereal time and precessed to J2000 (the frame of the
+    OpenOrb ephemerides); nutation and polar motion are ignored, which changes the topocentric
+    correction by less than 0.01% of its size.
+
+    Parameters
+    ----------
+    obsCode : int or str
+        The observatory code.
+    times : numpy.ndarray
+        The times (MJD) at which to calculate the site position.
+    timeScale : str, optional
+        The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+    obsCodes : dict, optional
+        The observatory codes, as returned by readObsCodes. Default None reads these from disk.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The position (AU) and velocity (AU/day) of the site, each with shape (len(times), 3).
+    """
+    if obsCodes is None:
+        obsCodes = readObsCodes()
+    code = str(obsCode)
+    if code not in obsCodes:
+        raise ValueError('Observatory code %s does not have a fixed location on the Earth.' % code)
+    lon, rhoCos, rhoSin = obsCodes[code]
+    times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+    lst = gmst(times, timeScale=timeScale) + np.radians(lon)
+    # Sidereal rotation rate of the Earth, in radians per day.
+    omega = np.radians(360.98564736629)
+    pos = np.column_stack([rhoCos * np.cos(lst), rhoCos * np.sin(lst),
+                           np.zeros(len(lst)) + rhoSin]) * EARTH_RADIUS_AU
+    vel = np.column_stack([-omega * pos[:, 1], omega * pos[:, 0], np.zeros(len(lst))])
+    # Rotate from the mean equator of date to J2000.
+    p = precessionMatrix(times)
+    pos = np.einsum('nji,nj->ni', p, pos)
+    vel = np.einsum('nji,nj->ni', p, vel)
+    return pos, vel
+
+
+def cachedSiteVectors(obsCode, times, timeScale='UTC', obsCodes=None):
+    """Return the geocentric observatory positions and velocities, as siteVectors, from a cache.
+
+    The site vectors for each (observatory code, time grid) are calculated once per process
+    and shared by every caller (and every set of orbits) using the same times.
+    The returned arrays are read-only.
+
+    Parameters
+    ----------
+    obsCode : int or str
+        The observatory code.
+    times : numpy.ndarray
+        The times (MJD) at which to calculate the site position.
+    timeScale : str, optional
+        The timescale of the times (UTC, UT1, TT, TAI). Default UTC.
+    obsCodes : dict, optional
+        The observatory codes, as returned by readObsCodes. Default None reads these from disk
+        (if the site vectors are not already cached).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The position (AU) and velocity (AU/day) of the site, each with shape (len(times), 3).
+    """
+    times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+    key = _siteCache.makeKey(times, str(obsCode), timeScale)
+    return _siteCache.get(key, lambda: siteVectors(obsCode, times, timeScale=timeScale,
+                                                   obsCodes=obsCodes))
+
+
+def geocentricToTopocentric(delta, ra, dec, dradt, ddecdt, sitePos, siteVel):
+    """Move geocentric positions and sky motions to the position of an observatory.
+
+    The geocentric radial velocity is not known and is taken to be zero; its effect on the
+    topocentric sky motion is proportional to the (small) parallax angle.
+
+    Parameters
+    ----------
+    delta : numpy.ndarray
+        Geocentric distances (AU), with shape (nObj, nTimes).
+    ra : numpy.ndarray
+        Geocentric RA (deg), with shape (nObj, nTimes).
+    dec : numpy.ndarray
+        Geocentric Dec (deg), with shape (nObj, nTimes).
+    dradt : numpy.ndarray
+        Geocentric RA sky motion (deg/day, including the cos(dec) factor), with shape (nObj, nTimes).
+    ddecdt : numpy.ndarray
+        Geocentric Dec sky motion (deg/day), with shape (nObj, nTimes).
+    sitePos : numpy.ndarray
+        Site geocentric position (AU), with shape (nTimes, 3).
+    siteVel : numpy.ndarray
+        Site geocentric velocity (AU/day), with shape (nTimes, 3).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        The topocentric delta, ra, dec, dradt and ddecdt, in the same units as the input.
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cosRa = np.cos(ra)
+    sinRa = np.sin(ra)
+    cosDec = np.cos(dec)
+    sinDec = np.sin(dec)
+    # Unit vector towards the object, and unit vectors in the direction of increasing RA and Dec.
+    u = np.stack([cosDec * cosRa, cosDec * sinRa, sinDec])
+    eRa = np.stack([-sinRa, cosRa, np.zeros_like(ra)])
+    eDec = np.stack([-sinDec * cosRa, -sinDec * sinRa, cosDec])
+    pos = delta * u - sitePos.T[:, np.newaxis, :]
+    vel = (delta * (np.radians(dradt) * eRa + np.radians(ddecdt) * eDec)
+           - siteVel.T[:, np.newaxis, :])
+    return cartesianToSky(pos, vel)
+
+
+def cartesianToSky(pos, vel):
+    """Convert observer-centered equatorial positions and velocities to sky positions and motions.
+
+    Parameters
+    ----------
+    pos : numpy.ndarray
+        Position of the object relative to the observer (AU), with the x/y/z axis first.
+    vel : numpy.ndarray
+        Velocity of the object relative to the observer (AU/day), with the x/y/z axis first.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        The distance (AU), ra and dec (deg) and the ra (including the cos(dec) factor) and dec
+        sky motions (deg/day).
+    """
+    delta = np.sqrt(np.sum(pos**2, axis=0))
+    ra = np.arctan2(pos[1], pos[0])
+    dec = np.arcsin(pos[2] / delta)
+    # Project the velocity onto the RA and Dec directions.
+    cosRa = np.cos(ra)
+    sinRa = np.sin(ra)
+    sinDec = np.sin(dec)
+    vRa = -sinRa * vel[0] + cosRa * vel[1]
+    vDec = -sinDec * cosRa * vel[0] - sinDec * sinRa * vel[1] + np.cos(dec) * vel[2]
+    dradt = np.degrees(vRa / delta)
+    ddecdt = np.degrees(vDec / delta)
+    return delta, np.degrees(ra) % 360., np.degrees(dec), dradt, ddecdt
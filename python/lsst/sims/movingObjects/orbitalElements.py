@@ -0,0 +1,437 @@
+"""Vectorized conversions between cometary (COM), Keplerian (KEP) and cartesian (CART) orbital elements.
+
+All conversions are two-body (heliocentric) and work on whole arrays of orbits at once. The units are those
+of the Orbits columns: distances in AU, times (epoch, tPeri) in MJD, angles in degrees, and cartesian
+positions (x, y, z) and velocities (xdot, ydot, zdot) in AU and AU/day, in the J2000 ecliptic frame.
+Elliptic, parabolic and hyperbolic orbits are all handled, except that parabolic orbits have no
+Keplerian representation. Hyperbolic orbits have negative semi-major axes.
+"""
+from __future__ import print_function, division
+import numpy as np
+
+__all__ = ['solveKepler', 'solveKeplerHyperbolic', 'comToKep', 'kepToCom', 'comToCart', 'cartToCom',
+           'kepToCart', 'cartToKep', 'convertElements', 'semiMajorAxis']
+
+# The element columns of each orbit format.
+ELEMENT_COLUMNS = {'COM': ['q', 'e', 'inc', 'Omega', 'argPeri', 'tPeri'],
+                   'KEP': ['a', 'e', 'inc', 'Omega', 'argPeri', 'meanAnomaly'],
+                   'CART': ['x', 'y', 'z', 'xdot', 'ydot', 'zdot']}
+# Eccentricities closer than this to 1 are treated as parabolic.
+PARABOLIC_TOLERANCE = 1e-10
+# Gaussian gravitational constant (squared = GM of the Sun, in AU^3/day^2).
+GM_SUN = 0.01720209895**2
+
+
+def solveKepler(meanAnomaly, e, tol=1e-12, maxIter=50):
+    """Solve Kepler's equation (M = E - e sin(E)) for the eccentric anomaly of elliptical orbits.
+
+    Parameters
+    ----------
+    meanAnomaly : numpy.ndarray
+        The mean anomaly (radians).
+    e : numpy.ndarray
+        The eccentricity (< 1), broadcastable against meanAnomaly.
+    tol : float, optional
+        The convergence tolerance (radians). Default 1e-12.
+    maxIter : int, optional
+        The maximum number of Newton-Raphson iterations. Default 50.
+
+    Returns
+    -------
+    numpy.ndarray
+        The eccentric anomaly (radians).
+    """
+    meanAnomaly, e = np.broadcast_arrays(np.asarray(meanAnomaly, dtype=np.float64), e)
+    # Reduce to -pi < M < pi, where the starting value below converges reliably.
+    m = np.remainder(meanAnomaly + np.pi, 2 * np.pi) - np.pi
+    bigE = np.where(e > 0.8, np.pi * np.sign(m), m + e * np.sin(m))
+    for i in range(maxIter):
+        dE = (bigE - e * np.sin(bigE) - m) / (1. - e * np.cos(bigE))
+        bigE -= dE
+        if np.all(np.abs(dE) < tol):
+            break
+    return bigE + (meanAnomaly - m)
+
+
+def solveKeplerHyperbolic(meanAnomaly, e, tol=1e-12, maxIter=100):
+    """Solve the hyperbolic Kepler's equation (M = e sinh(F) - F) for the hyperbolic anomaly.
+
+    Parameters
+    ----------
+    meanAnomaly : numpy.ndarray
+        The hyperbolic mean anomaly.
+    e : numpy.ndarray
+        The eccentricity (> 1), broadcastable against meanAnomaly.
+    tol : float, optional
+        The convergence tolerance. Default 1e-12.
+    maxIter : int, optional
+        The maximum number of Newton-Raphson iterations. Default 100.
+
+    Returns
+    -------
+    numpy.ndarray
+        The hyperbolic anomaly.
+    """
+    meanAnomaly, e = np.broadcast_arrays(np.asarray(meanAnomaly, dtype=np.float64), e)
+    bigF = np.arcsinh(meanAnomaly / e)
+    for i in range(maxIter):
+        dF = (e * np.sinh(bigF) - bigF - meanAnomaly) / (e * np.cosh(bigF) - 1.)
+        bigF -= dF
+        if np.all(np.abs(dF) < tol * np.maximum(1., np.abs(bigF))):
+            break
+    return bigF
+
+
+def _conicStates(q, e, inc, Omega, argPeri, tPeri, times, gm=GM_SUN):
+    """Calculate positions and velocities on conic orbits, in the frame of the orbital elements.
+
+    Parameters
+    ----------
+    q, e, inc, Omega, argPeri, tPeri : numpy.ndarray
+        Perihelion distance (AU), eccentricity, angles (radians) and time of perihelion (MJD),
+        each with shape (nObj, 1).
+    times : numpy.ndarray
+        The times (MJD), with shape (nObj, nTimes) or (1, nTimes).
+    gm : float, optional
+        The gravitational parameter (AU^3/day^2). Default is the Sun.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        Positions (AU) and velocities (AU/day), each with shape (3, nObj, nTimes).
+    """
+    dt = times - tPeri
+    shape = np.broadcast(dt, e).shape
+    nu = np.zeros(shape)
+    r = np.zeros(shape)
+    e = np.broadcast_to(e, shape)
+    q = np.broadcast_to(q, shape)
+    dt = np.broadcast_to(dt, shape)
+    elliptic = e < 1. - 1e-10
+    hyperbolic = e > 1. + 1e-10
+    parabolic = ~(elliptic | hyperbolic)
+    if elliptic.any():
+        a = q[elliptic] / (1. - e[elliptic])
+        ee = e[elliptic]
+        bigE = solveKepler(np.sqrt(gm / a**3) * dt[elliptic], ee)
+        nu[elliptic] = 2. * np.arctan2(np.sqrt(1. + ee) * np.sin(bigE / 2.),
+                                       np.sqrt(1. - ee) * np.cos(bigE / 2.))
+        r[elliptic] = a * (1. - ee * np.cos(bigE))
+    if hyperbolic.any():
+        a = q[hyperbolic] / (e[hyperbolic] - 1.)
+        ee = e[hyperbolic]
+        bigF = solveKeplerHyperbolic(np.sqrt(gm / a**3) * dt[hyperbolic], ee)
+        nu[hyperbolic] = 2. * np.arctan2(np.sqrt(ee + 1.) * np.sinh(bigF / 2.),
+                                         np.sqrt(ee - 1.) * np.cosh(bigF / 2.))
+        r[hyperbolic] = a * (ee * np.cosh(bigF) - 1.)
+    if parabolic.any():
+        # Barker's equation, solved analytically.
+        qq = q[parabolic]
+        w = 3. * np.sqrt(gm / (2. * qq**3)) * dt[parabolic]
+        y = np.cbrt(w / 2. + np.sqrt(w**2 / 4. + 1.))
+        d = y - 1. / y
+        nu[parabolic] = 2. * np.arctan(d)
+        r[parabolic] = qq * (1. + d**2)
+    # Position and velocity in the orbital plane, with x towards perihelion.
+    h = np.sqrt(gm * q * (1. + e))
+    cosNu = np.cos(nu)
+    sinNu = np.sin(nu)
+    x = r * cosNu
+    y = r * sinNu
+    vx = -gm / h * sinNu
+    vy = gm / h * (e + cosNu)
+    # Rotate to the reference frame.
+    cosO, sinO = np.cos(Omega), np.sin(Omega)
+    cosW, sinW = np.cos(argPeri), np.sin(argPeri)
+    cosI, sinI = np.cos(inc), np.sin(inc)
+    px = cosO * cosW - sinO * sinW * cosI
+    py = sinO * cosW + cosO * sinW * cosI
+    pz = sinW * sinI
+    qx = -cosO * sinW - sinO * cosW * cosI
+    qy = -sinO * sinW + cosO * cosW * cosI
+    qz = cosW * sinI
+    pos = np.stack([px * x + qx * y, py * x + qy * y, pz * x + qz * y])
+    vel = np.stack([px * vx + qx * vy, py * vx + qy * vy, pz * vx + qz * vy])
+    return pos, vel
+
+
+def _meanMotion(a):
+    """Mean motion (radians/day) for semi-major axis a (AU)."""
+    return np.sqrt(GM_SUN / np.abs(a)**3)
+
+
+def comToKep(q, e, tPeri, epoch):
+    """Convert cometary elements to Keplerian elements.
+
+    The inclination, node and argument of perihelion are the same in both formats.
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        Perihelion distance (AU).
+    e : numpy.ndarray
+        Eccentricity.
+    tPeri : numpy.ndarray
+        Time of perihelion (MJD).
+    epoch : numpy.ndarray
+        Epoch of the elements (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The semi-major axis (AU; negative for hyperbolic orbits) and mean anomaly at epoch (degrees;
+        wrapped to 0-360 for elliptic orbits).
+    """
+    q, e, tPeri, epoch = [np.asarray(x, dtype=np.float64) for x in (q, e, tPeri, epoch)]
+    if (np.abs(e - 1.) <= PARABOLIC_TOLERANCE).any():
+        raise ValueError('Parabolic orbits cannot be converted to Keplerian elements.')
+    a = q / (1. - e)
+    meanAnomaly = np.degrees(_meanMotion(a) * (epoch - tPeri))
+    meanAnomaly = np.where(e < 1., np.remainder(meanAnomaly, 360.), meanAnomaly)
+    return a, meanAnomaly
+
+
+def kepToCom(a, e, meanAnomaly, epoch):
+    """Convert Keplerian elements to cometary elements.
+
+    Parameters
+    ----------
+    a : numpy.ndarray
+        Semi-major axis (AU). The sign is ignored for hyperbolic orbits.
+    e : numpy.ndarray
+        Eccentricity.
+    meanAnomaly : numpy.ndarray
+        Mean anomaly at epoch (degrees).
+    epoch : numpy.ndarray
+        Epoch of the elements (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The perihelion distance (AU) and time of perihelion (MJD).
+    """
+    a, e, meanAnomaly, epoch = [np.asarray(x, dtype=np.float64) for x in (a, e, meanAnomaly, epoch)]
+    q = np.abs(a * (1. - e))
+    tPeri = epoch - np.radians(meanAnomaly) / _meanMotion(a)
+    return q, tPeri
+
+
+def comToCart(q, e, inc, Omega, argPeri, tPeri, epoch):
+    """Convert cometary elements to cartesian positions and velocities at epoch.
+
+    Parameters
+    ----------
+    q, e, inc, Omega, argPeri, tPeri : numpy.ndarray
+        The cometary elements (AU, -, degrees, degrees, degrees, MJD).
+    epoch : numpy.ndarray
+        Epoch of the elements (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        x, y, z (AU) and xdot, ydot, zdot (AU/day), heliocentric in the J2000 ecliptic frame.
+    """
+    elements = (q, e, inc, Omega, argPeri, tPeri, epoch)
+    q, e, inc, Omega, argPeri, tPeri, epoch = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in elements])
+    col = np.newaxis
+    pos, vel = _conicStates(q[:, col], e[:, col], np.radians(inc)[:, col], np.radians(Omega)[:, col],
+                            np.radians(argPeri)[:, col], tPeri[:, col], epoch[:, col])
+    return pos[0, :, 0], pos[1, :, 0], pos[2, :, 0], vel[0, :, 0], vel[1, :, 0], vel[2, :, 0]
+
+
+def cartToCom(x, y, z, xdot, ydot, zdot, epoch):
+    """Convert cartesian positions and velocities to cometary elements.
+
+    For (near) circular orbits the argument of perihelion is set to zero (perihelion at the node), and for
+    (near) zero inclination orbits the longitude of the node is set to zero.
+
+    Parameters
+    ----------
+    x, y, z : numpy.ndarray
+        Heliocentric position (AU), in the J2000 ecliptic frame.
+    xdot, ydot, zdot : numpy.ndarray
+        Heliocentric velocity (AU/day), in the J2000 ecliptic frame.
+    epoch : numpy.ndarray
+        Epoch of the positions and velocities (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        q (AU), e, inc, Omega, argPeri (degrees) and tPeri (MJD).
+    """
+    arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=np.float64))
+                                   for v in (x, y, z, xdot, ydot, zdot, epoch)])
+    pos = np.stack(arrays[0:3])
+    vel = np.stack(arrays[3:6])
+    epoch = arrays[6]
+    r = np.sqrt(np.sum(pos**2, axis=0))
+    h = np.cross(pos, vel, axis=0)
+    hMag = np.sqrt(np.sum(h**2, axis=0))
+    hHat = h / hMag
+    inc = np.arccos(np.clip(hHat[2], -1., 1.))
+    # Ascending node direction (the x axis if the orbit is in the ecliptic).
+    node = np.stack([-h[1], h[0], np.zeros_like(r)])
+    nodeMag = np.sqrt(np.sum(node**2, axis=0))
+    inPlane = nodeMag <= 1e-12 * hMag
+    nodeHat = np.where(inPlane, np.array([1., 0., 0.])[:, np.newaxis], node / np.where(inPlane, 1., nodeMag))
+    Omega = np.where(inPlane, 0., np.arctan2(h[0], -h[1]))
+    # Eccentricity vector (pointing to perihelion; along the node for circular orbits).
+    eVec = (np.sum(vel**2, axis=0) - GM_SUN / r) * pos - np.sum(pos * vel, axis=0) * vel
+    eVec /= GM_SUN
+    e = np.sqrt(np.sum(eVec**2, axis=0))
+    circular = e <= 1e-12
+    periHat = np.where(circular, nodeHat, eVec / np.where(circular, 1., e))
+
+    def angle(u, v):
+        # The angle from unit vector u to vector v, measured around hHat.
+        return np.arctan2(np.sum(np.cross(u, v, axis=0) * hHat, axis=0), np.sum(u * v, axis=0))
+
+    argPeri = np.where(circular, 0., angle(nodeHat, periHat))
+    nu = angle(periHat, pos)
+    q = hMag**2 / GM_SUN / (1. + e)
+    # Time since perihelion.
+    dt = np.zeros_like(r)
+    elliptic = e < 1. - PARABOLIC_TOLERANCE
+    hyperbolic = e > 1. + PARABOLIC_TOLERANCE
+    parabolic = ~(elliptic | hyperbolic)
+    if elliptic.any():
+        ee = e[elliptic]
+        bigE = 2. * np.arctan2(np.sqrt(1. - ee) * np.sin(nu[elliptic] / 2.),
+                               np.sqrt(1. + ee) * np.cos(nu[elliptic] / 2.))
+        dt[elliptic] = (bigE - ee * np.sin(bigE)) / _meanMotion(q[elliptic] / (1. - ee))
+    if hyperbolic.any():
+        ee = e[hyperbolic]
+        bigF = 2. * np.arctanh(np.sqrt((ee - 1.) / (ee + 1.)) * np.tan(nu[hyperbolic] / 2.))
+        dt[hyperbolic] = (ee * np.sinh(bigF) - bigF) / _meanMotion(q[hyperbolic] / (ee - 1.))
+    if parabolic.any():
+        # Barker's equation.
+        d = np.tan(nu[parabolic] / 2.)
+        dt[parabolic] = np.sqrt(2. * q[parabolic]**3 / GM_SUN) * (d + d**3 / 3.)
+    return (q, e, np.degrees(inc), np.remainder(np.degrees(Omega), 360.),
+            np.remainder(np.degrees(argPeri), 360.), epoch - dt)
+
+
+def kepToCart(a, e, inc, Omega, argPeri, meanAnomaly, epoch):
+    """Convert Keplerian elements to cartesian positions and velocities at epoch.
+
+    Parameters
+    ----------
+    a, e, inc, Omega, argPeri, meanAnomaly : numpy.ndarray
+        The Keplerian elements (AU, -, degrees, degrees, degrees, degrees).
+    epoch : numpy.ndarray
+        Epoch of the elements (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        x, y, z (AU) and xdot, ydot, zdot (AU/day), heliocentric in the J2000 ecliptic frame.
+    """
+    q, tPeri = kepToCom(a, e, meanAnomaly, epoch)
+    return comToCart(q, e, inc, Omega, argPeri, tPeri, epoch)
+
+
+def cartToKep(x, y, z, xdot, ydot, zdot, epoch):
+    """Convert cartesian positions and velocities to Keplerian elements.
+
+    Parameters
+    ----------
+    x, y, z : numpy.ndarray
+        Heliocentric position (AU), in the J2000 ecliptic frame.
+    xdot, ydot, zdot : numpy.ndarray
+        Heliocentric velocity (AU/day), in the J2000 ecliptic frame.
+    epoch : numpy.ndarray
+        Epoch of the positions and velocities (MJD).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        a (AU), e, inc, Omega, argPeri and meanAnomaly (degrees).
+    """
+    q, e, inc, Omega, argPeri, tPeri = cartToCom(x, y, z, xdot, ydot, zdot, epoch)
+    a, meanAnomaly = comToKep(q, e, tPeri, epoch)
+    return a, e, inc, Omega, argPeri, meanAnomaly
+
+
+def convertElements(orbits, fromFormat, toFormat):
+    """Convert the orbital elements in a dataframe of orbits to another format.
+
+    Parameters
+    ----------
+    orbits : pandas.DataFrame
+        The orbits, containing the element columns of fromFormat and 'epoch'.
+    fromFormat : str
+        The current orbit format (COM, KEP or CART).
+    toFormat : str
+        The new orbit format (COM, KEP or CART).
+
+    Returns
+    -------
+    pandas.DataFrame
+        A new dataframe, with the element columns of fromFormat replaced by those of toFormat
+        (in the same position); all other columns are copied.
+    """
+    for fmt in (fromFormat, toFormat):
+        if fmt not in ELEMENT_COLUMNS:
+            raise ValueError('Unknown orbit format %s: should be one of %s'
+                             % (fmt, list(ELEMENT_COLUMNS)))
+    newOrbits = orbits.copy()
+    if fromFormat == toFormat:
+        return newOrbits
+    elements = [orbits[col].values for col in ELEMENT_COLUMNS[fromFormat]]
+    epoch = orbits['epoch'].values
+    # Go via cometary elements, which represent all types of orbit.
+    if fromFormat == 'KEP':
+        q, tPeri = kepToCom(elements[0], elements[1], elements[5], epoch)
+        com = [q, elements[1], elements[2], elements[3], elements[4], tPeri]
+    elif fromFormat == 'CART':
+        com = list(cartToCom(*(elements + [epoch])))
+    else:
+        com = elements
+    if toFormat == 'KEP':
+        a, meanAnomaly = comToKep(com[0], com[1], com[5], epoch)
+        newElements = [a, com[1], com[2], com[3], com[4], meanAnomaly]
+    elif toFormat == 'CART':
+        newElements = list(comToCart(*(com + [epoch])))
+    else:
+        newElements = com
+    columns = []
+    for col in newOrbits.columns:
+        if col in ELEMENT_COLUMNS[fromFormat]:
+            col = ELEMENT_COLUMNS[toFormat][ELEMENT_COLUMNS[fromFormat].index(col)]
+        columns.append(col)
+    newOrbits.columns = columns
+    for col, values in zip(ELEMENT_COLUMNS[toFormat], newElements):
+        newOrbits[col] = values
+    return newOrbits
+
+
+def semiMajorAxis(orbits):
+    """Calculate the semi-major axes of a dataframe of orbits, in any orbit format.
+
+    Parameters
+    ----------
+    orbits : pandas.DataFrame
+        The orbits, containing either 'a', 'q' and 'e', or 'x', 'y', 'z', 'xdot', 'ydot', 'zdot'.
+
+    Returns
+    -------
+    numpy.ndarray
+        The semi-major axis (AU; negative for hyperbolic orbits, infinite for parabolic orbits).
+    """
+    if 'a' in orbits:
+        return np.asarray(orbits['a'], dtype=np.float64)
+    if 'q' in orbits and 'e' in orbits:
+        q = np.asarray(orbits['q'], dtype=np.float64)
+        e = np.asarray(orbits['e'], dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            return q / (1. - e)
+    if all(col in orbits for col in ELEMENT_COLUMNS['CART']):
+        pos, vel = [np.array([orbits[col] for col in cols], dtype=np.float64)
+                    for cols in (ELEMENT_COLUMNS['CART'][:3], ELEMENT_COLUMNS['CART'][3:])]
+        # Vis-viva: 1/a = 2/r - v^2/GM.
+        r = np.sqrt((pos**2).sum(axis=0))
+        v2 = (vel**2).sum(axis=0)
+        with np.errstate(divide='ignore'):
+            return 1. / (2. / r - v2 / GM_SUN)
+    raise ValueError('Need either a, q (plus e) or x, y, z, xdot, ydot, zdot in orbit data frame.')
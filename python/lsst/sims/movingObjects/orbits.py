@@ -1,8 +1,110 @@
+import os
+import io
+import json
 import warnings
+import hashlib
+import multiprocessing
+import tempfile
+import zipfile
 import numpy as np
 import pandas as pd
+from lsst.utils import getPackageDir
+from .orbitalElements import convertElements, semiMajorAxis
 
-__all__ = ['Orbits']
+__all__ = ['Orbits', 'OrbitsView', 'OrbitFileReader']
+
+
+# Version of the binary (columnar) orbit format written by Orbits.writeOrbitsBinary.
+BINARY_FORMAT_VERSION = 1
+BINARY_METADATA_FILE = 'orbits.json'
+
+# Constants for the SplitMix64 generator (used for the counter-based random numbers in assignSed)
+# and for FNV-1a hashing of string objIds.
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def _codeDtype(nValues):
+    """The smallest signed integer type which can index nValues values."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if nValues <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+def _splitMix64(x):
+    """Apply the SplitMix64 mixing function to (an array of) uint64 values."""
+    with np.errstate(over='ignore'):
+        z = np.asarray(x, dtype=np.uint64) + _GOLDEN
+        z = (z ^ (z >> np.uint64(30))) * _MIX1
+        z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+def _objIdKeys(objIds):
+    """Convert objIds to uint64 keys: integer values are used directly, strings are FNV-1a hashed."""
+    objIds = np.asarray(objIds)
+    if objIds.dtype.kind == 'f' and np.all(np.floor(objIds) == objIds):
+        objIds = objIds.astype(np.int64)
+    if objIds.dtype.kind in ('i', 'u', 'b'):
+        return objIds.astype(np.int64).view(np.uint64)
+    if objIds.dtype.kind != 'S':
+        objIds = np.char.encode(objIds.astype(str), 'utf-8')
+    objIds = np.ascontiguousarray(objIds)
+    nChars = np.char.str_len(objIds)
+    chars = objIds.view(np.uint8).reshape(len(objIds), -1)
+    keys = np.zeros(len(objIds), dtype=np.uint64) + _FNV_OFFSET
+    with np.errstate(over='ignore'):
+        for i in range(chars.shape[1]):
+            hashed = (keys ^ chars[:, i].astype(np.uint64)) * _FNV_PRIME
+            keys = np.where(i < nChars, hashed, keys)
+    return keys
+
+
+def _counterUniform(seed, keys, counter=0):
+    """Uniform random numbers in [0, 1), which depend only on the seed, the key and the counter."""
+    state = _splitMix64(_splitMix64(np.uint64(seed)) ^ keys)
+    with np.errstate(over='ignore'):
+        bits = _splitMix64(state + np.uint64(counter) * _GOLDEN)
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def _parseOrbitText(buf, delim=None, columns=None):
+    """Parse (part of) a text orbit file with pandas.
+
+    If columns is None, buf should start with the header row and only the header is parsed
+    (returning an empty dataframe); otherwise buf contains only orbit rows, with these columns.
+    """
+    if columns is None:
+        kwargs = {'nrows': 0}
+    else:
+        kwargs = {'header': None, 'names': columns}
+    if delim is None:
+        return pd.read_table(buf, delim_whitespace=True, **kwargs)
+    return pd.read_table(buf, sep=delim, **kwargs)
+
+
+def _readOrbitHeader(orbitfile, delim=None, skiprows=None):
+    """Return the column names of a text orbit file, and the byte offset of its first orbit."""
+    with open(orbitfile, 'rb') as f:
+        for i in range(0 if skiprows is None else int(skiprows)):
+            f.readline()
+        header = f.readline()
+        dataStart = f.tell()
+    columns = _parseOrbitText(io.BytesIO(header), delim).columns.values.tolist()
+    return columns, dataStart
+
+
+def _parseOrbitBytesWorker(args):
+    """Parse the orbits between two byte offsets of a text orbit file, in a worker process."""
+    orbitfile, delim, columns, start, end = args
+    with open(orbitfile, 'rb') as f:
+        f.seek(start)
+        buf = io.BytesIO(f.read(end - start))
+    return _parseOrbitText(buf, delim, columns)
 
 
 class Orbits(object):
@@ -11,6 +113,8 @@ class Orbits(object):
     def __init__(self):
         self.orbits = None
         self.format = None
+        # Hash index from objId to row (see objIdRows), built when first needed.
+        self._rowIndex = None
 
         # Specify the required columns/values in the self.orbits dataframe.
         # Which columns are required depends on self.format.
@@ -19,20 +123,119 @@ class Orbits(object):
                                 'tPeri', 'epoch', 'H', 'g', 'sed_filename']
         self.dataCols['KEP'] = ['objId', 'a', 'e', 'inc', 'Omega', 'argPeri',
                                 'meanAnomaly', 'epoch', 'H', 'g', 'sed_filename']
+        self.dataCols['CART'] = ['objId', 'x', 'y', 'z', 'xdot', 'ydot',
+                                 'zdot', 'epoch', 'H', 'g', 'sed_filename']
 
     def __len__(self):
         return len(self.orbits)
 
     def __getitem__(self, i):
-        orb = Orbits()
-        orb.setOrbits(self.orbits.iloc[i])
-        return orb
+        # A single integer index returns a view containing just that orbit (not a Series).
+        if isinstance(i, (int, np.integer)):
+            if i < 0:
+                i += len(self)
+            if i < 0 or i >= len(self):
+                raise IndexError('Orbit index %d out of range for %d orbits.' % (i, len(self)))
+            i = slice(i, i + 1)
+        return OrbitsView(self, i)
 
     def __iter__(self):
-        for i, orbit in self.orbits.iterrows():
-            orb = Orbits()
-            orb.setOrbits(orbit)
-            yield orb
+        for i in range(len(self)):
+            yield OrbitsView(self, slice(i, i + 1))
+
+    def iterChunks(self, chunkSize):
+        """Iterate through the orbits in chunks of (up to) chunkSize orbits.
+
+        Parameters
+        ----------
+        chunkSize : int
+            The number of orbits in each chunk.
+
+        Returns
+        -------
+        generator of OrbitsView
+            Views of consecutive chunks of the orbits.
+        """
+        chunkSize = int(chunkSize)
+        if chunkSize < 1:
+            raise ValueError('chunkSize must be at least 1 (got %d).' % chunkSize)
+        for start in range(0, len(self), chunkSize):
+            yield OrbitsView(self, slice(start, start + chunkSize))
+
+    def column(self, name):
+        """Return the values of one column of the orbits, as a numpy array.
+
+        For numeric columns this is (usually) a view of the underlying dataframe, not a copy.
+
+        Parameters
+        ----------
+        name : str
+            The column name (e.g. 'objId', 'q', 'epoch').
+
+        Returns
+        -------
+        numpy.ndarray
+            The column values.
+        """
+        return self.orbits[name].values
+
+    def objIdRows(self, objIds, strict=True):
+        """Find the (positional) rows of the orbits with objIds.
+
+        Uses a hash index from objId to row, which is built on first use (and rebuilt if the orbits are
+        replaced, but not if the objIds are modified in place), so each lookup takes constant time.
+        If there are duplicate objIds, the first row with each objId is used.
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds.
+        strict : bool, optional
+            If True (default), raise a ValueError if any of the objIds are not in the orbits.
+            If False, the row of these objIds is -1.
+
+        Returns
+        -------
+        numpy.ndarray
+            The row of each objId, in the order of objIds.
+        """
+        rowIndex = self._rowIndex
+        if rowIndex is None or rowIndex[0] is not self._orbitsKey():
+            ids = pd.Index(self.column('objId'))
+            if ids.is_unique:
+                rowIndex = (self._orbitsKey(), ids, None)
+            else:
+                first = ~ids.duplicated(keep='first')
+                rowIndex = (self._orbitsKey(), ids[first], np.where(first)[0])
+            self._rowIndex = rowIndex
+        rows = rowIndex[1].get_indexer(np.atleast_1d(np.asarray(objIds)))
+        found = rows >= 0
+        if strict and not found.all():
+            missing = np.atleast_1d(np.asarray(objIds))[~found]
+            raise ValueError('Did not find objIds %s in the orbits.'
+                             % (' '.join([str(x) for x in missing[:10]])))
+        if rowIndex[2] is not None:
+            rows = np.where(found, rowIndex[2][rows], -1)
+        return rows
+
+    def _orbitsKey(self):
+        # The object identifying the current orbits (for the objId hash index).
+        return self.orbits
+
+    def select(self, objIds):
+        """Select the orbits with objIds (see objIdRows).
+
+        Parameters
+        ----------
+        objIds : numpy.ndarray
+            The objIds.
+
+        Returns
+        -------
+        OrbitsView
+            A view of the selected orbits, in the order of objIds.
+        """
+        return OrbitsView(self, self.objIdRows(objIds))
 
     def __eq__(self, otherOrbits):
         if isinstance(otherOrbits, Orbits):
@@ -52,7 +255,7 @@ class Orbits(object):
         else:
             return True
 
-    def setOrbits(self, orbits):
+    def setOrbits(self, orbits, validate=True):
         """Set and validate orbital parameters contain all required values.
 
         Sets self.orbits and self.format.
@@ -66,6 +269,11 @@ class Orbits(object):
         ----------
         orbits : pandas.DataFrame, pandas.Series or numpy.ndarray
            Array-like object containing orbital parameter information.
+        validate : bool, optional
+            If True (default), validate and complete the orbits as described above.
+            If False, the orbits are trusted to be complete and valid already (e.g. they were derived
+            from an Orbits object) and only the format is determined, so no O(n) checks are done.
+            This is intended for internal use.
         """
         # Do we have a single item or multiples?
         if isinstance(orbits, pd.Series):
@@ -81,6 +289,11 @@ class Orbits(object):
         if 'index' in orbits:
             del orbits['index']
 
+        if not validate:
+            self.format = self._findFormat(orbits)
+            self.orbits = orbits
+            return
+
         nSso = len(orbits)
 
         # Error if orbits is empty (this avoids hard-to-interpret error messages from pyoorb).
@@ -93,14 +306,7 @@ class Orbits(object):
         if 'FORMAT' in orbits:
             format = orbits['FORMAT'].iloc[0]
             del orbits['FORMAT']
-        if 'q' in orbits:
-            self.format = 'COM'
-        elif 'a' in orbits:
-            self.format = 'KEP'
-        else:
-            raise ValueError('Cannot determine orbital type, as neither q nor a in input orbital elements.\n'
-                             'Was attempting to base orbital element quantities on header row, '
-                             'with columns: \n%s' % orbits.columns)
+        self.format = self._findFormat(orbits)
         # Report a warning if formats don't seem to match.
         if (format is not None) and (format != self.format):
             warnings.warn("Format from input file (%s) doesn't match determined format (%s). "
@@ -139,15 +345,75 @@ class Orbits(object):
         # All is good.
         self.orbits = orbits
 
-    def assignSed(self, orbits, randomSeed=None):
-        """Assign either a C or S type SED, depending on the semi-major axis of the object.
+    def _findFormat(self, orbits):
+        """Determine the orbit format (COM, KEP or CART) from the columns of orbits."""
+        if 'q' in orbits:
+            return 'COM'
+        elif 'a' in orbits:
+            return 'KEP'
+        elif 'x' in orbits:
+            return 'CART'
+        raise ValueError('Cannot determine orbital type, as none of q, a or x in input '
+                         'orbital elements.\n'
+                         'Was attempting to base orbital element quantities on header row, '
+                         'with columns: \n%s' % orbits.columns)
+
+    def convertFormat(self, format):
+        """Convert the orbits to another orbital element format.
+
+        Parameters
+        ----------
+        format : str
+            The new format: COM (cometary), KEP (Keplerian) or CART (cartesian positions and
+            velocities in the J2000 ecliptic frame). See orbitalElements.py.
+
+        Returns
+        -------
+        Orbits
+            A new Orbits instance, containing the converted orbits.
+        """
+        newOrbits = Orbits()
+        newOrbits.setOrbits(convertElements(self.orbits, self.format, format), validate=False)
+        return newOrbits
+
+    def hashOrbits(self):
+        """Calculate a content hash for each orbit.
+
+        The hash covers the orbital elements, epoch, H and g (plus the orbit format), but not the objId or
+        sed_filename, so can be used to identify which orbits have changed between versions of a catalog.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array containing a 16 character hexadecimal hash for each orbit.
+        """
+        cols = [col for col in self.dataCols[self.format] if col not in ('objId', 'sed_filename')]
+        values = np.ascontiguousarray(self.orbits[cols].values, dtype=np.float64)
+        # Avoid differences between -0.0 and 0.0.
+        values = values + 0.0
+        prefix = self.format.encode('ascii')
+        return np.array([hashlib.sha1(prefix + row.tobytes()).hexdigest()[:16] for row in values])
+
+    def assignSed(self, orbits, randomSeed=None, sedMix=None):
+        """Assign an SED to each object, by default either a C or S type depending on its semi-major axis.
         P(C type) = 0 (a<2); 0.5*a - 1 (2<a<4); 1 (a > 4),
         based on figure 23 from Ivezic et al 2001 (AJ, 122, 2749).
 
+        The random numbers come from a counter-based generator (SplitMix64) keyed on the seed and the objId
+        (or the row number, if there is no objId column), so an object is always assigned the same SED
+        for the same seed, however the orbits are split into chunks or between processes.
+
         Parameters
         ----------
         orbits : pandas.DataFrame, pandas.Series or numpy.ndarray
            Array-like object containing orbital parameter information.
+        randomSeed : int, optional
+            The random seed. Default None uses a seed of 0.
+        sedMix : dict, optional
+            The relative probability of each SED, as a dictionary keyed by SED filename (e.g. 'X.dat';
+            these must be present in the data directory of this package). Each probability can be a
+            number, an array (one value per object), or a function of the semi-major axis (AU).
+            Default None uses the C/S type mix described above.
 
         Returns
         -------
@@ -161,28 +427,46 @@ class Orbits(object):
         #  p(C) = 1 for a>4
         # where a is semi-major axis, and p(C) is the probability that
         # an asteroid is C type, with p(S)=1-p(C) for S types.
-        if 'a' in orbits:
-            a = orbits['a']
-        elif 'q' in orbits:
-            a = orbits['q'] / (1 - orbits['e'])
+        if sedMix is None:
+            sedMix = {'C.dat': lambda a: np.clip(0.5 * a - 1.0, 0, 1),
+                      'S.dat': lambda a: 1 - np.clip(0.5 * a - 1.0, 0, 1)}
+        else:
+            sedDir = os.path.join(getPackageDir('SIMS_MOVINGOBJECTS'), 'data')
+            missing = [sed for sed in sedMix if not (os.path.isfile(os.path.join(sedDir, sed)) or
+                                                     os.path.isfile(os.path.join(sedDir, sed + '.gz')))]
+            if len(missing) > 0:
+                raise ValueError('Could not find SED(s) %s in %s' % (' '.join(missing), sedDir))
+        nSso = len(orbits)
+        a = None
+        if any(callable(prob) for prob in sedMix.values()):
+            a = semiMajorAxis(orbits)
+        seds = list(sedMix.keys())
+        probs = np.empty((nSso, len(seds)), dtype=np.float64)
+        for i, sed in enumerate(seds):
+            prob = sedMix[sed](a) if callable(sedMix[sed]) else sedMix[sed]
+            probs[:, i] = np.clip(prob, 0, None)
+        cumulative = np.cumsum(probs, axis=1)
+        if np.any(cumulative[:, -1] <= 0):
+            raise ValueError('The SED probabilities must be positive for each object.')
+        if 'objId' in orbits:
+            keys = _objIdKeys(orbits['objId'])
         else:
-            raise ValueError('Need either a or q (plus e) in orbit data frame.')
-        sedvals = np.empty(len(orbits), dtype=str)
-        if randomSeed is not None:
-            np.random.seed(randomSeed)
-        chance = np.random.random(len(orbits))
-        prob_c = 0.5 * a - 1.0
-        # if chance <= prob_c:
-        sedvals = np.where(chance <= prob_c, 'C.dat', 'S.dat')
+            keys = np.arange(nSso, dtype=np.uint64)
+        chance = _counterUniform(0 if randomSeed is None else randomSeed, keys) * cumulative[:, -1]
+        sedIdx = np.minimum((chance[:, np.newaxis] >= cumulative).sum(axis=1), len(seds) - 1)
+        sedvals = np.array(seds)[sedIdx]
         return sedvals
 
-    def readOrbits(self, orbitfile, delim=None, skiprows=None):
+    def readOrbits(self, orbitfile, delim=None, skiprows=None, nProcs=1):
         """Read orbits from a file, generating a pandas dataframe containing columns matching
         dataCols, for the appropriate orbital parameter format (currently accepts COM or KEP formats).
 
         After reading and standardizing the column names, calls selfs.setOrbits to validate the
         orbital parameters. Expects angles in orbital element formats to be in degrees.
 
+        If orbitfile is a directory, the orbits are read from the binary format written by
+        writeOrbitsBinary instead (see readOrbitsBinary); delim and skiprows are then ignored.
+
         Parameters
         ----------
         orbitfile : str
@@ -191,13 +475,80 @@ class Orbits(object):
             The delimiter for the input orbit file -- default = None will use delim_whitespace=True.
         skiprows : int, optional
             The number of rows to skip before reading the header information for pandas.
+        nProcs : int, optional
+            The number of processes to use to parse the file. Default 1 (no extra processes).
+            If more than 1, the file is split into byte ranges (at line boundaries) which are
+            parsed in a pool of worker processes, then the results are concatenated,
+            normalized and validated as for a single process.
         """
+        if os.path.isdir(orbitfile):
+            self.readOrbitsBinary(orbitfile)
+            return
         # Read the data from disk.
-        if delim is None:
+        if nProcs > 1:
+            orbits = self._readOrbitsParallel(orbitfile, delim, skiprows, nProcs)
+        elif delim is None:
             orbits = pd.read_table(orbitfile, delim_whitespace=True, skiprows=skiprows)
         else:
             orbits = pd.read_table(orbitfile, sep=delim, skiprows=skiprows)
 
+        orbits = self._normalizeColumns(orbits, orbitfile)
+        # Validate and assign orbits to self.
+        self.setOrbits(orbits)
+
+    def _readOrbitsParallel(self, orbitfile, delim, skiprows, nProcs):
+        """Parse a text orbit file in a pool of nProcs worker processes.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The orbits, with the column names from the file.
+        """
+        columns, dataStart = _readOrbitHeader(orbitfile, delim, skiprows)
+        fileSize = os.path.getsize(orbitfile)
+        # Split the data into (roughly) equal byte ranges, moving each boundary to the next line start.
+        bounds = [dataStart]
+        with open(orbitfile, 'rb') as f:
+            for i in range(1, nProcs):
+                f.seek(dataStart + (fileSize - dataStart) * i // nProcs)
+                f.readline()
+                bounds.append(min(f.tell(), fileSize))
+        bounds.append(fileSize)
+        bounds = sorted(set(bounds))
+        ranges = [(orbitfile, delim, columns, start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        if len(ranges) == 0:
+            return _parseOrbitText(io.BytesIO(b''), delim, columns)
+        pool = multiprocessing.Pool(processes=min(nProcs, len(ranges)))
+        try:
+            frames = pool.map(_parseOrbitBytesWorker, ranges)
+        finally:
+            pool.close()
+            pool.join()
+        # A column which pandas parsed as strings in any range (e.g. objIds which only look numeric
+        # in some ranges) must be strings in all ranges, as when parsing the whole file at once.
+        for col in columns:
+            if any(frame[col].dtype == object for frame in frames):
+                for frame in frames:
+                    if frame[col].dtype != object:
+                        frame[col] = frame[col].astype(str)
+        return pd.concat(frames, ignore_index=True)
+
+    def _normalizeColumns(self, orbits, orbitfile=None):
+        """Drop unneeded columns and rename the remaining columns of orbits read from a file
+        to the standard column names (e.g. '!!OID' to 'objId').
+
+        Parameters
+        ----------
+        orbits : pandas.DataFrame
+            The orbits, with the column names from the file.
+        orbitfile : str, optional
+            The name of the orbit file (used in error messages).
+
+        Returns
+        -------
+        pandas.DataFrame
+            The orbits, with standardized column names.
+        """
         # Drop some columns that are typically present in DES files but that we don't need.
         if 'INDEX' in orbits:
             del orbits['INDEX']
@@ -242,5 +593,297 @@ class Orbits(object):
                 ssoCols[idx] = name
         # Assign the new column names back to the orbits dataframe.
         orbits.columns = ssoCols
-        # Validate and assign orbits to self.
-        self.setOrbits(orbits)
+        return orbits
+
+    def writeOrbitsBinary(self, outDir):
+        """Write the (validated) orbits to a directory, in a binary columnar format.
+
+        Each column is written to its own .npy file, together with a JSON metadata file recording the
+        column names (and encodings), orbit format and number of orbits.
+        String objIds are stored as fixed-width UTF-8 bytes; other string (or categorical) columns,
+        such as sed_filename, are stored as small integer codes plus a file with the list of names.
+        The columns are written after name normalization, validation and SED assignment,
+        so they can be read back (see readOrbitsBinary) without repeating any of these.
+
+        Parameters
+        ----------
+        outDir : str
+            The output directory. Created if it does not exist.
+        """
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+        columns = []
+        for i, col in enumerate(self.orbits.columns):
+            values = self.orbits[col].values
+            entry = {'name': col, 'file': 'col%03d.npy' % i}
+            if isinstance(values, pd.Categorical) or values.dtype.kind in ('O', 'U'):
+                if col == 'objId':
+                    values = np.char.encode(np.asarray(values).astype(str), 'utf-8')
+                    entry['encoding'] = 'utf-8'
+                else:
+                    names, codes = np.unique(np.asarray(values).astype(str), return_inverse=True)
+                    values = codes.ravel().astype(_codeDtype(len(names)))
+                    entry['encoding'] = 'categorical'
+                    entry['namesFile'] = 'col%03d_names.npy' % i
+                    np.save(os.path.join(outDir, entry['namesFile']), names)
+            np.save(os.path.join(outDir, entry['file']), np.ascontiguousarray(values))
+            entry['dtype'] = values.dtype.str
+            columns.append(entry)
+        metadata = {'version': BINARY_FORMAT_VERSION, 'format': self.format,
+                    'nOrbits': len(self.orbits), 'columns': columns}
+        with open(os.path.join(outDir, BINARY_METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=1)
+
+    def readOrbitsBinary(self, inDir, mmap=True):
+        """Read orbits written by writeOrbitsBinary.
+
+        The orbits were validated before they were written, so are not validated again.
+        Categorical-encoded columns (e.g. sed_filename) are returned as pandas.Categorical columns,
+        and string objIds as Python strings; numeric columns are returned as they were written.
+
+        Parameters
+        ----------
+        inDir : str
+            The directory containing the binary orbits.
+        mmap : bool, optional
+            If True (default), the (numeric) column files are memory-mapped (read-only), so only the
+            parts of the catalog which are used are read from disk.
+        """
+        metadataFile = os.path.join(inDir, BINARY_METADATA_FILE)
+        if not os.path.isfile(metadataFile):
+            raise ValueError('Could not find binary orbit metadata file %s' % metadataFile)
+        with open(metadataFile, 'r') as f:
+            metadata = json.load(f)
+        if metadata.get('version') != BINARY_FORMAT_VERSION:
+            raise ValueError('Unsupported binary orbit format version %s in %s (expected %d).'
+                             % (metadata.get('version'), inDir, BINARY_FORMAT_VERSION))
+        if metadata['format'] not in self.dataCols:
+            raise ValueError('Unknown orbit format %s in %s' % (metadata['format'], inDir))
+        data = {}
+        for col in metadata['columns']:
+            values = np.load(os.path.join(inDir, col['file']), mmap_mode='r' if mmap else None)
+            if len(values) != metadata['nOrbits']:
+                raise ValueError('Column %s in %s has %d values, expected %d.'
+                                 % (col['name'], inDir, len(values), metadata['nOrbits']))
+            encoding = col.get('encoding')
+            if encoding == 'categorical':
+                names = np.load(os.path.join(inDir, col['namesFile']))
+                values = pd.Categorical.from_codes(values, names.astype(object))
+            elif encoding == 'utf-8':
+                values = np.char.decode(values, 'utf-8').astype(object)
+            data[col['name']] = values
+        names = [col['name'] for col in metadata['columns']]
+        self.format = metadata['format']
+        self.orbits = pd.DataFrame(data, columns=names, copy=False)
+
+
+class OrbitsView(Orbits):
+    """A lightweight view of a subset of the orbits in an Orbits object.
+
+    The parent's orbits have already been validated (by setOrbits), so a view is not validated again,
+    and its orbits dataframe is only created (by slicing the parent's dataframe) when it is used.
+    Views are returned by indexing, iterating or chunking (iterChunks) an Orbits object, and can be
+    used anywhere an Orbits object is expected. Views should be treated as read-only.
+
+    Parameters
+    ----------
+    parent : Orbits
+        The (validated) orbits this is a view of.
+    index : slice or numpy.ndarray
+        The (positional) indexes of the orbits in the parent.
+    """
+    def __init__(self, parent, index):
+        self._parent = parent
+        self._index = index
+        self._orbits = None
+        self._rowIndex = None
+        self.format = parent.format
+        self.dataCols = parent.dataCols
+
+    @property
+    def orbits(self):
+        if self._orbits is None:
+            self._orbits = self._parent.orbits.iloc[self._index]
+        return self._orbits
+
+    @orbits.setter
+    def orbits(self, orbits):
+        self._orbits = orbits
+
+    def _orbitsKey(self):
+        # Avoid creating the orbits dataframe of the view just to check the objId hash index.
+        if self._orbits is None:
+            return self._parent._orbitsKey()
+        return self._orbits
+
+    def __len__(self):
+        if self._orbits is None and isinstance(self._index, slice):
+            return len(range(*self._index.indices(len(self._parent))))
+        return len(self.orbits)
+
+    def column(self, name):
+        """Return the values of one column of the orbits in this view, as a numpy array.
+
+        For a view defined by a slice, this is a view of the parent's column (no values are copied).
+
+        Parameters
+        ----------
+        name : str
+            The column name (e.g. 'objId', 'q', 'epoch').
+
+        Returns
+        -------
+        numpy.ndarray
+            The column values.
+        """
+        if self._orbits is None:
+            return self._parent.column(name)[self._index]
+        return self._orbits[name].values
+
+
+class OrbitFileReader(object):
+    """Read validated chunks (or row ranges) of a (DES or S3M format) text orbit file.
+
+    On the first pass through the file, a byte-offset index of every indexStride'th orbit is built
+    (and saved to indexFile, if given, for reuse by later readers). Any range of orbits can then be read
+    by seeking close to its start, without parsing the rest of the file, so each worker processing
+    a slice of a large catalog only reads its own slice.
+
+    Parameters
+    ----------
+    orbitfile : str
+        The name of the input file containing orbital parameter information.
+    delim : str, optional
+        The delimiter for the input orbit file -- default = None will use whitespace.
+    skiprows : int, optional
+        The number of rows to skip before the header row.
+    indexFile : str, optional
+        File (.npz) in which to save the byte-offset index, or to read it from if it matches
+        the orbit file. Default None (the index is only kept in memory).
+    indexStride : int, optional
+        Record the byte offset of every indexStride'th orbit. Default 1000.
+    """
+    def __init__(self, orbitfile, delim=None, skiprows=None, indexFile=None, indexStride=1000):
+        self.orbitfile = orbitfile
+        self.delim = delim
+        self.skiprows = 0 if skiprows is None else int(skiprows)
+        self.indexFile = indexFile
+        self.indexStride = int(indexStride)
+        self._readHeader()
+        self._buildIndex()
+
+    def _parse(self, lines):
+        """Parse lines (bytes) of the orbit file with pandas."""
+        return _parseOrbitText(io.BytesIO(b''.join(lines)), self.delim, self.columns)
+
+    def _readHeader(self):
+        self.columns, self.dataStart = _readOrbitHeader(self.orbitfile, self.delim, self.skiprows)
+
+    def _buildIndex(self):
+        """Build (or read) the byte offsets of every indexStride'th orbit, and count the orbits."""
+        st = os.stat(self.orbitfile)
+        fileId = np.array([st.st_size, st.st_mtime, self.skiprows, self.indexStride], dtype=np.float64)
+        if self.indexFile is not None and os.path.isfile(self.indexFile):
+            try:
+                with np.load(self.indexFile) as saved:
+                    if np.array_equal(saved['fileId'], fileId):
+                        self.offsets = saved['offsets']
+                        self.nOrbits = int(saved['nOrbits'])
+                        return
+            except (IOError, OSError, ValueError, KeyError, zipfile.BadZipFile):
+                # Unreadable (e.g. written by an older version); rebuild it.
+                pass
+        offsets = []
+        nOrbits = 0
+        pos = self.dataStart
+        with open(self.orbitfile, 'rb') as f:
+            f.seek(self.dataStart)
+            for line in f:
+                if line.strip():
+                    if nOrbits % self.indexStride == 0:
+                        offsets.append(pos)
+                    nOrbits += 1
+                pos += len(line)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.nOrbits = nOrbits
+        if self.indexFile is not None:
+            # Write to a temporary file and rename it into place, so that other processes
+            # sharing the index never read a partially written file.
+            tmpFile = None
+            try:
+                fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.indexFile)),
+                                               suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, fileId=fileId, offsets=self.offsets, nOrbits=nOrbits)
+                os.replace(tmpFile, self.indexFile)
+            except (IOError, OSError):
+                if tmpFile is not None and os.path.isfile(tmpFile):
+                    os.remove(tmpFile)
+                warnings.warn('Could not save orbit file index to %s' % self.indexFile)
+
+    def __len__(self):
+        return self.nOrbits
+
+    def readRange(self, start, end):
+        """Read orbits start to end (not including end, as for a slice) from the orbit file.
+
+        Parameters
+        ----------
+        start : int
+            The (zero-based) row number of the first orbit to read.
+        end : int
+            The row number after the last orbit to read (clipped to the number of orbits).
+
+        Returns
+        -------
+        Orbits
+            The validated orbits. If the file has no objId column, the objIds are the row numbers.
+        """
+        end = min(end, self.nOrbits)
+        if start < 0 or start >= end:
+            raise ValueError('Cannot read orbits %d to %d from %s, which contains %d orbits.'
+                             % (start, end, self.orbitfile, self.nOrbits))
+        lines = []
+        skip = start % self.indexStride
+        with open(self.orbitfile, 'rb') as f:
+            f.seek(self.offsets[start // self.indexStride])
+            for line in f:
+                if not line.strip():
+                    continue
+                if skip > 0:
+                    skip -= 1
+                    continue
+                lines.append(line)
+                if len(lines) == end - start:
+                    break
+        orbitsObj = Orbits()
+        orbits = orbitsObj._normalizeColumns(self._parse(lines), self.orbitfile)
+        if 'objId' not in orbits:
+            orbits['objId'] = np.arange(start, end)
+        orbitsObj.setOrbits(orbits)
+        return orbitsObj
+
+    def iterChunks(self, chunkSize, start=0, end=None):
+        """Iterate through (validated) chunks of orbits from the orbit file.
+
+        Parameters
+        ----------
+        chunkSize : int
+            The number of orbits in each chunk.
+        start : int, optional
+            The row number of the first orbit. Default 0.
+        end : int, optional
+            The row number after the last orbit. Default None (the end of the file).
+
+        Returns
+        -------
+        generator of Orbits
+            The chunks of orbits.
+        """
+        chunkSize = int(chunkSize)
+        if chunkSize < 1:
+            raise ValueError('chunkSize must be at least 1 (got %d).' % chunkSize)
+        if end is None or end > self.nOrbits:
+            end = self.nOrbits
+        for chunkStart in range(start, end, chunkSize):
+            yield self.readRange(chunkStart, min(chunkStart + chunkSize, end))
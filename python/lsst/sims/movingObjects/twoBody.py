@@ -0,0 +1,216 @@
+"""Two-body (Keplerian) ephemerides, as a fast approximation to the OpenOrb n-body ephemerides.
+
+Orbits are propagated with only the gravity of the Sun, and the Earth (Earth-Moon barycenter) position is
+calculated from the mean orbital elements of Standish (1992, JPL 'Keplerian Elements for Approximate
+Positions of the Major Planets'). The accuracy is limited by
+ - the neglected planetary perturbations on the orbits, which grow with time from the orbit epoch;
+   typically arcseconds within a few weeks of the epoch for main belt asteroids, reaching arcminutes
+   after a year (and much more for objects with close planetary encounters).
+ - the Earth position, which is accurate to about 1e-4 AU (including the offset of the geocenter
+   from the Earth-Moon barycenter); this is about 10 arcseconds for an object at 2 AU, and grows
+   as the inverse of the distance to the object.
+Light travel time is included; aberration is not (as for the astrometric OpenOrb ephemerides).
+These ephemerides are suitable for screening (e.g. choosing candidate objects in a field of view),
+but not for precise astrometry.
+"""
+from __future__ import print_function, division
+import numpy as np
+from .observatory import readObsCodes, siteVectors, toTT, cartesianToSky, _ArrayCache
+from .orbitalElements import GM_SUN, _conicStates, cartToCom
+
+__all__ = ['orbitalStates', 'earthStates', 'observerStates', 'twoBodyEphemerides']
+
+# Speed of light, in AU/day.
+C_AU_DAY = 173.1446326846693
+# Obliquity of the ecliptic at J2000 (radians).
+OBLIQUITY = np.radians(84381.448 / 3600.)
+# Timescale codes used in oorb-format time arrays.
+TIMESCALE_NAMES = {1: 'UTC', 2: 'UT1', 3: 'TT', 4: 'TAI'}
+# Mean elements of the Earth-Moon barycenter (a, e, I, L, long.peri, long.node) and rates per century,
+# for 1800-2050 (Standish 1992).
+EMB_ELEMENTS = np.array([1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.0])
+EMB_RATES = np.array([0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.0])
+
+_observerCache = _ArrayCache()
+
+
+def _eclipticToEquatorial(vec):
+    """Rotate vectors (x/y/z axis first) from the J2000 ecliptic to the J2000 equator."""
+    cosE = np.cos(OBLIQUITY)
+    sinE = np.sin(OBLIQUITY)
+    return np.stack([vec[0], cosE * vec[1] - sinE * vec[2], sinE * vec[1] + cosE * vec[2]])
+
+
+def orbitalStates(oorbElem, times):
+    """Calculate heliocentric two-body positions and velocities of a set of orbits.
+
+    Parameters
+    ----------
+    oorbElem : numpy.ndarray
+        The orbital elements, in the OpenOrb format (see PyOrbEphemerides._convertToOorbElem).
+    times : numpy.ndarray
+        The times (MJD TT), with shape (nTimes,) or (nObj, nTimes).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        Equatorial (J2000) positions (AU) and velocities (AU/day), each with shape (3, nObj, nTimes).
+    """
+    oorbElem = np.atleast_2d(oorbElem)
+    times = np.atleast_2d(times)
+    elemType = oorbElem[:, 7]
+    e = oorbElem[:, 2]
+    q = np.where(elemType == 3, np.abs(oorbElem[:, 1] * (1. - e)), oorbElem[:, 1])
+    tPeri = oorbElem[:, 6].copy()
+    kep = elemType == 3
+    if kep.any():
+        # Convert the mean anomaly at epoch to the time of perihelion.
+        a = np.abs(oorbElem[kep, 1])
+        tPeri[kep] = oorbElem[kep, 8] - oorbElem[kep, 6] / np.sqrt(GM_SUN / a**3)
+    cart = elemType == 1
+    if cart.any():
+        # Convert cartesian elements to cometary elements.
+        com = cartToCom(*[oorbElem[cart, i] for i in range(1, 7)] + [oorbElem[cart, 8]])
+        q[cart] = com[0]
+        e = e.copy()
+        e[cart] = com[1]
+        oorbElem = oorbElem.copy()
+        oorbElem[cart, 3:6] = np.radians(np.column_stack(com[2:5]))
+        tPeri[cart] = com[5]
+    if ((elemType < 1) | (elemType > 3)).any():
+        raise ValueError('Two-body ephemerides need CART, COM or KEP orbital elements.')
+    col = np.newaxis
+    pos, vel = _conicStates(q[:, col], e[:, col], oorbElem[:, 3, col], oorbElem[:, 4, col],
+                            oorbElem[:, 5, col], tPeri[:, col], times)
+    return _eclipticToEquatorial(pos), _eclipticToEquatorial(vel)
+
+
+def earthStates(times):
+    """Calculate the approximate heliocentric position and velocity of the Earth.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        The times (MJD TT).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        Equatorial (J2000) positions (AU) and velocities (AU/day) of the Earth-Moon barycenter,
+        each with shape (len(times), 3).
+    """
+    times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+    t = (times - 51544.5) / 36525.
+    a, e, inc, meanLong, longPeri, node = [EMB_ELEMENTS[i] + EMB_RATES[i] * t for i in range(6)]
+    inc = np.radians(inc)
+    node = np.radians(node)
+    argPeri = np.radians(longPeri) - node
+    meanAnomaly = np.radians(meanLong - longPeri)
+    tPeri = times - meanAnomaly / np.sqrt(GM_SUN / a**3)
+    # Each time has its own (slowly varying) set of elements.
+    pos, vel = _conicStates(a * (1. - e), e, inc, node, argPeri, tPeri, times)
+    return _eclipticToEquatorial(pos).T, _eclipticToEquatorial(vel).T
+
+
+def observerStates(obscode, ephTimes, obsCodes=None):
+    """Return the heliocentric position and velocity of an observatory, from a cache.
+
+    The observer positions for each (observatory code, time grid) are calculated once per process,
+    so that the observer geometry costs O(times) rather than O(objects x times) over every set
+    of orbits (or chunk of orbits) using the same times. The returned arrays are read-only.
+
+    Parameters
+    ----------
+    obscode : int or str
+        The observatory code.
+    ephTimes : numpy.ndarray
+        Ephemeris times in oorb format (see PyOrbEphemerides._convertTimes).
+    obsCodes : dict, optional
+        The observatory codes, as returned by readObsCodes. Default None reads these from disk
+        (unless obscode is the geocenter, 500, or the positions are already cached).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        Equatorial (J2000) positions (AU) and velocities (AU/day) of the observer,
+        each with shape (len(ephTimes), 3).
+    """
+    timeScale = TIMESCALE_NAMES[int(ephTimes[0, 1])]
+    key = _observerCache.makeKey(ephTimes[:, 0], str(obscode), timeScale)
+
+    def compute():
+        earthPos, earthVel = earthStates(toTT(ephTimes[:, 0], timeScale=timeScale))
+        if str(obscode) == '500':
+            return earthPos, earthVel
+        codes = obsCodes if obsCodes is not None else readObsCodes()
+        sitePos, siteVel = siteVectors(obscode, ephTimes[:, 0], timeScale=timeScale, obsCodes=codes)
+        return earthPos + sitePos, earthVel + siteVel
+
+    return _observerCache.get(key, compute)
+
+
+def _phaseFunction(phase, g):
+    """The H, G magnitude system phase function (Bowell et al. 1989), returned in magnitudes."""
+    tanHalf = np.tan(phase / 2.)
+    phi1 = np.exp(-3.33 * tanHalf**0.63)
+    phi2 = np.exp(-1.87 * tanHalf**1.22)
+    return -2.5 * np.log10((1. - g) * phi1 + g * phi2)
+
+
+def twoBodyEphemerides(oorbElem, ephTimes, obscode=807, obsCodes=None, nLightTime=2):
+    """Generate two-body ephemerides, in the same format as the OpenOrb ephemerides.
+
+    Parameters
+    ----------
+    oorbElem : numpy.ndarray
+        The orbital elements, in the OpenOrb format (see PyOrbEphemerides._convertToOorbElem).
+    ephTimes : numpy.ndarray
+        Ephemeris times in oorb format (see PyOrbEphemerides._convertTimes).
+    obscode : int or str, optional
+        The observatory code for ephemeris generation. Default=807 (Cerro Tololo).
+    obsCodes : dict, optional
+        The observatory codes, as returned by readObsCodes. Default None reads these from disk
+        (unless obscode is the geocenter, 500).
+    nLightTime : int, optional
+        The number of iterations for the light travel time correction. Default 2.
+
+    Returns
+    -------
+    numpy.ndarray
+        The oorb-formatted ephemeris array, with shape (nObj, nTimes, 10)
+        (see PyOrbEphemerides._convertOorbEphs).
+    """
+    oorbElem = np.atleast_2d(oorbElem)
+    timeScale = TIMESCALE_NAMES[int(ephTimes[0, 1])]
+    times = toTT(ephTimes[:, 0], timeScale=timeScale)
+    # Observer position (heliocentric, equatorial), shared between calls using the same times.
+    obsPos, obsVel = observerStates(obscode, ephTimes, obsCodes=obsCodes)
+    obsPos = obsPos.T[:, np.newaxis, :]
+    obsVel = obsVel.T[:, np.newaxis, :]
+    # Object position, iterating for the light travel time.
+    lightTime = np.zeros((len(oorbElem), len(times)))
+    for i in range(nLightTime + 1):
+        pos, vel = orbitalStates(oorbElem, times[np.newaxis, :] - lightTime)
+        lightTime = np.sqrt(np.sum((pos - obsPos)**2, axis=0)) / C_AU_DAY
+    delta, ra, dec, dradt, ddecdt = cartesianToSky(pos - obsPos, vel - obsVel)
+    # Phase angle (Sun-object-observer) and solar elongation (Sun-observer-object).
+    r = np.sqrt(np.sum(pos**2, axis=0))
+    obsDist = np.sqrt(np.sum(obsPos**2, axis=0))
+    cosPhase = np.sum(pos * (pos - obsPos), axis=0) / (r * delta)
+    phase = np.arccos(np.clip(cosPhase, -1., 1.))
+    cosElong = np.sum(-obsPos * (pos - obsPos), axis=0) / (obsDist * delta)
+    elongation = np.arccos(np.clip(cosElong, -1., 1.))
+    magV = (oorbElem[:, 10, np.newaxis] + 5. * np.log10(r * delta)
+            + _phaseFunction(phase, oorbElem[:, 11, np.newaxis]))
+    ephs = np.empty((len(oorbElem), len(times), 10), dtype=np.float64)
+    ephs[:, :, 0] = delta
+    ephs[:, :, 1] = ra
+    ephs[:, :, 2] = dec
+    ephs[:, :, 3] = magV
+    ephs[:, :, 4] = ephTimes[:, 0]
+    ephs[:, :, 5] = ephTimes[:, 1]
+    ephs[:, :, 6] = dradt
+    ephs[:, :, 7] = ddecdt
+    ephs[:, :, 8] = np.degrees(phase)
+    ephs[:, :, 9] = np.degrees(elongation)
+    return ephs
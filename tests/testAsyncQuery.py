@@ -0,0 +1,124 @@
+from __future__ import print_function
+import unittest
+import os
+import asyncio
+import numpy as np
+from lsst.sims.movingObjects import Orbits
+from lsst.sims.movingObjects import SyntheticEphemerides
+from lsst.sims.movingObjects import ChebyFits
+from lsst.sims.movingObjects import ChebyValues
+from lsst.sims.movingObjects.asyncQuery import AsyncEphemerides, AsyncChebyValues
+from lsst.utils import getPackageDir
+
+
+try:
+    import numexpr
+    _has_numexpr = True
+except ImportError:
+    _has_numexpr = False
+
+
+@unittest.skipIf(not _has_numexpr, "No numexpr available.")
+class TestAsyncQuery(unittest.TestCase):
+    def setUp(self):
+        self.testdir = os.path.join(getPackageDir('sims_movingObjects'), 'tests/orbits_testdata')
+        self.orbits = Orbits()
+        self.orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsMBA.s3m'), skiprows=1)
+        self.ephems = SyntheticEphemerides()
+        self.ephems.setOrbits(self.orbits)
+        self.objIds = np.asarray(self.orbits.orbits['objId'])
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        del self.orbits
+        del self.ephems
+
+    def _countCalls(self, obj, method):
+        # Count the calls to obj.method.
+        calls = []
+        func = getattr(obj, method)
+
+        def counted(*args, **kwargs):
+            calls.append(args)
+            return func(*args, **kwargs)
+        setattr(obj, method, counted)
+        return calls
+
+    def testAsyncEphemerides(self):
+        times = np.arange(54800, 54802, 0.5)
+        ephs = self.ephems.generateEphemerides(times)
+        calls = self._countCalls(self.ephems, 'generateEphemerides')
+        query = AsyncEphemerides(self.ephems)
+
+        async def run():
+            return await asyncio.gather(query.generateEphemerides(times, objIds=self.objIds[2:4]),
+                                        query.generateEphemerides(times, objIds=self.objIds[0]),
+                                        query.generateEphemerides(times))
+        results = self.loop.run_until_complete(run())
+        query.close()
+        # The three requests should have been answered by one calculation.
+        self.assertEqual(len(calls), 1)
+        np.testing.assert_equal(results[0], ephs[2:4])
+        np.testing.assert_equal(results[1], ephs[0:1])
+        np.testing.assert_equal(results[2], ephs)
+
+    def testAsyncEphemeridesSubset(self):
+        # Only the union of the requested objects should be evaluated.
+        times = np.arange(54800, 54802, 0.5)
+        ephs = self.ephems.generateEphemerides(times)
+        # Count the orbits in each (coalesced) evaluation.
+        nOrbits = []
+        selectOrbits = self.ephems.selectOrbits
+
+        def countedSelect(objIds):
+            nOrbits.append(len(objIds))
+            return selectOrbits(objIds)
+        self.ephems.selectOrbits = countedSelect
+        query = AsyncEphemerides(self.ephems)
+
+        async def run():
+            return await asyncio.gather(query.generateEphemerides(times, objIds=self.objIds[[4, 2]]),
+                                        query.generateEphemerides(times, objIds=self.objIds[2]),
+                                        query.generateEphemerides(times, objIds=['notAnObject']),
+                                        return_exceptions=True)
+        results = self.loop.run_until_complete(run())
+        query.close()
+        self.assertEqual(nOrbits, [2])
+        for column in ('ra', 'dec'):
+            np.testing.assert_allclose(results[0][column], ephs[column][[4, 2]], rtol=0, atol=1e-10)
+            np.testing.assert_allclose(results[1][column], ephs[column][2:3], rtol=0, atol=1e-10)
+        self.assertIsInstance(results[2], ValueError)
+
+    def testAsyncChebyValues(self):
+        cheb = ChebyFits(self.orbits, 54800, 30, ngran=64, skyTolerance=2.5, nDecimal=10,
+                         ephemerides=self.ephems)
+        cheb.calcSegmentLength(length=10.0)
+        cheb.calcSegments()
+        chebyValues = ChebyValues()
+        chebyValues.setCoefficients(cheb)
+        times = np.array([54801.3, 54815.])
+        ephs = chebyValues.getEphemerides(times)
+        calls = self._countCalls(chebyValues, 'getEphemerides')
+        query = AsyncChebyValues(chebyValues)
+
+        async def run():
+            return await asyncio.gather(query.getEphemerides(times, objIds=self.objIds[1:3]),
+                                        query.getEphemerides(times, objIds=self.objIds[4]),
+                                        query.getEphemerides(times[0]),
+                                        query.getEphemerides(times, objIds=['notAnObject']),
+                                        return_exceptions=True)
+        results = self.loop.run_until_complete(run())
+        query.close()
+        # One batch for the (shared) times, and another for the single time.
+        self.assertEqual(len(calls), 2)
+        objIdx = np.searchsorted(ephs['objId'], self.objIds)
+        for k in chebyValues.ephemerisKeys:
+            np.testing.assert_equal(results[0][k], ephs[k][objIdx[1:3]])
+            np.testing.assert_equal(results[1][k], ephs[k][objIdx[4:5]])
+            np.testing.assert_equal(results[2][k], ephs[k][:, :1])
+        self.assertIsInstance(results[3], ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
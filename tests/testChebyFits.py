@@ -5,6 +5,8 @@ import warnings
 import numpy as np
 from lsst.sims.movingObjects import Orbits
 from lsst.sims.movingObjects import ChebyFits
+from lsst.sims.movingObjects import ChebyValues
+from lsst.sims.movingObjects import SyntheticEphemerides
 from lsst.utils import getPackageDir
 
 
@@ -153,5 +155,47 @@ class TestRun(unittest.TestCase):
         # Test that the end of the last interval is equal to the end of the total interval
         self.assertEqual(te, tStart + interval)
 
+    def testSyntheticEphemerides(self):
+        # Run through the fitting with the (pyoorb-free) synthetic ephemeris generator,
+        # forcing subdivision of the segments, which shares the ephemeris generator.
+        tStart = self.orbits.orbits.epoch.iloc[0]
+        interval = 30
+        ephems = SyntheticEphemerides()
+        cheb = ChebyFits(self.orbits, tStart, interval, ngran=64, skyTolerance=2.5, nDecimal=10,
+                         ephemerides=ephems)
+        self.assertTrue(cheb.pyephems is ephems)
+        cheb.calcSegmentLength(length=10.0)
+        cheb.calcSegments()
+        self.assertTrue(ephems.orbitObj is self.orbits)
+        self.assertEqual(len(np.unique(cheb.coeffs['objId'])), len(self.orbits))
+        cheb.write(self.coeffFile, self.residFile, self.failedFile)
+        # The fit coefficients should reproduce the synthetic ephemerides.
+        chebyValues = ChebyValues()
+        chebyValues.setCoefficients(cheb)
+        times = np.arange(tStart + 0.1, tStart + interval, 0.7)
+        ephs = ephems.generateEphemerides(times, timeScale='TAI')
+        chebEphs = chebyValues.getEphemerides(times)
+        np.testing.assert_allclose(chebEphs['ra'], ephs['ra'], rtol=0, atol=2.5 / 3600. / 1000.)
+        np.testing.assert_allclose(chebEphs['dec'], ephs['dec'], rtol=0, atol=2.5 / 3600. / 1000.)
+
+    def testWriteHashes(self):
+        # Objects with failed fits have no hash, so that they are refit from an updated catalog.
+        tStart = self.orbits.orbits.epoch.iloc[0]
+        cheb = ChebyFits(self.orbits, tStart, 30, ngran=64, skyTolerance=2.5, nDecimal=10,
+                         ephemerides=SyntheticEphemerides())
+        objIds = [str(objId) for objId in self.orbits.orbits['objId']]
+        cheb.failed.append((self.orbits.orbits['objId'].iloc[1], tStart, tStart + 30))
+        cheb.write(self.coeffFile, self.residFile, self.failedFile)
+        hashFile = 'tmpHashes'
+        try:
+            cheb.writeHashes(hashFile)
+            with open(hashFile, 'r') as f:
+                lines = f.readlines()
+        finally:
+            os.remove(hashFile)
+        self.assertEqual(lines[0].split(), ['objId', 'orbitHash'])
+        self.assertEqual([line.split()[0] for line in lines[1:]], objIds[:1] + objIds[2:])
+
+
 if __name__ == '__main__':
     unittest.main()
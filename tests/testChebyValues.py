@@ -9,6 +9,7 @@ from lsst.sims.movingObjects import Orbits
 from lsst.sims.movingObjects import PyOrbEphemerides
 from lsst.sims.movingObjects import ChebyFits
 from lsst.sims.movingObjects import ChebyValues
+from lsst.sims.movingObjects import extendCoefficients
 from lsst.utils import getPackageDir
 
 
@@ -84,6 +85,93 @@ class TestChebyValues(unittest.TestCase):
                 # decimal places, this means we can test to 5 decimal places for those.
                 np.testing.assert_allclose(chebyValues.coeffs[k], chebyValues2.coeffs[k], rtol=0, atol=1e-5)
 
+    def testReadCompactCoeffs(self):
+        # Test reading the coefficients from the compact binary format.
+        compactFile = 'test_coeffs_compact'
+        chebyValues = ChebyValues()
+        chebyValues.readCoefficients(self.coeffFile)
+        for precision in ('float32', 'int16'):
+            self.chebyFits.writeCompact(compactFile, precision=precision)
+            chebyValues2 = ChebyValues()
+            chebyValues2.readCoefficients(compactFile)
+            os.remove(compactFile)
+            np.testing.assert_equal(chebyValues.coeffs['objId'], chebyValues2.coeffs['objId'])
+            for k in ('tStart', 'tEnd', 'meanRA', 'meanDec'):
+                np.testing.assert_allclose(chebyValues.coeffs[k], chebyValues2.coeffs[k], rtol=0, atol=1e-10)
+            # The decoded positions should stay within skyTolerance of the fitted (text) coefficients,
+            # and the other values within their compact tolerances.
+            for k in ('ra', 'dec'):
+                np.testing.assert_allclose(chebyValues.coeffs[k][:, 0], chebyValues2.coeffs[k][:, 0],
+                                           rtol=0, atol=1e-10)
+            times = np.arange(self.tStart, self.tStart + self.interval, 0.03)
+            ephs = chebyValues.getEphemerides(times)
+            ephs2 = chebyValues2.getEphemerides(times)
+            dRa = (ephs2['ra'] - ephs['ra']) * np.cos(np.radians(ephs['dec']))
+            dDec = ephs2['dec'] - ephs['dec']
+            self.assertLessEqual(np.max(np.hypot(dRa, dDec)) * 3600. * 1000., 2.5)
+            for k, tol in (('delta', 1e-6), ('vmag', 1e-3), ('elongation', 1e-3)):
+                np.testing.assert_allclose(ephs2[k], ephs[k], rtol=0, atol=tol)
+        # Secondary values which cannot be stored compactly within their tolerances are kept as float64.
+        self.chebyFits.writeCompact(compactFile, precision='int16', tolerances={'vmag': 0})
+        with np.load(compactFile) as data:
+            self.assertEqual(data['vmag'].dtype, np.float64)
+            self.assertEqual(data['delta'].dtype, np.int16)
+        os.remove(compactFile)
+
+    def testNonUniformSegments(self):
+        # Test finding segments for objects with gaps between their segments.
+        chebyValues = ChebyValues()
+        chebyValues.readCoefficients(self.coeffFile)
+        objId = chebyValues.coeffs['objId'][0]
+        rows = np.where(chebyValues.coeffs['objId'] == objId)[0]
+        dropped = rows[1::2]
+        keep = np.ones(len(chebyValues.coeffs['objId']), dtype=bool)
+        keep[dropped] = False
+        gapValues = ChebyValues()
+        gapValues.readCoefficients(self.coeffFile)
+        for k in gapValues.coeffs:
+            gapValues.coeffs[k] = gapValues.coeffs[k][keep]
+        gapValues._encodeObjIds()
+        gapValues._indexSegments()
+        self.assertEqual(gapValues.segments['length'][gapValues._objIndex([objId])[0]], 0)
+        tStart = chebyValues.coeffs['tStart']
+        tEnd = chebyValues.coeffs['tEnd']
+        for row in rows[:6]:
+            time = (tStart[row] + tEnd[row]) / 2.0
+            ephs = chebyValues.getEphemerides(time)
+            gapEphs = gapValues.getEphemerides(time)
+            # The other objects are unaffected.
+            other = ephs['objId'] != objId
+            np.testing.assert_allclose(ephs['ra'][other], gapEphs['ra'][other], rtol=0, atol=1e-10)
+            if row in dropped:
+                self.assertTrue(np.all(np.isnan(gapEphs['ra'][~other])))
+            else:
+                np.testing.assert_allclose(ephs['ra'][~other], gapEphs['ra'][~other], rtol=0, atol=1e-10)
+
+    def testExtendCoefficients(self):
+        # Test that we can extend the coefficients forward in time.
+        chebyValues = ChebyValues()
+        chebyValues.readCoefficients(self.coeffFile)
+        nSegments = len(chebyValues.coeffs['objId'])
+        # The new segments must use the same time grid as the existing segments.
+        with self.assertRaises(ValueError):
+            extendCoefficients(chebyValues, self.orbits, 5, nDecimal=self.nDecimal - 1)
+        chebs = extendCoefficients(chebyValues, self.orbits, 5, ngran=64, skyTolerance=2.5,
+                                   nDecimal=self.nDecimal, nCoeff_position=self.nCoeffs,
+                                   obscode=807, timeScale='TAI')
+        self.assertGreater(len(chebyValues.coeffs['objId']), nSegments)
+        last = chebyValues.lastSegments()
+        np.testing.assert_allclose(last['tEnd'], self.tStart + self.interval + 5, rtol=0, atol=1e-10)
+        # The new segments should start where the old segments ended.
+        for cheb in chebs:
+            self.assertAlmostEqual(np.min(cheb.coeffs['tStart']), self.tStart + self.interval, places=10)
+        # And we should not be able to add the same segments again.
+        with self.assertRaises(ValueError):
+            chebyValues.appendCoefficients(chebs[0])
+        # The extended coefficients should still evaluate across the old/new boundary.
+        ephemerides = chebyValues.getEphemerides(self.tStart + self.interval + 0.1)
+        self.assertFalse(np.any(np.isnan(ephemerides['ra'])))
+
     def testGetEphemerides(self):
         # Test that getEphemerides works and is accurate.
         chebyValues = ChebyValues()
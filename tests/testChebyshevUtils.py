@@ -5,6 +5,7 @@ import unittest
 from lsst.utils import getPackageDir
 
 from lsst.sims.movingObjects import chebfit, makeChebMatrix, makeChebMatrixOnlyX, chebeval
+from lsst.sims.movingObjects import timeToTicks, ticksToTime
 
 
 class TestChebgrid(unittest.TestCase):
@@ -27,6 +28,17 @@ class TestChebgrid(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             chebeval(np.linspace(-1, 1, 17), p, interval=[1, 2, 3])
 
+    def test_ticks(self):
+        # Test that times round-trip through ticks, and that ticks add up exactly.
+        self.assertEqual(timeToTicks(54800.12345, 5), 5480012345)
+        self.assertEqual(ticksToTime(5480012345, 5), 54800.12345)
+        self.assertEqual(timeToTicks(0.6, 0), 1)
+        self.assertEqual(timeToTicks(0.6, 0, roundDown=True), 0)
+        times = 54800.0 + np.arange(0, 30, 0.1)
+        ticks = timeToTicks(times, 10)
+        np.testing.assert_array_equal(np.diff(ticks), 1000000000)
+        np.testing.assert_array_equal(timeToTicks(ticksToTime(ticks, 10), 10), ticks)
+
     def test_eval(self):
         x = np.linspace(-1, 1, 9)
         y = np.sin(x)
@@ -1,12 +1,15 @@
 from __future__ import print_function
 import unittest
+from unittest import mock
 import os
 import numpy as np
 import pandas as pd
 from astropy.time import Time
 from pandas.util.testing import assert_frame_equal
 from lsst.sims.movingObjects import Orbits
+from lsst.sims.movingObjects import BaseEphemerides
 from lsst.sims.movingObjects import PyOrbEphemerides
+from lsst.sims.movingObjects import SyntheticEphemerides
 from lsst.utils import getPackageDir
 
 
@@ -32,6 +35,36 @@ class TestPyOrbEphemerides(unittest.TestCase):
         del self.orbitsKEP
         del self.ephems
 
+    def testSession(self):
+        # OpenOrb should be initialized once per ephemeris file, not once per instance.
+        from lsst.sims.movingObjects import ephemerides
+        self.assertEqual(ephemerides._oorbSession['ephfile'], self.ephems.ephfile)
+        ephems2 = PyOrbEphemerides(ephfile=self.ephems.ephfile)
+        self.assertEqual(ephemerides._oorbSession['ephfile'], ephems2.ephfile)
+        # Ephemerides from either instance (sharing the session) should agree.
+        self.ephems.setOrbits(self.orbits)
+        ephems2.setOrbits(self.orbits)
+        times = np.arange(49353, 49353 + 2, 0.5)
+        np.testing.assert_equal(self.ephems.generateEphemerides(times),
+                                ephems2.generateEphemerides(times))
+        # Count the calls to oorb_init.
+        try:
+            with mock.patch.object(ephemerides.oo.pyoorb, 'oorb_init', return_value=0) as oorbInit:
+                PyOrbEphemerides(ephfile=self.ephems.ephfile)
+                self.assertEqual(oorbInit.call_count, 0)
+                PyOrbEphemerides(ephfile='other.dat')
+                self.assertEqual(oorbInit.call_count, 1)
+                # A pool worker always initializes oorb (with a new lock), whatever it inherited.
+                lock = ephemerides._oorbLock
+                ephemerides._initOorbWorker('other.dat')
+                self.assertEqual(oorbInit.call_count, 2)
+                self.assertIsNot(ephemerides._oorbLock, lock)
+                self.assertEqual(ephemerides._oorbSession['ephfile'], 'other.dat')
+        finally:
+            # Restore the real session.
+            ephemerides._oorbSession['ephfile'] = None
+            ephemerides._oorbSessionInit(self.ephems.ephfile)
+
     def testSetOrbits(self):
         # Test that we can set orbits.
         self.ephems.setOrbits(self.orbits)
@@ -121,6 +154,185 @@ class TestPyOrbEphemerides(unittest.TestCase):
         for column in ephsAll.dtype.names:
             np.testing.assert_allclose(ephsAllKEP[column], ephsAll[column], rtol=0, atol=1e-7)
 
+    def testConvertColumns(self):
+        self.ephems.setOrbits(self.orbits)
+        times = np.arange(49353, 49353 + 2, 0.3)
+        oorbEphs = self.ephems._generateOorbEphs(self.ephems._convertTimes(times), obscode=807)
+        # pyoorb returns a Fortran ordered array.
+        self.assertTrue(oorbEphs.flags.f_contiguous)
+        ephs = self.ephems._convertOorbEphs(oorbEphs, byObject=True)
+        # Fortran ordered arrays are copied into packed records, which can be copied and indexed.
+        ephsRaDec = self.ephems._convertOorbEphs(oorbEphs, byObject=True, columns=['ra', 'dec'])
+        self.assertEqual(ephsRaDec.dtype.names, ('ra', 'dec'))
+        self.assertFalse(np.shares_memory(ephsRaDec, oorbEphs))
+        self.assertEqual(ephsRaDec[[0, 1]].dtype.itemsize, 16)
+        np.testing.assert_equal(ephsRaDec['ra'], ephs['ra'])
+        ephsRaDec = self.ephems._convertOorbEphs(oorbEphs, byObject=False, columns=['ra', 'dec'])
+        self.assertEqual(ephsRaDec.shape, (len(times), len(self.orbits)))
+        np.testing.assert_equal(ephsRaDec['dec'], ephs['dec'].T)
+        # Float32 output.
+        ephs32 = self.ephems.generateEphemerides(times, obscode=807, dtype=np.float32,
+                                                 columns=['ra', 'velocity'])
+        self.assertEqual(ephs32['ra'].dtype, np.float32)
+        np.testing.assert_allclose(ephs32['velocity'], ephs['velocity'], rtol=1e-6)
+        with self.assertRaises(ValueError):
+            self.ephems._convertOorbEphs(oorbEphs, columns=['ra', 'rhubarb'])
+
+    def testPropagateOrbits(self):
+        # Ephemerides from propagated orbits should match those from the original orbits.
+        self.ephems.setOrbits(self.orbits)
+        times = np.arange(49353 + 500, 49353 + 502, 0.3)
+        ephs = self.ephems.generateEphemerides(times, obscode=807, timeScale='TT')
+        newEphems = self.ephems.propagateOrbits(49353 + 500)
+        np.testing.assert_allclose(newEphems.orbitObj.orbits['epoch'], 49353 + 500)
+        np.testing.assert_array_equal(newEphems.orbitObj.orbits['objId'], self.orbits.orbits['objId'])
+        newEphs = newEphems.generateEphemerides(times, obscode=807, timeScale='TT')
+        for column in ('ra', 'dec'):
+            np.testing.assert_allclose(newEphs[column], ephs[column], rtol=0, atol=1e-6)
+
+    def testCheckpoints(self):
+        # Ephemerides starting from the checkpoints should match those from the orbit epoch.
+        self.ephems.setOrbits(self.orbits)
+        ckptEphems = PyOrbEphemerides(checkpointInterval=100)
+        ckptEphems.setOrbits(self.orbits)
+        for tStart in (49353 + 300, 49353 + 710, 49353 + 290):
+            times = np.arange(tStart, tStart + 2, 0.3)
+            ephs = self.ephems.generateEphemerides(times, obscode=807, timeScale='UTC')
+            ckptEphs = ckptEphems.generateEphemerides(times, obscode=807, timeScale='UTC')
+            for column in ('ra', 'dec'):
+                np.testing.assert_allclose(ckptEphs[column], ephs[column], rtol=0, atol=1e-6)
+        self.assertEqual(sorted(ckptEphems.checkpoints.keys()), [49600, 49700, 50100])
+        # New orbits start without checkpoints, but the checkpoints are kept for the previous orbits.
+        ckptEphems.setOrbits(self.orbitsKEP)
+        self.assertEqual(len(ckptEphems.checkpoints), 0)
+        ckptEphems.setOrbits(self.orbits)
+        self.assertEqual(sorted(ckptEphems.checkpoints.keys()), [49600, 49700, 50100])
+
+    def testEphemerisBlocks(self):
+        # Ephemerides generated in blocks should match those generated all at once.
+        self.ephems.setOrbits(self.orbits)
+        times = np.arange(49353, 49353 + 60, 0.5)
+        ephs = self.ephems.generateEphemerides(times, obscode=807, timeScale='UTC', byObject=False)
+        blocks = list(self.ephems.generateEphemeridesBlocks(times, blockSize=25, obscode=807,
+                                                            timeScale='UTC', byObject=False))
+        self.assertEqual(len(blocks), 5)
+        self.assertEqual(len(blocks[-1]), len(times) - 4 * 25)
+        ephsBlocks = np.concatenate(blocks)
+        np.testing.assert_equal(ephsBlocks['time'], ephs['time'])
+        for column in ('ra', 'dec'):
+            np.testing.assert_allclose(ephsBlocks[column], ephs[column], rtol=0, atol=1e-6)
+
+    def testParallelEphemeris(self):
+        # Check that ephemerides from a pool of worker processes match the serial ephemerides.
+        self.ephems.setOrbits(self.orbits)
+        times = np.arange(49353, 49353 + 2, 0.3)
+        ephs = self.ephems.generateEphemerides(times, obscode=807, timeScale='UTC')
+        parallelEphems = PyOrbEphemerides(nProcs=2)
+        parallelEphems.setOrbits(self.orbits)
+        ephsParallel = parallelEphems.generateEphemerides(times, obscode=807, timeScale='UTC')
+        parallelEphems.close()
+        np.testing.assert_equal(ephsParallel, ephs)
+
+    def testMultiSiteEphemeris(self):
+        # Check that ephemerides for several sites match those generated for each site separately.
+        self.ephems.setOrbits(self.orbits)
+        times = np.arange(49353, 49353 + 2, 0.3)
+        obscodes = [807, 309, 500]
+        ephs = self.ephems.generateEphemeridesMultiSite(times, obscodes, timeScale='UTC', byObject=True)
+        self.assertEqual(ephs.shape, (len(obscodes), len(self.orbits), len(times)))
+        for i, obscode in enumerate(obscodes):
+            ephsSite = self.ephems.generateEphemerides(times, obscode=obscode, timeScale='UTC', byObject=True)
+            np.testing.assert_allclose(ephs['dec'][i], ephsSite['dec'], rtol=0, atol=5e-6)
+            dRa = (ephs['ra'][i] - ephsSite['ra'] + 180.) % 360. - 180.
+            np.testing.assert_allclose(dRa * np.cos(np.radians(ephsSite['dec'])), 0, rtol=0, atol=5e-6)
+            np.testing.assert_allclose(ephs['delta'][i], ephsSite['delta'], rtol=1e-6, atol=0)
+            np.testing.assert_allclose(ephs['dradt'][i], ephsSite['dradt'], rtol=0, atol=1e-4)
+            np.testing.assert_allclose(ephs['ddecdt'][i], ephsSite['ddecdt'], rtol=0, atol=1e-4)
+        # The sites should not all be the same.
+        self.assertGreater(np.abs(ephs['dec'][0] - ephs['dec'][2]).max(), 1e-5)
+
+
+@unittest.skipIf(not _has_numexpr, "No numexpr available.")
+class TestSyntheticEphemerides(unittest.TestCase):
+    def setUp(self):
+        self.testdir = os.path.join(getPackageDir('sims_movingObjects'), 'tests/orbits_testdata')
+        self.orbits = Orbits()
+        self.orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
+        self.orbitsKEP = Orbits()
+        self.orbitsKEP.readOrbits(os.path.join(self.testdir, 'test_orbitsA.des'))
+
+    def testEphemeris(self):
+        times = np.arange(49353, 49353 + 2, 0.3)
+        ephems = SyntheticEphemerides()
+        ephems.setOrbits(self.orbits)
+        ephs = ephems.generateEphemerides(times, timeScale='UTC', byObject=True)
+        self.assertEqual(ephs.shape, (len(self.orbits), len(times)))
+        # The results should be deterministic, and the same for KEP and COM versions of the orbits.
+        np.testing.assert_equal(ephs, ephems.generateEphemerides(times, timeScale='UTC', byObject=True))
+        ephems.setOrbits(self.orbitsKEP)
+        ephsKEP = ephems.generateEphemerides(times, timeScale='UTC', byObject=True)
+        for column in ('ra', 'dec', 'delta', 'magV'):
+            np.testing.assert_allclose(ephs[column], ephsKEP[column], rtol=0, atol=1e-5)
+
+    def testEphemerisBlocks(self):
+        times = np.arange(49353, 49353 + 20, 0.3)
+        ephems = SyntheticEphemerides()
+        ephems.setOrbits(self.orbits)
+        ephs = ephems.generateEphemerides(times, timeScale='UTC', byObject=True)
+        blocks = list(ephems.generateEphemeridesBlocks(times, blockSize=16, timeScale='UTC', byObject=True))
+        np.testing.assert_equal(np.concatenate(blocks, axis=1), ephs)
+
+    def testIncompleteBackend(self):
+        # A backend which does not implement all of the abstract methods cannot be created.
+        class NoPropagation(BaseEphemerides):
+            def generateEphemerides(self, times, timeScale='UTC', obscode=807, byObject=True,
+                                    verbose=False, columns=None, dtype=np.float64):
+                return None
+        with self.assertRaises(TypeError):
+            NoPropagation()
+        with self.assertRaises(TypeError):
+            BaseEphemerides()
+
+    def testConvertColumns(self):
+        # C ordered ephemeris arrays are converted without copies; Fortran ordered arrays (as returned by
+        # pyoorb) would give overlapping records, so are copied into packed records instead.
+        ephems = SyntheticEphemerides()
+        oorbEphs = np.random.RandomState(42).uniform(0, 1, (3, 4, 34))
+        ephs = ephems._convertOorbEphs(oorbEphs, byObject=True, columns=['ra', 'dec'])
+        for order in ('C', 'F'):
+            layout = np.array(oorbEphs, order=order)
+            for byObject in (True, False):
+                ephsLayout = ephems._convertOorbEphs(layout, byObject=byObject, columns=['ra', 'dec'])
+                self.assertEqual(np.shares_memory(ephsLayout, layout), order == 'C')
+                for column in ('ra', 'dec'):
+                    expected = ephs[column] if byObject else ephs[column].T
+                    np.testing.assert_equal(ephsLayout[column], expected)
+                # Copies and fancy indexing of the result should need no more than one oorb row per
+                # record, and exactly the requested columns for packed records.
+                itemsize = 8 * 2 if order == 'F' else 8 * oorbEphs.shape[2]
+                self.assertEqual(ephsLayout.copy().dtype.itemsize, itemsize)
+                self.assertEqual(ephsLayout[[0, 2]].dtype.itemsize, itemsize)
+                self.assertEqual(ephsLayout[ephsLayout['ra'] > 0.5].dtype.itemsize, itemsize)
+                self.assertEqual(ephsLayout.copy().nbytes, ephsLayout.size * itemsize)
+        # A non-contiguous array is copied.
+        ephsCopy = ephems._convertOorbEphs(oorbEphs[::2], byObject=True, columns=['ra', 'dec'])
+        self.assertFalse(np.shares_memory(ephsCopy, oorbEphs))
+        np.testing.assert_equal(ephsCopy['ra'], ephs['ra'][::2])
+
+    def testPropagate(self):
+        # Two-body propagation should not change the ephemerides.
+        times = np.arange(49353, 49353 + 2, 0.3)
+        for orbits in (self.orbits, self.orbitsKEP):
+            ephems = SyntheticEphemerides()
+            ephems.setOrbits(orbits)
+            ephs = ephems.generateEphemerides(times, timeScale='TT')
+            newEphems = ephems.propagateOrbits(49353 + 100)
+            self.assertTrue(isinstance(newEphems, SyntheticEphemerides))
+            np.testing.assert_allclose(newEphems.orbitObj.orbits['epoch'], 49353 + 100)
+            newEphs = newEphems.generateEphemerides(times, timeScale='TT')
+            for column in ('ra', 'dec', 'delta'):
+                np.testing.assert_allclose(ephs[column], newEphs[column], rtol=0, atol=1e-8)
+
 
 @unittest.skipIf(not _has_numexpr, "No numexpr available.")
 class TestJPLValues(unittest.TestCase):
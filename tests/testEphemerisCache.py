@@ -0,0 +1,150 @@
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from lsst.sims.movingObjects import EphemerisCache
+
+
+class TestEphemerisCache(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.oorbElem = np.random.RandomState(42).uniform(0, 1, (5, 12))
+        self.ephTimes = np.column_stack([np.arange(49353, 49363, 0.5), np.zeros(20) + 4])
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir)
+
+    def testKey(self):
+        cache = EphemerisCache(self.cacheDir)
+        key = cache.makeKey(self.oorbElem, self.ephTimes, 807, 'de405.dat')
+        self.assertEqual(key, cache.makeKey(self.oorbElem.copy(), self.ephTimes, 807, 'de405.dat'))
+        # Any change in orbits, times, obscode, ephemeris file or mode should change the key.
+        oorbElem = self.oorbElem.copy()
+        oorbElem[2, 3] += 1e-12
+        keys = [cache.makeKey(oorbElem, self.ephTimes, 807, 'de405.dat'),
+                cache.makeKey(self.oorbElem, self.ephTimes[:-1], 807, 'de405.dat'),
+                cache.makeKey(self.oorbElem, self.ephTimes, 309, 'de405.dat'),
+                cache.makeKey(self.oorbElem, self.ephTimes, 807, 'de430.dat'),
+                cache.makeKey(self.oorbElem, self.ephTimes, 807, 'de405.dat', ephMode='2body')]
+        self.assertEqual(len(set(keys + [key])), len(keys) + 1)
+
+    def testOrbitKeys(self):
+        cache = EphemerisCache(self.cacheDir)
+        keys = cache.makeKeys(self.oorbElem, self.ephTimes, 807, 'de405.dat')
+        self.assertEqual(len(set(keys)), len(self.oorbElem))
+        # The key of an orbit does not depend on its position (or orbit id) within oorbElem.
+        oorbElem = self.oorbElem[::-1].copy()
+        oorbElem[:, 0] = np.arange(len(oorbElem))
+        np.testing.assert_array_equal(cache.makeKeys(oorbElem, self.ephTimes, 807, 'de405.dat'), keys[::-1])
+        # Changing one orbit only changes its own key.
+        oorbElem = self.oorbElem.copy()
+        oorbElem[2, 3] += 1e-12
+        changed = cache.makeKeys(oorbElem, self.ephTimes, 807, 'de405.dat') != keys
+        np.testing.assert_array_equal(changed, np.arange(len(keys)) == 2)
+
+    def testEphfileKey(self):
+        # Replacing the ephemeris file (even with the same name) should change the key.
+        cache = EphemerisCache(self.cacheDir)
+        ephfile = os.path.join(self.cacheDir, 'de405.dat')
+        with open(ephfile, 'w') as f:
+            f.write('a')
+        key = cache.makeKey(self.oorbElem, self.ephTimes, 807, ephfile)
+        with open(ephfile, 'w') as f:
+            f.write('ab')
+        self.assertNotEqual(key, cache.makeKey(self.oorbElem, self.ephTimes, 807, ephfile))
+        os.remove(ephfile)
+
+    def testGetPutOrbits(self):
+        cache = EphemerisCache(self.cacheDir)
+        keys = cache.makeKeys(self.oorbElem, self.ephTimes, 807, 'de405.dat')
+        ephs = np.random.RandomState(4).uniform(0, 1, (5, 20, 10))
+        oorbEphs, found = cache.getOrbits(keys)
+        self.assertIsNone(oorbEphs)
+        self.assertFalse(found.any())
+        cache.putOrbits(keys[[1, 3]], ephs[[1, 3]])
+        oorbEphs, found = cache.getOrbits(keys)
+        np.testing.assert_array_equal(found, [False, True, False, True, False])
+        np.testing.assert_equal(oorbEphs[found], ephs[[1, 3]])
+        # The orbits are stored as a block (plus its keys) in a directory for the time grid.
+        gridDirs = os.listdir(self.cacheDir)
+        self.assertEqual(len(gridDirs), 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.cacheDir, gridDirs[0]))), 2)
+        # Orbits from several blocks can be combined; a single block is returned memory-mapped.
+        cache.putOrbits(keys[[0, 2, 4]], ephs[[0, 2, 4]])
+        oorbEphs, found = cache.getOrbits(keys)
+        self.assertTrue(found.all())
+        np.testing.assert_equal(oorbEphs, ephs)
+        oorbEphs, found = cache.getOrbits(keys[[0, 2, 4]])
+        self.assertIsInstance(oorbEphs, np.memmap)
+        np.testing.assert_equal(oorbEphs, ephs[[0, 2, 4]])
+        # The blocks should be found by a new instance (e.g. another process).
+        oorbEphs, found = EphemerisCache(self.cacheDir).getOrbits(keys[::-1])
+        self.assertTrue(found.all())
+        np.testing.assert_equal(oorbEphs, ephs[::-1])
+
+    def testEvictOrbits(self):
+        ephs = np.zeros((5, 20, 10))
+        size = ephs.nbytes + 1000
+        # Room for only two blocks.
+        cache = EphemerisCache(self.cacheDir, maxBytes=2.5 * size)
+        scans = []
+        entries = cache._entries
+        cache._entries = lambda: scans.append(1) or entries()
+        keys = []
+        for i in range(3):
+            oorbElem = self.oorbElem + i
+            keys.append(cache.makeKeys(oorbElem, self.ephTimes, 807, 'de405.dat'))
+            cache.putOrbits(keys[i], ephs + i)
+            # Using the first block makes the second the least recently used.
+            if i == 1:
+                gridDir = os.path.join(self.cacheDir, os.listdir(self.cacheDir)[0])
+                for filename in os.listdir(gridDir):
+                    os.utime(os.path.join(gridDir, filename), (1000, 1000))
+                cache.getOrbits(keys[0])
+        # The cache directory is only scanned for the first block, and when the cache is full.
+        self.assertEqual(len(scans), 2)
+        self.assertFalse(cache.getOrbits(keys[1])[1].any())
+        for i in (0, 2):
+            oorbEphs, found = cache.getOrbits(keys[i])
+            self.assertTrue(found.all())
+            np.testing.assert_equal(oorbEphs, ephs + i)
+        cache.clear()
+        self.assertEqual(os.listdir(self.cacheDir), [])
+        self.assertFalse(cache.getOrbits(keys[0])[1].any())
+
+    def testGetPut(self):
+        cache = EphemerisCache(self.cacheDir)
+        key = cache.makeKey(self.oorbElem, self.ephTimes, 807, 'de405.dat')
+        self.assertIsNone(cache.get(key))
+        ephs = np.random.RandomState(4).uniform(0, 1, (5, 20, 10))
+        cache.put(key, ephs)
+        np.testing.assert_equal(cache.get(key), ephs)
+        # No temporary files should be left behind.
+        self.assertEqual(os.listdir(self.cacheDir), [key + '.npy'])
+        # Cache should be usable from a new instance (e.g. another process).
+        cache2 = EphemerisCache(self.cacheDir)
+        np.testing.assert_equal(cache2.get(key), ephs)
+
+    def testEviction(self):
+        ephs = np.zeros((5, 20, 10))
+        size = ephs.nbytes + 128
+        # Room for only three sets of ephemerides.
+        cache = EphemerisCache(self.cacheDir, maxBytes=3.5 * size)
+        keys = ['a', 'b', 'c']
+        for i, key in enumerate(keys):
+            cache.put(key, ephs + i)
+            os.utime(os.path.join(self.cacheDir, key + '.npy'), (1000 + i, 1000 + i))
+        # Using 'a' makes 'b' the least recently used.
+        cache.get('a')
+        cache.put('d', ephs + 3)
+        self.assertIsNone(cache.get('b'))
+        for key in ('a', 'c', 'd'):
+            self.assertIsNotNone(cache.get(key))
+        cache.clear()
+        self.assertEqual(os.listdir(self.cacheDir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
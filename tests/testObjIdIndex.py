@@ -0,0 +1,35 @@
+from __future__ import print_function
+import unittest
+import numpy as np
+from lsst.sims.movingObjects import ObjIdIndex
+
+
+class TestObjIdIndex(unittest.TestCase):
+    def testEncodeDecode(self):
+        objIds = np.array(['c', 'a', 'b', 'a'], dtype=object)
+        index = ObjIdIndex()
+        idx = index.add(objIds)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(idx.dtype, np.int32)
+        np.testing.assert_array_equal(index.decode(idx), objIds)
+        np.testing.assert_array_equal(index.encode(['b', 'c']), idx[[2, 0]])
+        np.testing.assert_array_equal(index.decode(index.sortedIndexes()), ['a', 'b', 'c'])
+        np.testing.assert_array_equal(index.contains(['a', 'd']), [True, False])
+        with self.assertRaises(ValueError):
+            index.encode(['d'])
+        np.testing.assert_array_equal(index.encode(['d', 'a'], strict=False), [-1, idx[1]])
+
+    def testAdd(self):
+        index = ObjIdIndex(np.array([5, 3, 9]))
+        before = index.encode([3, 5, 9])
+        # Adding objIds should not change the indexes of the existing objIds.
+        newIdx = index.add(np.array([4, 9, 1]))
+        self.assertEqual(len(index), 5)
+        np.testing.assert_array_equal(index.encode([3, 5, 9]), before)
+        np.testing.assert_array_equal(index.decode(newIdx), [4, 9, 1])
+        np.testing.assert_array_equal(np.sort(index.encode([1, 3, 4, 5, 9])), np.arange(5))
+        np.testing.assert_array_equal(index.decode(index.sortedIndexes()), [1, 3, 4, 5, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from __future__ import print_function
+import unittest
+import numpy as np
+import pandas as pd
+from lsst.sims.movingObjects import comToKep, kepToCom, comToCart, cartToCom, kepToCart, cartToKep
+from lsst.sims.movingObjects import semiMajorAxis
+
+
+class TestOrbitalElements(unittest.TestCase):
+    def setUp(self):
+        # Elliptic, hyperbolic, parabolic, circular and ecliptic orbits.
+        self.q = np.array([2.1, 0.9, 15., 1.3, 0.5, 1.0, 3.0])
+        self.e = np.array([0.15, 0.6, 0.97, 1.8, 4.0, 1.0, 0.0])
+        self.inc = np.array([10., 170., 45., 30., 5., 60., 0.])
+        self.Omega = np.array([80., 200., 10., 300., 150., 45., 0.])
+        self.argPeri = np.array([20., 350., 120., 90., 270., 180., 0.])
+        self.tPeri = np.array([54900., 54700., 55500., 54810., 54795., 54850., 54790.])
+        self.epoch = np.zeros(len(self.q)) + 54800.
+
+    def testComCart(self):
+        state = comToCart(self.q, self.e, self.inc, self.Omega, self.argPeri, self.tPeri, self.epoch)
+        # Angular momentum should match the cometary elements.
+        pos = np.array(state[:3])
+        vel = np.array(state[3:])
+        h = np.cross(pos, vel, axis=0)
+        gm = 0.01720209895**2
+        np.testing.assert_allclose(np.sqrt(np.sum(h**2, axis=0)), np.sqrt(gm * self.q * (1 + self.e)),
+                                   rtol=1e-10)
+        np.testing.assert_allclose(np.degrees(np.arccos(h[2] / np.sqrt(np.sum(h**2, axis=0)))), self.inc,
+                                   rtol=0, atol=1e-8)
+        q, e, inc, Omega, argPeri, tPeri = cartToCom(*state + (self.epoch,))
+        np.testing.assert_allclose(q, self.q, rtol=1e-10)
+        np.testing.assert_allclose(e, self.e, rtol=0, atol=1e-10)
+        np.testing.assert_allclose(inc, self.inc, rtol=0, atol=1e-8)
+        # Skip the angles which are undefined for the circular, ecliptic orbit.
+        np.testing.assert_allclose(Omega[:-1], self.Omega[:-1], rtol=0, atol=1e-8)
+        np.testing.assert_allclose(argPeri[:-1], self.argPeri[:-1], rtol=0, atol=1e-6)
+        np.testing.assert_allclose(tPeri[:-1], self.tPeri[:-1], rtol=0, atol=1e-5)
+        # But all of the orbits should map back to the same states.
+        state2 = comToCart(q, e, inc, Omega, argPeri, tPeri, self.epoch)
+        np.testing.assert_allclose(np.array(state2), np.array(state), rtol=0, atol=1e-10)
+
+    def testComKep(self):
+        notParabolic = self.e != 1
+        q = self.q[notParabolic]
+        e = self.e[notParabolic]
+        tPeri = self.tPeri[notParabolic]
+        epoch = self.epoch[notParabolic]
+        a, meanAnomaly = comToKep(q, e, tPeri, epoch)
+        self.assertTrue(np.all((a < 0) == (e > 1)))
+        self.assertTrue(np.all((meanAnomaly[e < 1] >= 0) & (meanAnomaly[e < 1] < 360)))
+        q2, tPeri2 = kepToCom(a, e, meanAnomaly, epoch)
+        np.testing.assert_allclose(q2, q, rtol=1e-12)
+        # Elliptic orbits may return to a different perihelion passage.
+        period = 2 * np.pi / np.sqrt(0.01720209895**2 / np.abs(a)**3)
+        dt = (tPeri2 - tPeri) / np.where(e < 1, period, np.inf)
+        np.testing.assert_allclose(dt, np.round(dt), rtol=0, atol=1e-9)
+        np.testing.assert_allclose(tPeri2[e > 1], tPeri[e > 1], rtol=0, atol=1e-6)
+        # KEP and CART.
+        state = kepToCart(a, e, self.inc[notParabolic], self.Omega[notParabolic],
+                          self.argPeri[notParabolic], meanAnomaly, epoch)
+        elements = cartToKep(*state + (epoch,))
+        np.testing.assert_allclose(elements[0], a, rtol=1e-10)
+        np.testing.assert_allclose(elements[1], e, rtol=0, atol=1e-10)
+        with self.assertRaises(ValueError):
+            comToKep(self.q, self.e, self.tPeri, self.epoch)
+
+    def testSemiMajorAxis(self):
+        notParabolic = self.e != 1
+        com = pd.DataFrame({'q': self.q[notParabolic], 'e': self.e[notParabolic]})
+        a = semiMajorAxis(com)
+        np.testing.assert_allclose(a, self.q[notParabolic] / (1 - self.e[notParabolic]), rtol=1e-12)
+        np.testing.assert_allclose(semiMajorAxis(pd.DataFrame({'a': a})), a, rtol=0)
+        state = comToCart(self.q, self.e, self.inc, self.Omega, self.argPeri, self.tPeri, self.epoch)
+        cart = pd.DataFrame(dict(zip(['x', 'y', 'z', 'xdot', 'ydot', 'zdot'], state)))
+        np.testing.assert_allclose(semiMajorAxis(cart)[notParabolic], a, rtol=1e-10)
+        with self.assertRaises(ValueError):
+            semiMajorAxis(pd.DataFrame({'e': self.e}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
 from __future__ import print_function
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
 from lsst.sims.movingObjects import Orbits
+from lsst.sims.movingObjects import OrbitFileReader
+from lsst.sims.movingObjects import CompactOrbits
 from lsst.utils import getPackageDir
 
 
@@ -52,6 +56,58 @@ class TestOrbits(unittest.TestCase):
             self.assertEqual(orb.orbits.index, i)
 
 
+    def testViews(self):
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsNEO.s3m'), skiprows=1)
+        # Negative and out of range indexes.
+        self.assertEqual(orbits[-1], orbits[len(orbits) - 1])
+        with self.assertRaises(IndexError):
+            orbits[len(orbits)]
+        # Column values of a slice view should share memory with the parent orbits.
+        view = orbits[2:6]
+        self.assertEqual(len(view), 4)
+        np.testing.assert_equal(view.column('q'), orbits.orbits['q'].values[2:6])
+        self.assertTrue(np.shares_memory(view.column('q'), orbits.column('q')))
+        # Iterate in chunks.
+        chunks = list(orbits.iterChunks(3))
+        self.assertEqual([len(c) for c in chunks], [3, 3, 2])
+        for chunk in chunks:
+            self.assertTrue(isinstance(chunk, Orbits))
+            self.assertEqual(chunk.format, orbits.format)
+        objIds = np.concatenate([c.column('objId') for c in chunks])
+        np.testing.assert_equal(objIds, orbits.orbits['objId'].values)
+        assert_frame_equal(chunks[1].orbits, orbits.orbits.iloc[3:6])
+        with self.assertRaises(ValueError):
+            list(orbits.iterChunks(0))
+
+    def testSelect(self):
+        """
+        Test selecting orbits by objId.
+        """
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'S0_1000.s3m'), skiprows=1)
+        objIds = orbits.orbits['objId'].values[[500, 3, 997, 3]]
+        selected = orbits.select(objIds)
+        self.assertEqual(len(selected), 4)
+        np.testing.assert_array_equal(selected.column('objId'), objIds)
+        np.testing.assert_array_equal(selected.orbits['q'].values,
+                                      orbits.orbits['q'].values[[500, 3, 997, 3]])
+        np.testing.assert_array_equal(orbits.objIdRows(objIds[:2]), [500, 3])
+        # Selecting from a view (and from a selection).
+        view = orbits[100:200]
+        np.testing.assert_array_equal(view.objIdRows(orbits.orbits['objId'].values[[150, 100]]), [50, 0])
+        self.assertEqual(selected.select(objIds[1:2]).column('objId')[0], objIds[1])
+        with self.assertRaises(ValueError):
+            view.select(objIds[:1])
+        with self.assertRaises(ValueError):
+            orbits.select(['notAnObject'])
+        np.testing.assert_array_equal(orbits.objIdRows(['notAnObject', objIds[3]], strict=False),
+                                      [-1, orbits.objIdRows(objIds[3])[0]])
+        # The index is rebuilt when the orbits are replaced.
+        newOrbits = orbits.orbits.iloc[::-1].reset_index(drop=True)
+        orbits.setOrbits(newOrbits)
+        np.testing.assert_array_equal(orbits.objIdRows(objIds[:2]), [497, 994])
+
     def testSlicing(self):
         """
         Test that we can slice a collection of orbits
@@ -151,6 +207,16 @@ class TestOrbits(unittest.TestCase):
         newOrbits = Orbits()
         with self.assertRaises(ValueError):
             newOrbits.setOrbits(neworbits)
+        # Trusted orbits are not validated (or completed), only the format is determined.
+        suborbits = orbits.orbits.copy()
+        suborbits['epoch'] = 0.
+        del suborbits['sed_filename']
+        newOrbits = Orbits()
+        newOrbits.setOrbits(suborbits, validate=False)
+        self.assertEqual(newOrbits.format, 'COM')
+        self.assertIs(newOrbits.orbits, suborbits)
+        with self.assertRaises(ValueError):
+            newOrbits.setOrbits(suborbits)
 
     def testSetSeds(self):
         """
@@ -170,6 +236,176 @@ class TestOrbits(unittest.TestCase):
         orbits2.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
         sedvals2 = orbits2.assignSed(orbits2.orbits, randomSeed=42)
         np.testing.assert_array_equal(sedvals, sedvals2)
+        # The SED of each object should not depend on how the orbits are chunked.
+        orbits.readOrbits(os.path.join(self.testdir, 'S0_1000.s3m'), skiprows=1)
+        sedvals = orbits.assignSed(orbits.orbits, randomSeed=42)
+        sedvals2 = np.concatenate([orbits.assignSed(orbits.orbits.iloc[i:i + 300], randomSeed=42)
+                                   for i in range(0, len(orbits), 300)])
+        np.testing.assert_array_equal(sedvals, sedvals2)
+        self.assertFalse(np.array_equal(sedvals, orbits.assignSed(orbits.orbits, randomSeed=43)))
+        # Test assignment to another mix of SEDs.
+        sedMix = {'V.dat': 0.1, 'X.dat': 0.3, 'Cb.dat': lambda a: np.where(a > 2.5, 0.6, 0)}
+        sedvals = orbits.assignSed(orbits.orbits, randomSeed=42, sedMix=sedMix)
+        self.assertEqual(set(sedvals), set(sedMix))
+        a = orbits.orbits['q'] / (1 - orbits.orbits['e'])
+        self.assertFalse(np.any(sedvals[np.where(a <= 2.5)] == 'Cb.dat'))
+        with self.assertRaises(ValueError):
+            orbits.assignSed(orbits.orbits, sedMix={'notAnSed.dat': 1})
+
+    def testHashOrbits(self):
+        """
+        Test that orbit hashes only change when the orbit changes.
+        """
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
+        orbits2 = Orbits()
+        orbits2.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
+        hashes = orbits.hashOrbits()
+        self.assertEqual(len(hashes), len(orbits))
+        self.assertEqual(len(np.unique(hashes)), len(orbits))
+        np.testing.assert_array_equal(hashes, orbits2.hashOrbits())
+        # Changing the objId or sed does not change the hash, but changing an element does.
+        newOrbits = orbits.orbits.copy()
+        newOrbits['objId'] = ['x%d' % i for i in range(len(newOrbits))]
+        newOrbits['sed_filename'] = 'S.dat'
+        newOrbits.loc[newOrbits.index[1], 'inc'] += 1e-8
+        orbits2.setOrbits(newOrbits)
+        hashes2 = orbits2.hashOrbits()
+        self.assertNotEqual(hashes[1], hashes2[1])
+        np.testing.assert_array_equal(np.delete(hashes, 1), np.delete(hashes2, 1))
+
+    def testConvertFormat(self):
+        """
+        Test that orbits can be converted between COM, KEP and CART formats.
+        """
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
+        orbitsCart = orbits.convertFormat('CART')
+        self.assertEqual(orbitsCart.format, 'CART')
+        for col in orbitsCart.dataCols['CART']:
+            self.assertTrue(col in orbitsCart.orbits)
+        np.testing.assert_array_equal(orbitsCart.orbits['objId'].values, orbits.orbits['objId'].values)
+        orbitsKep = orbitsCart.convertFormat('KEP')
+        orbitsA = Orbits()
+        orbitsA.readOrbits(os.path.join(self.testdir, 'test_orbitsA.des'))
+        for col in ('a', 'e', 'inc'):
+            np.testing.assert_allclose(orbitsKep.orbits[col].values, orbitsA.orbits[col].values, rtol=1e-4)
+        orbitsCom = orbitsKep.convertFormat('COM')
+        for col in ('q', 'e', 'inc', 'Omega', 'argPeri'):
+            np.testing.assert_allclose(orbitsCom.orbits[col].values, orbits.orbits[col].values,
+                                       rtol=1e-8)
+        with self.assertRaises(ValueError):
+            orbits.convertFormat('EQU')
+
+    def testBinaryOrbits(self):
+        """
+        Test that orbits can be written to and read from the binary format.
+        """
+        outDir = tempfile.mkdtemp()
+        try:
+            for orbitFile, skiprows in (('test_orbitsQ.des', None), ('test_orbitsNEO.s3m', 1)):
+                orbits = Orbits()
+                orbits.readOrbits(os.path.join(self.testdir, orbitFile), skiprows=skiprows)
+                binDir = os.path.join(outDir, orbitFile)
+                orbits.writeOrbitsBinary(binDir)
+                for mmap in (True, False):
+                    orbits2 = Orbits()
+                    orbits2.readOrbitsBinary(binDir, mmap=mmap)
+                    self.assertEqual(orbits2.format, orbits.format)
+                    for col in orbits.orbits.columns:
+                        np.testing.assert_array_equal(np.asarray(orbits2.orbits[col].values),
+                                                      orbits.orbits[col].values)
+                    # SEDs are read back as categorical columns.
+                    self.assertIsInstance(orbits2.orbits['sed_filename'].dtype, pd.CategoricalDtype)
+                # readOrbits should recognize the binary format too.
+                orbits3 = Orbits()
+                orbits3.readOrbits(binDir)
+                np.testing.assert_array_equal(orbits3.hashOrbits(), orbits.hashOrbits())
+            with self.assertRaises(ValueError):
+                Orbits().readOrbitsBinary(outDir)
+        finally:
+            shutil.rmtree(outDir)
+
+    def testOrbitFileReader(self):
+        """
+        Test that row ranges and chunks can be read from an orbit file.
+        """
+        orbitFile = os.path.join(self.testdir, 'S0_1000.s3m')
+        orbits = Orbits()
+        orbits.readOrbits(orbitFile, skiprows=1)
+        outDir = tempfile.mkdtemp()
+        try:
+            indexFile = os.path.join(outDir, 'index.npz')
+            reader = OrbitFileReader(orbitFile, skiprows=1, indexFile=indexFile, indexStride=100)
+            self.assertEqual(len(reader), len(orbits))
+            self.assertTrue(os.path.isfile(indexFile))
+            # A second reader should use the saved index.
+            reader2 = OrbitFileReader(orbitFile, skiprows=1, indexFile=indexFile, indexStride=100)
+            np.testing.assert_array_equal(reader2.offsets, reader.offsets)
+            # A corrupt (e.g. truncated) index file is rebuilt, and no temporary files are left behind.
+            with open(indexFile, 'wb') as f:
+                f.write(b'PK\x03\x04truncated')
+            reader3 = OrbitFileReader(orbitFile, skiprows=1, indexFile=indexFile, indexStride=100)
+            np.testing.assert_array_equal(reader3.offsets, reader.offsets)
+            self.assertEqual(os.listdir(outDir), ['index.npz'])
+        finally:
+            shutil.rmtree(outDir)
+        for start, end in ((0, 10), (150, 275), (990, 2000)):
+            orbitsRange = reader.readRange(start, end)
+            expected = orbits.orbits.iloc[start:end]
+            self.assertEqual(len(orbitsRange), len(expected))
+            for col in ('objId', 'q', 'e', 'inc', 'epoch', 'H'):
+                np.testing.assert_array_equal(orbitsRange.orbits[col].values, expected[col].values)
+        chunks = list(reader.iterChunks(300, start=100))
+        self.assertEqual([len(c) for c in chunks], [300, 300, 298])
+        self.assertEqual(chunks[1].orbits['objId'].iloc[0], orbits.orbits['objId'].iloc[400])
+        with self.assertRaises(ValueError):
+            reader.readRange(len(orbits), len(orbits) + 1)
+
+    def testReadOrbitsParallel(self):
+        """
+        Test that parsing orbit files in parallel gives the same orbits as a single process.
+        """
+        for orbitFile, skiprows in (('S0_1000.s3m', 1), ('test_orbitsQ.des', None)):
+            orbits = Orbits()
+            orbits.readOrbits(os.path.join(self.testdir, orbitFile), skiprows=skiprows)
+            for nProcs in (2, 3, 8):
+                orbits2 = Orbits()
+                orbits2.readOrbits(os.path.join(self.testdir, orbitFile), skiprows=skiprows,
+                                   nProcs=nProcs)
+                self.assertEqual(orbits2.format, orbits.format)
+                assert_frame_equal(orbits2.orbits, orbits.orbits)
+
+    def testCompactOrbits(self):
+        """
+        Test the conversions to and from the compact orbit representation.
+        """
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'S0_1000.s3m'), skiprows=1)
+        compact = CompactOrbits(orbits, photDtype=np.float64)
+        self.assertEqual(len(compact), len(orbits))
+        self.assertEqual(compact.sedCode.dtype, np.int8)
+        np.testing.assert_array_equal(compact.objIds, orbits.orbits['objId'].values)
+        assert_frame_equal(compact.toDataFrame(), orbits.orbits)
+        self.assertEqual(compact.toOrbits(), orbits)
+        orbitsRange = compact.toOrbits(10, 20)
+        assert_frame_equal(orbitsRange.orbits, orbits.orbits.iloc[10:20].reset_index(drop=True))
+        # With float32 photometry, H and g are only approximately preserved.
+        compact = CompactOrbits(orbits)
+        self.assertEqual(compact.H.dtype, np.float32)
+        np.testing.assert_allclose(compact.toDataFrame()['H'].values, orbits.orbits['H'].values, rtol=1e-6)
+        df = compact.toDataFrame(categorical=True)
+        self.assertTrue(isinstance(df['sed_filename'].dtype, pd.CategoricalDtype))
+        np.testing.assert_array_equal(df['sed_filename'].astype(str).values,
+                                      orbits.orbits['sed_filename'].values)
+        self.assertLess(compact.memoryUsage(), orbits.orbits.memory_usage(deep=True).sum() / 2)
+        # Integer objIds (and constant columns) are compacted too.
+        orbits = Orbits()
+        orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsQ.des'))
+        compact = CompactOrbits(orbits.orbits)
+        self.assertEqual(compact.objIdCode.dtype, np.int8)
+        self.assertEqual(compact.epoch.strides, (0,))
+        assert_frame_equal(compact.toDataFrame(), orbits.orbits, check_dtype=False)
 
 if __name__ == '__main__':
     unittest.main()
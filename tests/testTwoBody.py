@@ -0,0 +1,103 @@
+from __future__ import print_function
+import unittest
+import os
+import numpy as np
+from lsst.sims.movingObjects import Orbits
+from lsst.sims.movingObjects import PyOrbEphemerides
+from lsst.sims.movingObjects import solveKepler, solveKeplerHyperbolic, orbitalStates, earthStates
+from lsst.sims.movingObjects import observerStates
+from lsst.utils import getPackageDir
+
+
+try:
+    import numexpr
+    _has_numexpr = True
+except ImportError:
+    _has_numexpr = False
+
+
+class TestKepler(unittest.TestCase):
+
+    def testSolveKepler(self):
+        e = np.array([0., 0.1, 0.5, 0.9, 0.99])[:, np.newaxis]
+        meanAnomaly = np.linspace(-10, 10, 41)[np.newaxis, :]
+        bigE = solveKepler(meanAnomaly, e)
+        np.testing.assert_allclose(bigE - e * np.sin(bigE), meanAnomaly + 0 * e, rtol=0, atol=1e-10)
+        e = np.array([1.01, 1.5, 5.])[:, np.newaxis]
+        bigF = solveKeplerHyperbolic(meanAnomaly, e)
+        np.testing.assert_allclose(e * np.sinh(bigF) - bigF, meanAnomaly + 0 * e, rtol=0, atol=1e-9)
+
+    def testOrbitalStates(self):
+        # Elliptical (KEP and COM), hyperbolic and parabolic orbits, in OpenOrb element format.
+        oorbElem = np.array([[0, 2.5, 0.1, 0.2, 1.0, 0.5, 0.3, 3, 54800, 3, 15, 0.15],
+                             [1, 1.2, 1.5, 0.4, 2.0, 1.0, 54810., 2, 54800, 3, 10, 0.15],
+                             [2, 0.8, 1.0, 0.4, 2.0, 1.0, 54810., 2, 54800, 3, 10, 0.15],
+                             [3, 0.3, 0.97, 2.4, 2.0, 1.0, 54900., 2, 54800, 3, 10, 0.15]])
+        times = np.array([54790., 54800., 54810., 55300.])
+        pos, vel = orbitalStates(oorbElem, times)
+        self.assertEqual(pos.shape, (3, len(oorbElem), len(times)))
+        # Velocities should match the change in position.
+        pos2, vel2 = orbitalStates(oorbElem, times + 1e-4)
+        np.testing.assert_allclose((pos2 - pos) / 1e-4, vel, rtol=0, atol=1e-6)
+        # Energy should be conserved, and the perihelion distance should be reached at tPeri.
+        gm = 0.01720209895**2
+        energy = np.sum(vel**2, axis=0) / 2. - gm / np.sqrt(np.sum(pos**2, axis=0))
+        np.testing.assert_allclose(energy, energy[:, :1] + 0 * energy, rtol=1e-10, atol=1e-15)
+        pos, vel = orbitalStates(oorbElem[1:], oorbElem[1:, 6][:, np.newaxis])
+        np.testing.assert_allclose(np.sqrt(np.sum(pos**2, axis=0))[:, 0], oorbElem[1:, 1], rtol=1e-10)
+
+    def testEarthStates(self):
+        # Compare against the DE405 Earth-Moon barycenter at J2000.
+        pos, vel = earthStates(np.array([51544.5]))
+        np.testing.assert_allclose(pos[0], [-0.1771, 0.8874, 0.3847], rtol=0, atol=2e-4)
+
+    def testObserverStates(self):
+        # Geocentric observer positions are the Earth positions, and are cached per time grid.
+        ephTimes = np.array([[51544.5, 3], [51545.5, 3]])
+        pos, vel = observerStates(500, ephTimes)
+        earthPos, earthVel = earthStates(ephTimes[:, 0])
+        np.testing.assert_equal(pos, earthPos)
+        np.testing.assert_equal(vel, earthVel)
+        self.assertFalse(pos.flags.writeable)
+        pos2, vel2 = observerStates('500', ephTimes.copy())
+        self.assertIs(pos2, pos)
+        pos3, vel3 = observerStates(500, ephTimes + np.array([1, 0]))
+        self.assertIsNot(pos3, pos)
+
+
+@unittest.skipIf(not _has_numexpr, "No numexpr available.")
+class TestTwoBodyEphemerides(unittest.TestCase):
+    def setUp(self):
+        self.testdir = os.path.join(getPackageDir('sims_movingObjects'), 'tests/orbits_testdata')
+        self.orbits = Orbits()
+        self.orbits.readOrbits(os.path.join(self.testdir, 'test_orbitsMBA.s3m'), skiprows=1)
+        self.ephems = PyOrbEphemerides()
+        self.ephems.setOrbits(self.orbits)
+
+    def tearDown(self):
+        del self.orbits
+        del self.ephems
+
+    def testCompareNbody(self):
+        # Close to the orbit epoch, two-body ephemerides should agree with the n-body ephemerides
+        # to within a few arcseconds for main belt asteroids.
+        times = np.arange(54800, 54810, 1.0)
+        ephs = self.ephems.generateEphemerides(times, timeScale='TAI', obscode=807, ephMode='nbody')
+        ephs2 = self.ephems.generateEphemerides(times, timeScale='TAI', obscode=807, ephMode='2body')
+        self.assertEqual(ephs.dtype.names, ephs2.dtype.names)
+        self.assertEqual(ephs.shape, ephs2.shape)
+        dRa = ((ephs['ra'] - ephs2['ra'] + 180.) % 360. - 180.) * np.cos(np.radians(ephs['dec']))
+        self.assertLess(np.abs(dRa).max() * 3600., 30.)
+        self.assertLess(np.abs(ephs['dec'] - ephs2['dec']).max() * 3600., 30.)
+        np.testing.assert_allclose(ephs['delta'], ephs2['delta'], rtol=1e-3)
+        np.testing.assert_allclose(ephs['magV'], ephs2['magV'], rtol=0, atol=0.05)
+        np.testing.assert_allclose(ephs['dradt'], ephs2['dradt'], rtol=0, atol=1e-3)
+        np.testing.assert_allclose(ephs['ddecdt'], ephs2['ddecdt'], rtol=0, atol=1e-3)
+        np.testing.assert_allclose(ephs['phase'], ephs2['phase'], rtol=0, atol=0.01)
+        np.testing.assert_allclose(ephs['solarelon'], ephs2['solarelon'], rtol=0, atol=0.01)
+        with self.assertRaises(ValueError):
+            self.ephems.generateEphemerides(times, ephMode='3body')
+
+
+if __name__ == '__main__':
+    unittest.main()